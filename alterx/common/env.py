@@ -62,3 +62,27 @@ class AlterxEnv(object):
         """Get ALTERX_GUI.
         """
         return cls.__getVar("GUI", "auto").lower()
+
+    @classmethod
+    def getStatRecord(cls):
+        """Get ALTERX_STAT_RECORD.
+        File to record the linuxcnc status stream to.
+        """
+        return cls.__getVar("STAT_RECORD")
+
+    @classmethod
+    def getStatReplay(cls):
+        """Get ALTERX_STAT_REPLAY.
+        Recorded status stream file used instead of linuxcnc status.
+        """
+        return cls.__getVar("STAT_REPLAY")
+
+    @classmethod
+    def getStatReplaySpeed(cls):
+        """Get ALTERX_STAT_REPLAY_SPEED.
+        Replay speed factor, 0 replays the next frame on every poll.
+        """
+        try:
+            return float(cls.__getVar("STAT_REPLAY_SPEED", "1.0"))
+        except ValueError:
+            return 1.0
@@ -113,13 +113,13 @@ class Notify(QLabel):
     
     def move_up(self):
         pos = get_pos(self)
-        self.move(self.rect.width()*0.1,
-                    self.rect.height()*0.05+(self.height+5)*pos)
+        self.move(int(self.rect.width()*0.1),
+                    int(self.rect.height()*0.05+(self.height+5)*pos))
 
     def move_down(self):
         count = count_messages()
-        self.move(self.rect.width()*0.1,
-                    self.rect.height()*0.05+(self.height+5)*count)
+        self.move(int(self.rect.width()*0.1),
+                    int(self.rect.height()*0.05+(self.height+5)*count))
 
     @classmethod    
     def Info(cls,msg):
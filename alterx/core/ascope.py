@@ -28,6 +28,56 @@ from alterx.common.util import *
 
 import socket
 import struct
+import threading
+
+import numpy
+
+class AScopeSession(object):
+    """Persistent connection to the ascope component.
+
+    Every request is sent as a frame with a length and an id, replies
+    come back in order with the same id, so requests can be pipelined:
+    submit several, then collect their results.
+    """
+    FRAME_HEADER = struct.Struct("=II")
+
+    def __init__(self,host,port,timeout):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.last_id = 0
+        self.replies = {}
+
+    def submit(self,packet):
+        self.last_id = (self.last_id + 1) & 0xffffffff
+        self.sock.sendall(self.FRAME_HEADER.pack(len(packet), self.last_id)
+                          + packet)
+        return self.last_id
+
+    def result(self,request_id):
+        while request_id not in self.replies:
+            length, reply_id = self.FRAME_HEADER.unpack(
+                self.recv_exact(self.FRAME_HEADER.size))
+            self.replies[reply_id] = self.recv_exact(length)
+        return self.replies.pop(request_id)
+
+    def request(self,packets):
+        """Send packets pipelined, return their replies in order."""
+        ids = [self.submit(packet) for packet in packets]
+        return [self.result(i) for i in ids]
+
+    def recv_exact(self,size):
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = self.sock.recv_into(view[received:], size - received)
+            if not n:
+                raise socket.error(_("Connection closed"))
+            received += n
+        return bytes(data)
+
+    def close(self):
+        self.sock.close()
 
 class AScope():
     HOST = '127.0.0.1'  # The server's hostname or IP address
@@ -42,6 +92,8 @@ class AScope():
     OSC_CHECK = 6
     OSC_GET = 7
     OSC_DIV = 8
+    OSC_STATES = 9
+    OSC_ROLL = 10
 
     SAMPLE_IDLE = 0
     SAMPLE_RUN = 1
@@ -49,35 +101,180 @@ class AScope():
     SAMPLE_HIGH = 3
     SAMPLE_LOW = 4
     SAMPLE_CHANGE = 5
+    SAMPLE_ROLL = 6
 
     HAL_PIN = 0
     HAL_SIG = 1
     HAL_PARAMETER = 2
+
+    # OSC_STATES request item and reply item, see state_t in ascope.h
+    STATE_REQUEST = struct.Struct("=II")
+    STATE = struct.Struct("=I8s")
+    MAX_STATES = 1024
+    # HAL type -> state value decoder
+    STATE_VALUES = {
+        1: lambda v: bool(struct.unpack("=q", v)[0]),
+        2: lambda v: struct.unpack("=d", v)[0],
+        3: lambda v: struct.unpack("=q", v)[0],
+        4: lambda v: struct.unpack("=q", v)[0],
+    }
+
+    TIMEOUT = 1.0
+
+    # shared AScopeSession, opened on first use and after errors
+    session = None
+    lock = threading.RLock()
+
+    # OSC_GET capture frame, see capture_header_t in ascope.h
+    CAPTURE_MAGIC = b"ASC1"
+    CAPTURE_HEADER = struct.Struct("=4sIIIq")
+    CHANNEL_HEADER = struct.Struct("=III")
+    # OSC_ROLL reply, roll_header_t and a capture frame
+    ROLL_HEADER = struct.Struct("=II")
+    # HAL type -> sample dtype
+    CAPTURE_TYPES = {
+        1: numpy.dtype(numpy.uint8),
+        2: numpy.dtype(numpy.float64),
+        3: numpy.dtype(numpy.int32),
+        4: numpy.dtype(numpy.uint32),
+    }
     
     @classmethod
-    def send_packet(cls,control,cmd,stype,value):
-        answer = u""
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        try:
-            s.connect((cls.HOST, cls.PORT))
-            packet = struct.pack( "lBBd" if type(value) == float else "lBBl",
-                control, cmd, stype, value )
- 
-            s.sendall(packet)
-            s.settimeout(1.0)
-            while True:
-                data = s.recv(1024)
-                answer += data.decode('utf-8')
-                if not data:
-                    break
-                    
-        except Exception as e:
-            printInfo(_("Failed to send packet: {}",e))
-        finally:
-            s.close()
-
-        return answer
+    def pack_request(cls,control,cmd,stype,value,data=b""):
+        return struct.pack( "lBBd" if type(value) == float else "lBBl",
+            control, cmd, stype, value ) + data
+
+    @classmethod
+    def send_packets(cls,requests,raw=False):
+        """Send (control, cmd, stype, value[, data]) requests pipelined
+        over the session and return their replies in the same order.
+        """
+        answers = [b""] * len(requests)
+        with cls.lock:
+            try:
+                if cls.session is None:
+                    cls.session = cls.connect()
+                answers = cls.session.request(
+                    [cls.pack_request(*r) for r in requests])
+            except Exception as e:
+                printInfo(_("Failed to send packet: {}",e))
+                cls.close()
+
+        if raw:
+            return answers
+        return [a.decode('utf-8') for a in answers]
+
+    @classmethod
+    def connect(cls):
+        """Open a new session, for users that need their own socket."""
+        return AScopeSession(cls.HOST, cls.PORT, cls.TIMEOUT)
+
+    @classmethod
+    def send_packet(cls,control,cmd,stype,value,raw=False):
+        return cls.send_packets([(control,cmd,stype,value)], raw)[0]
+
+    @classmethod
+    def get_states(cls,control,objects):
+        """Read the values of [(HAL_PIN/HAL_SIG/HAL_PARAMETER, offset), ...].
+
+        Returns [(HAL type, value), ...] in the same order, (0, None) for
+        unknown objects or when the component does not answer.
+        """
+        requests = cls.states_requests(objects)
+        return cls.decode_states(requests, cls.send_packets(
+            [(control,)+r for r in requests], raw=True))
+
+    @classmethod
+    def states_requests(cls,objects):
+        """OSC_STATES (cmd, stype, value, data) requests for get_states."""
+        requests = []
+        for first in range(0, len(objects), cls.MAX_STATES):
+            chunk = objects[first:first + cls.MAX_STATES]
+            data = b"".join(cls.STATE_REQUEST.pack(o, offset)
+                            for o, offset in chunk)
+            requests.append((cls.OSC_STATES, 0, len(chunk), data))
+        return requests
+
+    @classmethod
+    def decode_states(cls,requests,answers):
+        """Decode the raw answers to states_requests like get_states."""
+        states = []
+        for request, answer in zip(requests, answers):
+            count = request[2]
+            if len(answer) != count * cls.STATE.size:
+                states.extend([(0, None)] * count)
+                continue
+            for i in range(count):
+                stype, value = cls.STATE.unpack_from(answer, i * cls.STATE.size)
+                states.append((stype, cls.STATE_VALUES[stype](value)
+                               if stype in cls.STATE_VALUES else None))
+        return states
+
+    @classmethod
+    def get_state_text(cls,stype,value):
+        """Format a get_states value like OSC_STATE does."""
+        if value is None:
+            return ""
+        if stype == 1:
+            return "TRUE" if value else "FALSE"
+        if stype == 2:
+            return "%.7g" % value
+        if stype == 4:
+            return "%d(0x%08X)" % (value, value)
+        return "%d" % value
+
+    @classmethod
+    def close(cls):
+        with cls.lock:
+            if cls.session is not None:
+                try:
+                    cls.session.close()
+                except Exception:
+                    pass
+                cls.session = None
+
+    @classmethod
+    def decode_capture(cls,data):
+        """Decode an OSC_GET capture.
+
+        Returns (samples, thread period in ns, sample divider, {channel:
+        values}), the values of every channel are a numpy array of its
+        HAL type. Raises ValueError on a broken frame.
+        """
+        header = cls.CAPTURE_HEADER
+        if len(data) < header.size:
+            raise ValueError(_("Capture too short: {} bytes",len(data)))
+        magic, samples, channels, divider, thread = header.unpack_from(data)
+        if magic != cls.CAPTURE_MAGIC:
+            raise ValueError(_("Wrong capture magic: {}",magic))
+
+        offset = header.size
+        layout = []
+        for i in range(channels):
+            layout.append(cls.CHANNEL_HEADER.unpack_from(data, offset))
+            offset += cls.CHANNEL_HEADER.size
+
+        values = {}
+        for channel, stype, count in layout:
+            dtype = cls.CAPTURE_TYPES.get(stype)
+            if dtype is None:
+                raise ValueError(_("Wrong capture type: {}",stype))
+            values[channel] = numpy.frombuffer(data, dtype, count, offset)
+            offset += count * dtype.itemsize
+        return samples, thread, divider, values
+
+    @classmethod
+    def decode_roll(cls,data):
+        """Decode an OSC_ROLL reply.
+
+        Returns (ring position, lost values) followed by the
+        decode_capture result of the values read.
+        """
+        header = cls.ROLL_HEADER
+        if len(data) < header.size:
+            raise ValueError(_("Roll reply too short: {} bytes",len(data)))
+        position, lost = header.unpack_from(data)
+        return (position, lost) + cls.decode_capture(data[header.size:])
 
     @classmethod
     def get_type_text(cls,stype):
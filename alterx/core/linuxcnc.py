@@ -27,10 +27,17 @@ from alterx.common.locale import _
 from alterx.common.compat import *
 from alterx.common import *
 from alterx.gui.qt_bindings import *
+from alterx.core.profiler import PROFILER
+from alterx.core.recorder import StatRecorder, StatReplay
+from alterx.common.preferences import Config
 
+import atexit
 import time
 import socket
 
+from collections import OrderedDict, deque
+from threading import Thread, Event, Lock
+
 class fake_linuxcnc():
     axis = []
     joint = []
@@ -66,19 +73,177 @@ class fake_command():
         return lambda *args: None
 
 
+# Copied values of the watched fields. Other fields are copied from the
+# status source under the acquisition lock on first access and kept, so
+# they don't change during a tick. They come from the latest poll, which
+# may be newer than the one of the watched fields
+class linuxcnc_snapshot():
+    __slots__ = ('values', 'timestamp', 'source', 'fields', 'lock')
+
+    def __init__(self, values, timestamp, source, fields, lock):
+        self.values = values
+        self.timestamp = timestamp
+        self.source = source
+        self.fields = fields
+        self.lock = lock
+
+    def __getattr__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            pass
+        with self.lock:
+            value = getattr(self.source, name)
+        self.values[name] = value
+        return value
+
+    def __dir__(self):
+        return list(self.fields)
+
+
+# Background acquisition: polls linuxcnc at its own rate and publishes
+# immutable snapshots, the GUI thread only picks up the latest one
+class linuxcnc_acquire(Thread):
+    def __init__(self, stat, error):
+        Thread.__init__(self)
+        self.daemon = True
+        self.period = 0.04
+        self.stat = stat
+        self.error = error
+        self.errors = deque(maxlen=100)
+        self.stopped = Event()
+        # Held while the status source is polled or read
+        self.lock = Lock()
+        
+        self.stat.poll()
+        self.error.poll()
+
+        self.all_fields = [s for s in dir(self.stat) 
+                        if not s.startswith('_') and not callable(getattr(self.stat, s))]
+        # Fields copied into every snapshot, set by UPDATER
+        self.fields = []
+        self.snapshot = None
+        self.recorder = None
+        self.acquire()
+
+    def acquire(self):
+        error_data = self.error.poll()
+        if error_data:
+            self.errors.append(error_data)
+
+        # Unchanged fields keep the previous object, so the GUI thread
+        # detects them by identity only. A recording needs every field
+        old = self.snapshot.values if self.snapshot else {}
+        values = {}
+        with self.lock:
+            self.stat.poll()
+            for s in (self.all_fields if self.recorder else self.fields):
+                value = getattr(self.stat, s)
+                if s in old and old[s] == value:
+                    value = old[s]
+                values[s] = value
+
+        # Single reference swap, no lock is needed to publish
+        self.snapshot = linuxcnc_snapshot(values, time.time(),
+                                          self.stat, self.all_fields, self.lock)
+
+        if self.recorder:
+            self.recorder.write(values, self.snapshot.timestamp)
+
+    def run(self):
+        failed = False
+        deadline = time.time()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.acquire()
+                    failed = False
+                except Exception as e:
+                    if not failed:
+                        printError(_("Failed to poll LinuxCNC stat: '{}'", e))
+                    failed = True
+
+                deadline = max(deadline + self.period, time.time())
+                self.stopped.wait(deadline - time.time())
+        finally:
+            self.close_recorder()
+
+    def stop(self):
+        self.stopped.set()
+
+    # Stop polling at exit, the recording is closed by the thread itself
+    def shutdown(self):
+        self.stop()
+        if self.is_alive():
+            self.join(1.0)
+        else:
+            self.close_recorder()
+
+    def close_recorder(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+
+    def watch(self, fields):
+        # Single reference swap, picked up by the next acquire()
+        self.fields = list(fields)
+
+
+# GUI thread view of the linuxcnc status, poll() switches to the latest
+# snapshot so the values stay consistent during a tick
+class linuxcnc_stat():
+    def __init__(self, acquire):
+        self._acquire = acquire
+        self._snapshot = acquire.snapshot
+
+    def poll(self):
+        self._snapshot = self._acquire.snapshot
+
+    def __getattr__(self, name):
+        return getattr(self._snapshot, name)
+
+    def __dir__(self):
+        return dir(self._snapshot)
+
+
+# Position logger runs its own thread in C and needs a real status channel
+def linuxcnc_positionlogger(stat, *args):
+    if isinstance(stat, linuxcnc_stat):
+        stat = LINUXCNC.stat()
+    return LINUXCNC.positionlogger(stat, *args)
+
+
+# Recorded status stream replaces linuxcnc status when ALTERX_STAT_REPLAY is set
+def linuxcnc_source():
+    replay = AlterxEnv.getStatReplay()
+    if replay:
+        printInfo(_("Replay LinuxCNC status from: '{}'", replay))
+        return StatReplay(replay, AlterxEnv.getStatReplaySpeed())
+    return LINUXCNC.stat()
+
+
+class linuxcnc_error():
+    def __init__(self, acquire):
+        self._acquire = acquire
+
+    def poll(self):
+        try:
+            return self._acquire.errors.popleft()
+        except IndexError:
+            return None
+
+
 try:
     import linuxcnc as LINUXCNC
     import gcode as GCODE
     import hal as HAL
 
-    STAT = LINUXCNC.stat()
+    ACQUIRE = linuxcnc_acquire(linuxcnc_source(), LINUXCNC.error_channel())
+    STAT = linuxcnc_stat(ACQUIRE)
     COMMAND = LINUXCNC.command()
-    ERROR = LINUXCNC.error_channel()
-    POSLOG = LINUXCNC.positionlogger
+    ERROR = linuxcnc_error(ACQUIRE)
+    POSLOG = linuxcnc_positionlogger
     INI = LINUXCNC.ini(os.environ['INI_FILE_NAME'])
-    
-    STAT.poll()
-    ERROR.poll()
 
     from alterx.core.remote import RemoteControl
     
@@ -91,6 +256,7 @@ except Exception as e:
     printError(_("Failed to import LinuxCNC module: '{}'", e))
     
     LINUXCNC = fake_linuxcnc()
+    ACQUIRE = None
     STAT = fake_linuxcnc()
     COMMAND = fake_command()
     POSLOG = fake_position_logger()
@@ -99,11 +265,24 @@ except Exception as e:
     GCODE = fake_linuxcnc()
     HAL = None
     
-    QMessageBox.critical(None,
-            _("AlterX: Failed to import LinuxCNC"),
-            _("AlterX interface launched in recovery mode!"),
-            QMessageBox.Ok,
-            QMessageBox.Ok)
+    if AlterxEnv.getStatReplay():
+        ACQUIRE = linuxcnc_acquire(linuxcnc_source(), fake_linuxcnc())
+        STAT = linuxcnc_stat(ACQUIRE)
+        ERROR = linuxcnc_error(ACQUIRE)
+        INI = Config(os.environ.get('INI_FILE_NAME'))
+    else:
+        QMessageBox.critical(None,
+                _("AlterX: Failed to import LinuxCNC"),
+                _("AlterX interface launched in recovery mode!"),
+                QMessageBox.Ok,
+                QMessageBox.Ok)
+
+if ACQUIRE and AlterxEnv.getStatRecord():
+    printInfo(_("Record LinuxCNC status to: '{}'", AlterxEnv.getStatRecord()))
+    ACQUIRE.recorder = StatRecorder(AlterxEnv.getStatRecord())
+
+if ACQUIRE:
+    atexit.register(ACQUIRE.shutdown)
 
 
 class linuxcnc_info():
@@ -161,9 +340,21 @@ class linuxcnc_info():
         self.angular_per_units = _("min")
 
         self.display_cycle_time = float(INI.find("DISPLAY", "CYCLE_TIME") or '0.1')*1000
+        self.display_fast_cycle_time = min(self.display_cycle_time,
+            float(INI.find("DISPLAY", "FAST_CYCLE_TIME") or '0.04')*1000)
+        self.display_slow_cycle_time = max(self.display_cycle_time,
+            float(INI.find("DISPLAY", "SLOW_CYCLE_TIME") or '1.0')*1000)
+        self.display_tick_budget = float(INI.find("DISPLAY", "TICK_BUDGET") or '0.02')*1000
+        self.display_acquire_cycle_time = float(INI.find("DISPLAY", "ACQUIRE_CYCLE_TIME") or 
+            self.display_fast_cycle_time/1000)*1000
 
         self.display_path_viewer = INI.find("DISPLAY", "PATH_VIEWER") or 'VTK'
 
+        self.preview_cache_dir = os.path.expanduser(
+            INI.find("DISPLAY", "PREVIEW_CACHE_DIR") or '~/.cache/alterx/preview')
+        self.preview_cache_size = int(float(
+            INI.find("DISPLAY", "PREVIEW_CACHE_SIZE") or '512')*1024*1024)
+
         self.axes_list = "joint" if hasattr(STAT, "joint") else "axis"
 
     def get_offset_table(self):
@@ -187,19 +378,108 @@ INFO = linuxcnc_info()
 
 
 class linuxcnc_poll(QTimer):
+    NO_VALUE = object()
+
+    # Poll rate classes
+    RATE_FAST = 0       # DISPLAY/FAST_CYCLE_TIME
+    RATE_NORMAL = 1     # DISPLAY/CYCLE_TIME
+    RATE_SLOW = 2       # DISPLAY/SLOW_CYCLE_TIME
+    RATE_EVENT = 3      # only after refresh() request
+
+    # Default rate class of STAT fields, others are RATE_NORMAL
+    STAT_RATES = {
+        "joint": RATE_FAST,
+        "axis": RATE_FAST,
+        "position": RATE_FAST,
+        "actual_position": RATE_FAST,
+        "joint_position": RATE_FAST,
+        "joint_actual_position": RATE_FAST,
+        "dtg": RATE_FAST,
+        "current_vel": RATE_FAST,
+        "motion_line": RATE_FAST,
+        "current_line": RATE_FAST,
+        "tool_table": RATE_SLOW,
+        "ini_filename": RATE_SLOW,
+        "axis_mask": RATE_SLOW,
+        "cycle_time": RATE_SLOW,
+        "linear_units": RATE_SLOW,
+        "angular_units": RATE_SLOW,
+    }
+
     def __init__(self):
         QTimer.__init__(self)
         self.timeout.connect(self.run)
         self.stat_old = {}
         self._observers = {}
         self._listener = {}
+        self._stat_fields = frozenset(s for s in dir(STAT) if not s.startswith('_'))
+        self._watched = None
+        self._listened = None
+        self._rates = {}
+        self._refresh = set()
+        self._tick = 0
+        self._divider = {
+            self.RATE_FAST: 1,
+            self.RATE_NORMAL: max(1, int(round(
+                INFO.display_cycle_time/INFO.display_fast_cycle_time))),
+            self.RATE_SLOW: max(1, int(round(
+                INFO.display_slow_cycle_time/INFO.display_fast_cycle_time))),
+        }
+        self._pending = OrderedDict()
+        self._coalesced = set()
+        self._budget = INFO.display_tick_budget/1000.0
         self.custom_signals = {}
         self.custom_signals_old = {}
         
         self.add("last_error")
 
+    # Timer runs at the fast rate, slower classes are polled every N ticks.
+    # The first tick polls every subscribed field, RATE_EVENT ones included,
+    # so all handlers get an initial value
+    def start(self, msec=None):
+        if ACQUIRE and not ACQUIRE.is_alive():
+            ACQUIRE.period = INFO.display_acquire_cycle_time/1000.0
+            ACQUIRE.start()
+        self._refresh.update(self._observers)
+        QTimer.start(self, int(msec or INFO.display_fast_cycle_time))
+
+    # Subscribed STAT fields grouped by rate class, rebuilt only when
+    # the observers registry changes
+    def watched_fields(self):
+        if self._watched is None:
+            self._watched = {}
+            for s in self._observers:
+                if s in self._stat_fields and s not in self.custom_signals:
+                    self._watched.setdefault(self._rates[s], []).append(s)
+            # Only the watched fields are copied by the acquisition thread
+            if ACQUIRE:
+                ACQUIRE.watch(s for names in self._watched.values() for s in names)
+        return self._watched
+
+    # Custom listeners grouped by rate class
+    def listened_items(self):
+        if self._listened is None:
+            self._listened = {}
+            for name in self._listener:
+                self._listened.setdefault(self._rates[name], []).append(name)
+        return self._listened
+
+    # Names of the given group which must be polled at this tick
+    def due(self, groups):
+        names = []
+        for rate in groups:
+            if rate in self._divider and self._tick % self._divider[rate] == 0:
+                names.extend(groups[rate])
+        if self._refresh:
+            due = set(names)
+            for rate in groups:
+                names.extend(n for n in groups[rate]
+                                if n in self._refresh and n not in due)
+        return names
+
     # 'One to many' item check
     def run(self):
+        start = time.time()
         try:
             STAT.poll()
             error_data = ERROR.poll()
@@ -217,32 +497,60 @@ class linuxcnc_poll(QTimer):
                 printInfo(text)
                 Notify.Info(text)
 
-        for s in dir(STAT):
-            if not s.startswith('_'):
-                if s not in self.stat_old or self.stat_old[s] != getattr(STAT, s):
-                    self.stat_old[s] = getattr(STAT, s)
-                    if s in self._observers:
-                        for h in self._observers[s]:
-                            try:
-                                h(self.stat_old[s])
-                            except Exception as e:
-                                printError(
-                                    _("Failed to execute '{}' handler {}: '{}'", s, h, e))
-
-		for name in self._listener:
-			self.custom_signals[name] = self._listener[name]()
+        fields = self.due(self.watched_fields())
+        listeners = self.due(self.listened_items())
+        self._refresh.clear()
+        self._tick += 1
+
+        for s in fields:
+            value = getattr(STAT, s)
+            old = self.stat_old.get(s, self.NO_VALUE)
+            # Identity check first, deep compare of 'joint', 'tool_table' etc.
+            # only when the status source handed out a new object
+            if value is old or value == old:
+                continue
+
+            self.stat_old[s] = value
+            self.notify(s, value)
+
+        for name in listeners:
+            self.custom_signals[name] = self._listener[name]()
 
         for name in self.custom_signals:
             if ( self.custom_signals[name] != self.custom_signals_old[name] and 
                 name in self._observers ):
                 self.custom_signals_old[name] = self.custom_signals[name]
-
-                for h in self._observers[name]:
-                    try:
-                        h(self.custom_signals_old[name])
-                    except Exception as e:
-                        printError(
-                            _("Failed to execute '{}' handler {}: '{}'", name, h, e))
+                self.notify(name, self.custom_signals_old[name])
+
+        self.dispatch()
+        PROFILER.tick(time.time() - start, self.interval()/1000.0)
+
+    # Queue handlers of the changed item. A handler changed several times
+    # before it was called keeps its place in the queue and gets the latest
+    # value only. A handler of several items is called once per item,
+    # unless it was subscribed with coalesce, then it is called once
+    def notify(self, name, value):
+        for h in self._observers[name]:
+            key = h if h in self._coalesced else (h, name)
+            self._pending[key] = (h, name, value)
+
+    # Call queued handlers until the tick budget is spent,
+    # the rest is deferred to the next tick
+    def dispatch(self):
+        start = time.time()
+        while self._pending:
+            h, name, value = self._pending.popitem(last=False)[1]
+            called = time.time()
+            try:
+                h(value)
+            except Exception as e:
+                printError(
+                    _("Failed to execute '{}' handler {}: '{}'", name, h, e))
+
+            now = time.time()
+            PROFILER.record(name, h, now - called)
+            if now - start > self._budget:
+                break
 
     # 'Many to one' item check
     def check(self, name):
@@ -256,7 +564,7 @@ class linuxcnc_poll(QTimer):
     def value(self, name):
         if name in self.custom_signals:
             return self.custom_signals[name]
-        elif name in dir(STAT):
+        elif name in self._stat_fields:
             return getattr(STAT, name)
         return False
 
@@ -271,12 +579,19 @@ class linuxcnc_poll(QTimer):
         else:
             printError(_("Failed to emit signal. Signal '{}' no exist", name))
 
+    # Request update of the item at next tick regardless of its rate class
+    def refresh(self, name):
+        self._refresh.add(name)
+
     # Create custom listener in database
-    def listen(self, name, method):
+    def listen(self, name, method, rate=RATE_NORMAL):
         if name not in self._listener:
             self._listener[name] = method
+            self._rates[name] = rate
+            self._listened = None
             self.custom_signals[name] = method()
             self.custom_signals_old[name] = method()
+            self._watched = None
         else:
             printError(_("Failed to add listener. Listener '{}' already exist", name))
 
@@ -285,6 +600,7 @@ class linuxcnc_poll(QTimer):
         if name not in self.custom_signals:
             self.custom_signals[name] = value
             self.custom_signals_old[name] = value
+            self._watched = None
         else:
             printError(_("Failed to add signal. Signal '{}' already exist", name))
 
@@ -296,12 +612,38 @@ class linuxcnc_poll(QTimer):
         else:
             printError(_("Failed to set signal. Signal '{}' doesn't exist", name))
 
-    # Add signal to 'one to many' database
-    def signal(self, name, handler):
+    # Add signal to 'one to many' database, the item is polled at
+    # the fastest rate class requested by its subscribers. A coalesce
+    # handler ignores the value and is called at most once per tick,
+    # whatever number of its items changed
+    def signal(self, name, handler, rate=None, coalesce=False):
+        if rate is None:
+            rate = self.STAT_RATES.get(name, self.RATE_NORMAL)
+        if name not in self._listener and rate < self._rates.get(name, self.RATE_EVENT+1):
+            self._rates[name] = rate
+            self._watched = None
+
+        if coalesce:
+            self._coalesced.add(handler)
+
         if name in self._observers:
             self._observers[name].append(handler)
         else:
             self._observers[name] = [handler]
+            self._watched = None
+
+    # Drop every subscription and the last seen values, custom signals
+    # and listeners are kept
+    def reset(self):
+        self._observers = {}
+        self._coalesced = set()
+        self._pending.clear()
+        self._refresh.clear()
+        self._rates = dict((name, rate) for name, rate in self._rates.items()
+                            if name in self._listener)
+        self._watched = None
+        self._tick = 0
+        self.stat_old = {}
 
     def __getattr__(self, name):
         try:
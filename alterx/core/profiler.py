@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - updater profiler
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['PROFILER']
+
+from alterx.common.compat import *
+
+import functools
+
+
+def handler_name(handler):
+    if isinstance(handler, functools.partial):
+        return handler_name(handler.func)
+
+    owner = getattr(handler, "__self__", None)
+    if owner is not None:
+        return "{}.{}.{}".format(type(owner).__module__, 
+            type(owner).__name__, handler.__name__)
+
+    code = getattr(handler, "__code__", None)
+    if code is not None and handler.__name__ == "<lambda>":
+        return "{}:{}".format(getattr(handler, "__module__", None) or 
+            os.path.basename(code.co_filename), code.co_firstlineno)
+
+    return "{}.{}".format(getattr(handler, "__module__", ""), 
+        getattr(handler, "__name__", repr(handler)))
+
+
+class updater_profiler():
+    CALLS = 0
+    TOTAL = 1
+    MAX = 2
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.handlers = {}
+        self.ticks = [0, 0.0, 0.0]
+        self.overruns = 0
+
+    def record(self, name, handler, duration):
+        key = (name, handler)
+        item = self.handlers.get(key)
+        if item is None:
+            item = self.handlers[key] = [0, 0.0, 0.0]
+        item[self.CALLS] += 1
+        item[self.TOTAL] += duration
+        if duration > item[self.MAX]:
+            item[self.MAX] = duration
+
+    def tick(self, duration, period):
+        self.ticks[self.CALLS] += 1
+        self.ticks[self.TOTAL] += duration
+        if duration > self.ticks[self.MAX]:
+            self.ticks[self.MAX] = duration
+        if duration > period:
+            self.overruns += 1
+
+    # Rows (signal, handler, calls, total, max) sorted by total time
+    def stats(self):
+        rows = [(name, handler_name(h), v[self.CALLS], v[self.TOTAL], v[self.MAX])
+                    for (name, h), v in self.handlers.items()]
+        return sorted(rows, key=lambda r: r[3], reverse=True)
+
+    def dump(self):
+        calls, total, maximum = self.ticks
+        lines = ["ticks: {} mean: {:.3f} ms max: {:.3f} ms overruns: {}".format(
+            calls, total/calls*1000 if calls else 0, maximum*1000, self.overruns)]
+        lines.append("{:<24} {:<64} {:>8} {:>12} {:>10}".format(
+            "signal", "handler", "calls", "total ms", "max ms"))
+        for name, handler, calls, total, maximum in self.stats():
+            lines.append("{:<24} {:<64} {:>8} {:>12.3f} {:>10.3f}".format(
+                name, handler, calls, total*1000, maximum*1000))
+        return "\n".join(lines)+"\n"
+
+PROFILER = updater_profiler()
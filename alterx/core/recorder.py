@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - status recorder
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ["StatRecorder", "StatReplay"]
+
+from alterx.common.locale import _
+from alterx.common.compat import *
+from alterx.common.util import *
+
+import pickle
+import struct
+import time
+import zlib
+
+
+# Status stream file:
+#   MAGIC
+#   frame: <double timestamp><uint32 size><zlib(pickle(changed fields))>
+# The first frame holds all fields, the next ones only the changed fields
+MAGIC = b"AXSTAT\x01\n"
+FRAME = struct.Struct("<dI")
+
+
+class stat_record(tuple):
+    # Picklable copy of linuxcnc structure sequences (tool_result, etc.)
+    def __new__(cls, values, names):
+        self = tuple.__new__(cls, values)
+        self._names = names
+        return self
+
+    def __getattr__(self, name):
+        try:
+            return self[self.__dict__.get("_names", {})[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        return list(self._names)
+
+    def __reduce__(self):
+        return (stat_record, (tuple(self), self._names))
+
+
+def freeze(value):
+    if type(value) in (tuple, list):
+        return tuple(freeze(v) for v in value)
+    elif isinstance(value, dict):
+        return dict((k, freeze(v)) for k, v in value.items())
+    elif isinstance(value, tuple):
+        names = {}
+        for n in dir(value):
+            if n.startswith('_') or n.startswith('n_'):
+                continue
+            v = getattr(value, n)
+            for i, item in enumerate(value):
+                if item is v:
+                    names[n] = i
+                    break
+        return stat_record(tuple(freeze(v) for v in value), names)
+    return value
+
+
+class StatRecorder():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.last = {}
+
+    # Unchanged fields of acquisition snapshots are the very same objects,
+    # so the delta is found by identity
+    def write(self, values, timestamp=None):
+        delta = dict((k, freeze(v)) for k, v in values.items()
+                        if k not in self.last or self.last[k] is not v)
+        self.last = dict(values)
+
+        data = zlib.compress(pickle.dumps(delta, 2))
+        self.file.write(FRAME.pack(timestamp or time.time(), len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+class StatReplay():
+    # speed: 1.0 recorded speed, >1.0 accelerated, 0 next frame on every poll
+    def __init__(self, path, speed=1.0, loop=True):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.frames = []
+
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(_("Invalid status stream file: {}", path))
+            while True:
+                header = f.read(FRAME.size)
+                if len(header) < FRAME.size:
+                    break
+                timestamp, size = FRAME.unpack(header)
+                data = f.read(size)
+                # last frame of a recorder killed during the write
+                if len(data) < size:
+                    break
+                self.frames.append((timestamp, data))
+
+        if not self.frames:
+            raise ValueError(_("Empty status stream file: {}", path))
+
+        self.rewind()
+
+    def rewind(self):
+        self.index = 0
+        self.started = None
+        self.values = {}
+        self.apply()
+
+    def apply(self):
+        self.values.update(pickle.loads(zlib.decompress(self.frames[self.index][1])))
+
+    def poll(self):
+        if self.index + 1 >= len(self.frames):
+            if not self.loop:
+                return
+            self.rewind()
+
+        if self.speed <= 0:
+            self.index += 1
+            self.apply()
+            return
+
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        target = self.frames[0][0] + (now - self.started)*self.speed
+        while (self.index + 1 < len(self.frames) and 
+                self.frames[self.index + 1][0] <= target):
+            self.index += 1
+            self.apply()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["values"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        return list(self.values)
@@ -26,6 +26,7 @@ from alterx.common.locale import _
 from alterx.common.compat import *
 from alterx.common.util import *
 from alterx.gui.qt_bindings import *
+from alterx.core.profiler import PROFILER
 
 import socket
 import subprocess
@@ -57,6 +58,10 @@ class RemoteControl(QObject):
             except Exception as e:
                 printInfo(_("Failed to execute cmd: {}",e))
                 data = e.output
+        elif "profiler" in msg:
+            if "reset" in msg:
+                PROFILER.reset()
+            data = PROFILER.dump()
                 
         self.client.write(data)
         self.client.close()
@@ -59,19 +59,22 @@ class DROLayout(QHBoxLayout):
         v1.addLayout(h1)
 
         self.addLayout(v1, 12)
-        UPDATER.signal(INFO.axes_list, lambda axis: self.update_position(axis[num]))
+        # One handler for all position sources, it is called once per tick
+        for signal in (INFO.axes_list, "g5x_offset", "g92_offset", 
+                        "tool_offset", "update_feed_labels"):
+            UPDATER.signal(signal, self.refresh, coalesce=True)
+
         if name == 'X' and INFO.machine_is_lathe:
-            UPDATER.signal("diameter_multiplier",
-                            lambda m: self.diameter_mode(m, num, name))
-                            
-        UPDATER.signal("update_feed_labels", 
-            lambda stat: self.update_position(getattr(STAT,INFO.axes_list)[num]))
+            UPDATER.signal("diameter_multiplier", self.diameter_mode)
 
     def diameter_mode(self, data):
-        self.update_position(getattr(STAT,INFO.axes_list)[self.num])
+        self.refresh()
         self.drolabel_name.setText("{}{}".format(
             self.name, ['', 'R', 'D'][UPDATER.diameter_multiplier]))
 
+    def refresh(self, data=None):
+        self.update_position(getattr(STAT,INFO.axes_list)[self.num])
+
     def update_position(self, stat):
         if self.drolabel_act.visibleRegion().isEmpty():
             return
@@ -227,9 +227,16 @@ class GcodeWidget(QWidget):
         self.progress.setObjectName("lbl_gwidget_progress")
         hlay.addWidget(self.progress)
 
+        # run time estimate of the path viewer, the breakdown in the tooltip
+        self.run_time = QLabel(_("Run time: "))
+        self.run_time.setObjectName("lbl_gwidget_run_time")
+        vlay.addWidget(self.run_time)
+
         self.editor.emit_percent = self.emit_percent
         self.editor.emit_file = self.emit_file
 
+        UPDATER.signal("gcode_properties", self.program_properties)
+
     def emit_percent(self, percent):
         self.progress.setText(_('Progress: {:2.2f}%', percent))
 
@@ -237,6 +244,21 @@ class GcodeWidget(QWidget):
         self.filename.setText(_('Filename: {}', fn))
         self.lines.setText(_('Lines: {}', ln))
 
+    def program_properties(self, props):
+        if not isinstance(props, dict) or 'Run_accel' not in props:
+            self.run_time.setText(_("Run time: "))
+            self.run_time.setToolTip("")
+            return
+
+        self.run_time.setText(_("Run time: {}", props['Run_accel']))
+        details = [_("Feed rate only: {}", props['Run']),
+                   _("Exact stop: {}", props['Run_exact_stop'])]
+        if 'Run_max_override' in props:
+            details.append(_("Max feed override: {}", props['Run_max_override']))
+        details.extend([_("Tools:"), props['Run_tools'],
+                        _("Slowest lines:"), props['Run_lines']])
+        self.run_time.setToolTip("\n".join(details))
+
 
 class GcodeEditor(QWidget):
     def __init__(self, parent=None):
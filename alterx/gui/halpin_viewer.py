@@ -31,10 +31,13 @@ from alterx.gui.util import *
 from alterx.core.ascope import AScope as osc
 from alterx.core.remote import RemoteControl as remote
 
+from collections import deque
 from functools import partial
 
+import numpy
 import pyqtgraph
 import re
+import threading
 
 option_list = [
     "SCALE_GAIN",
@@ -71,6 +74,155 @@ class ReceiveThread(QThread):
             self.message.emit(data)
 
 
+class ScopeThread(QThread):
+    """Oscilloscope acquisition, off the GUI thread.
+
+    Keeps its own ascope session, polls the capture state or drains the
+    roll ring and emits the decoded numpy buffers, so a slow or missing
+    component never blocks the GUI. The commands of the GUI are queued
+    with send() and sent over the same session.
+    """
+    status = pyqtSignal(int)
+    capture = pyqtSignal(object)
+    chunk = pyqtSignal(object)
+    reply = pyqtSignal(object)
+
+    def __init__(self,interval=100,roll_interval=50):
+        QThread.__init__(self, parent=None)
+        self.control = 0
+        self.interval = interval
+        self.roll_interval = roll_interval
+        self.session = None
+        self.running = True
+        #Set by the GUI
+        self.active = False
+        self.roll = False
+        self.rearm = None
+        self.position = 0
+        #Counted up by the GUI, consumed by send_commands
+        self.roll_reset = 0
+        self.roll_done = 0
+        #(requests, done, raw, roll) queued by send
+        self.commands = deque()
+        self.wake = threading.Event()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def send(self,requests,done=None,raw=False,roll=None):
+        """Queue (cmd, stype, value[, data]) requests for the component.
+
+        The answers are handed to done(answers) on the GUI thread, b"" for
+        every request when the component does not answer. roll is the roll
+        started by the requests, the ring is read from its start after them.
+        """
+        self.commands.append((requests, done, raw, roll))
+        self.wake.set()
+
+    def start_roll(self,requests):
+        #The ring is restarted by OSC_RUN in requests, read_roll waits for
+        #them and drops a read of the old ring in flight
+        self.roll_reset += 1
+        self.roll = True
+        self.send(requests, roll=self.roll_reset)
+
+    def stop_roll(self):
+        self.roll = False
+
+    def run(self):
+        while self.running:
+            self.wake.clear()
+            self.send_commands()
+            interval = self.roll_interval if self.roll else self.interval
+            if self.active:
+                try:
+                    if self.session is None:
+                        self.session = osc.connect()
+                    if self.roll:
+                        self.read_roll()
+                    else:
+                        self.read_capture()
+                except Exception as e:
+                    printDebug(_("Oscilloscope read failed: {}",e))
+                    self.close()
+                    interval = 1000
+            self.wake.wait(interval/1000)
+        self.close()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def request(self,*requests):
+        return self.session.request(
+            [osc.pack_request(self.control,*r) for r in requests])
+
+    def send_commands(self):
+        while self.commands:
+            requests, done, raw, roll = self.commands.popleft()
+            answers = [b""] * len(requests)
+            try:
+                if self.session is None:
+                    self.session = osc.connect()
+                answers = self.request(*requests)
+            except Exception as e:
+                printInfo(_("Failed to send packet: {}",e))
+                self.close()
+
+            if roll is not None:
+                #A position before the run is moved to its start by the
+                #component
+                self.roll_done = roll
+                self.position = 0
+            if done is not None:
+                if not raw:
+                    answers = [a.decode('utf-8') for a in answers]
+                self.reply.emit(partial(done, answers))
+
+    def read_capture(self):
+        data = self.request((osc.OSC_CHECK,0,0))[0]
+        if not data:
+            return
+
+        answer = int(data[:-1])
+        self.status.emit(answer)
+        if answer != osc.SAMPLE_COMPLETE:
+            return
+
+        #Fetch the capture and re-arm or stop in one round trip
+        rearm = self.rearm
+        data = self.request((osc.OSC_GET,0,0),
+            (osc.OSC_RUN,)+rearm if rearm else (osc.OSC_STOP,0,0))[0]
+        try:
+            self.capture.emit(osc.decode_capture(data))
+        except ValueError as e:
+            printInfo(_("Failed to decode capture: {}",e))
+
+    def read_roll(self):
+        reset = self.roll_reset
+        if reset != self.roll_done:
+            #OSC_RUN is still queued
+            return
+
+        data = self.request((osc.OSC_ROLL,0,self.position))[0]
+        if not data or reset != self.roll_reset:
+            return
+
+        try:
+            (position, lost, samples, thread, divider,
+                values) = osc.decode_roll(data)
+        except ValueError as e:
+            printInfo(_("Failed to decode roll data: {}",e))
+            return
+
+        self.position = position
+        self.status.emit(osc.SAMPLE_ROLL)
+        if samples or lost:
+            self.chunk.emit((lost, thread, divider, values))
+
+
 class HalPinWidget(QWidget):
     def __init__(self, parent=None):
         QWidget.__init__(self, parent)
@@ -244,6 +396,11 @@ class HalPinWidget(QWidget):
         self.trig_low.trig = osc.SAMPLE_LOW
         self.trig_low.toggled.connect(self.osc_trig_changed)
         triglay.addWidget(self.trig_low)
+        self.trig_roll = QRadioButton()
+        self.trig_roll.setText(_("Roll"))
+        self.trig_roll.trig = osc.SAMPLE_ROLL
+        self.trig_roll.toggled.connect(self.osc_trig_changed)
+        triglay.addWidget(self.trig_roll)
         trigwidget.setLayout(triglay)
         controllay.addWidget(trigwidget)
         
@@ -274,6 +431,16 @@ class HalPinWidget(QWidget):
         
         controllay.addWidget(HSeparator())
 
+        controllay.addWidget(QLabel(_("Roll history, s:")))
+        self.history_edit = QSpinBox()
+        self.history_edit.setMaximum(3600)
+        self.history_edit.setMinimum(1)
+        self.history_edit.setValue(60)
+        controllay.addWidget(self.history_edit)
+        self.roll_names = []
+        
+        controllay.addWidget(HSeparator())
+
         self.info_label = QLabel()
         controllay.addWidget(self.info_label)
 
@@ -366,6 +533,12 @@ class HalPinWidget(QWidget):
         except:
             self.preset_dir = None
 
+        try:
+            self.history_edit.setValue(
+                self.config.getint("DISPLAY","OSC_ROLL_HISTORY"))
+        except:
+            pass
+
         try:
             for f in os.listdir(self.preset_dir):
                 if f.lower().endswith('.ops'):
@@ -373,6 +546,14 @@ class HalPinWidget(QWidget):
         except:
             pass
        
+        self.scope = ScopeThread()
+        self.scope.status.connect(self.scope_status)
+        self.scope.capture.connect(self.plot_update_data)
+        self.scope.chunk.connect(self.roll_update_data)
+        self.scope.reply.connect(self.scope_reply)
+        self.states_pending = False
+        self.update_rearm()
+
         self.clear_plot()
         self.load_data()
         
@@ -380,9 +561,13 @@ class HalPinWidget(QWidget):
         timer_viewer.timeout.connect(self.update_watched_list)
         timer_viewer.start(1000)
         
+        self.scope.start()
+
         timer_osc = QTimer(self)
-        timer_osc.timeout.connect(self.plot_update_data)
-        timer_osc.start(1000)
+        timer_osc.timeout.connect(self.update_scope_active)
+        timer_osc.start(500)
+
+        QApplication.instance().aboutToQuit.connect(self.stop_scope)
 
     def load_pid_config(self):
         if self.pid_joint_tabs.count() > 0:
@@ -565,6 +750,8 @@ class HalPinWidget(QWidget):
                             self.trig_high.setChecked(True)
                         if int(params[5]) == osc.SAMPLE_LOW:
                             self.trig_low.setChecked(True)
+                        if int(params[5]) == osc.SAMPLE_ROLL:
+                            self.trig_roll.setChecked(True)
                         
                         self.trig_combo.setCurrentIndex(int(params[6]))
                         
@@ -612,7 +799,7 @@ class HalPinWidget(QWidget):
     def divider_value_changed(self):
         try:
             div = self.div_edit.value()-1
-            osc.send_packet(self.control,osc.OSC_DIV,div,0)
+            self.scope.send([(osc.OSC_DIV,div,0)])
         except:
             pass
 		
@@ -621,6 +808,7 @@ class HalPinWidget(QWidget):
             self.tLine.setPos(float(self.trig_edit.text()))
         except:
             pass
+        self.update_rearm()
 
     def trigger_changed(self,i):
         name = self.trig_combo.itemData(i, role=Qt.DisplayRole)
@@ -628,7 +816,7 @@ class HalPinWidget(QWidget):
             stype = self.trig_combo.itemData(i, role=Qt.UserRole + 1)
             addr = self.trig_combo.itemData(i, role=Qt.UserRole + 2)
             
-            osc.send_packet(self.control,osc.OSC_TRIG,stype,addr)
+            self.scope.send([(osc.OSC_TRIG,stype,addr)])
             if len(self.plots) > i+1 and i>=0:
                 self.plots[i+1].addItem(self.hLine)
                 self.plots[i+1].addItem(self.tLine)
@@ -636,22 +824,120 @@ class HalPinWidget(QWidget):
     def on_oscrun_clicked(self):
         try:
             t = self.trig_edit.text()
-            osc.send_packet(self.control,osc.OSC_RUN,self.trigger_mode, float(t) if t else 0 )
+            run = [(osc.OSC_RUN,self.trigger_mode, float(t) if t else 0 )]
         except Exception as e:
             printInfo(_("Failed to send run cmd: {}",e))
+            return
+
+        if self.trigger_mode == osc.SAMPLE_ROLL:
+            self.start_roll(run)
+        else:
+            self.scope.stop_roll()
+            self.scope.send(run)
         
     def on_oscstop_clicked(self):
-        osc.send_packet(self.control,osc.OSC_STOP,0,0)
+        self.scope.stop_roll()
+        self.scope.send([(osc.OSC_STOP,0,0)])
+
+    def scope_reply(self,done):
+        #Answers of the commands sent with scope.send
+        done()
+
+    def update_rearm(self):
+        #Sent by the scope thread after a complete capture
+        try:
+            t = self.trig_edit.text()
+            value = float(t) if t else 0
+        except ValueError:
+            value = 0
+
+        if self.shot_mode or self.trigger_mode == osc.SAMPLE_ROLL:
+            self.scope.rearm = None
+        else:
+            self.scope.rearm = (self.trigger_mode, value)
+
+    def update_scope_active(self):
+        self.scope.active = not self.trig_edit.visibleRegion().isEmpty()
+
+    def stop_scope(self):
+        self.scope.stop()
+        self.scope.wait()
+
+    def scope_status(self,answer):
+        status = {
+            osc.SAMPLE_COMPLETE: _("Complete"),
+            osc.SAMPLE_RUN: _("Reading"),
+            osc.SAMPLE_IDLE: _("Idle"),
+            osc.SAMPLE_CHANGE: _("Waiting"),
+            osc.SAMPLE_HIGH: _("Waiting"),
+            osc.SAMPLE_LOW: _("Waiting"),
+            osc.SAMPLE_ROLL: _("Rolling"),
+        }
+        if answer in status:
+            self.osc_status.setText(status[answer])
+
+    def start_roll(self,run):
+        self.clear_plot()
+
+        names = [self.watched_list.item(r,1).text()
+                    for r in range(self.watched_list.rowCount())
+                        if self.watched_list.item(r,0).checkState()]
+        if not names:
+            self.scope.send(run)
+            return
+
+        self.ensure_plot(names)
+        for name in names:
+            self.data[name] = [numpy.zeros(0), numpy.zeros(0)]
+
+        self.roll_names = names
+        self.scope.start_roll(run)
+
+    def stop_roll(self):
+        #The channels and curves of the roll are gone with the plot
+        self.roll_names = []
+        self.scope.stop_roll()
+
+    def roll_update_data(self,chunk):
+        lost, thread, divider, values = chunk
+        if not thread or not divider or not self.roll_names:
+            return
+
+        #Keep the last history seconds of every channel, newest at the right
+        period = thread*divider/1000000000
+        history = max(1, int(self.history_edit.value()/period))
+        for channel,name in enumerate(self.roll_names):
+            value = values.get(channel)
+            if (value is None or not len(value) or name not in self.data
+                    or channel >= len(self.curves)):
+                continue
+            value = numpy.concatenate((self.data[name][1],
+                                        value.astype(float)))[-history:]
+            self.data[name] = [numpy.arange(len(value)), value]
+            self.curves[channel].setData(value)
+
+        if not self.data:
+            return
+        count = max(len(d[1]) for d in self.data.values())
+        step = max(1, count//10)
+        index_x = numpy.arange(count-1, -1, -step)
+        label_x = (index_x-count+1)*period
+        self.axis_x.setTicks([[ (i,"{:.1f}".format(l)) 
+                    for i,l in zip(index_x.tolist(), label_x.tolist()) ]])
+
+        self.info_label.setText("T:{:.2f}ms L:{}".format(period*1000,lost))
 
     def osc_trig_changed(self):
         rb = self.sender()
         if rb.isChecked():
             self.trigger_mode = rb.trig
+            self.update_rearm()
         
     def osc_mode_changed(self):
         rb = self.sender()
         if rb.isChecked():
             self.shot_mode = rb.mode
+            self.update_rearm()
 
     def eventFilter(self, source, event):
         if ( event.type() == QEvent.KeyPress and
@@ -727,118 +1013,80 @@ class HalPinWidget(QWidget):
             
         return QWidget.eventFilter(self, source, event)
 
-    def plot_update_data(self):
-        if not self.trig_edit.visibleRegion().isEmpty():
-            #Check (Check,0,0)
-            data = osc.send_packet(self.control,osc.OSC_CHECK,0,0)
-            
-            if not data:
-                return
-            
-            answer = int(data[:-1])
-            
-            if answer  == osc.SAMPLE_COMPLETE:
-                self.osc_status.setText(_("Complete"))
-                data = osc.send_packet(self.control,osc.OSC_GET,0,0)
-                if self.shot_mode:
-                    self.on_oscstop_clicked()
-                else:
-                    self.on_oscrun_clicked()
-            elif answer  == osc.SAMPLE_RUN:
-                self.osc_status.setText(_("Reading"))
-                return
-            elif answer  == osc.SAMPLE_IDLE:
-                self.osc_status.setText(_("Idle"))
-                return
-            elif answer in (osc.SAMPLE_CHANGE,osc.SAMPLE_HIGH,osc.SAMPLE_LOW):
-                self.osc_status.setText(_("Waiting"))
-                return
-            else:
-                return
-                
-            if not data:
-                return
-
-            self.clear_plot()
-
-            color =  ['blue', 'green', 'red', 'orange', 'violet', 'brown',
-                        'gray', 'white']
-            lineStyle = [Qt.SolidLine,Qt.DashLine,Qt.DotLine,Qt.DashDotLine,
-                        Qt.DashDotDotLine,Qt.SolidLine,Qt.SolidLine]
-                   
-            watchedlist = []
-            for r in range(self.watched_list.rowCount()):
-                if self.watched_list.item(r,0).checkState():
-                    name = self.watched_list.item(r,1).text()
-                    watchedlist.append(name)
-                    self.data[name]=[[],[]]
+    def plot_update_data(self,capture):
+        samples, thread, divider, values = capture
 
-            data = data.split('\n')
-            samples = 0
-            thread = 0
+        watchedlist = []
+        for r in range(self.watched_list.rowCount()):
+            if self.watched_list.item(r,0).checkState():
+                name = self.watched_list.item(r,1).text()
+                watchedlist.append(name)
 
-            if "Samples" in data[0]:
-                s = data[0].split(' ')
-                samples = int(s[1])
-                thread = int(s[3])
+        self.ensure_plot(watchedlist)
+        if not watchedlist:
+            return
 
-            data = data[1:]
+        for channel,name in enumerate(watchedlist):
+            value = values.get(channel, numpy.zeros(0)).astype(float)
+            self.data[name] = [numpy.arange(len(value)), value]
+            self.curves[channel].setData(value)
             
-            for i,d in enumerate(data):
-                s = d.split(' ')
-                if len(s) == 2:
-                    channel = s[0]
-                    value = s[1]
-                else:
-                    continue
-                l = len(self.data[watchedlist[int(channel)]][0])
-                self.data[watchedlist[int(channel)]][0].append( l )
-                self.data[watchedlist[int(channel)]][1].append( float( value ) ) 
-                
-            self.info_label.setText("S:{} T:{:.2f}ms".format(samples/len(watchedlist),   
-                                                            (thread/1000000)*self.div_edit.value() ) )                  
-            index_x = []
-            label_x = []
-            for i,l in enumerate( self.data[ watchedlist[0] ][0] ):
-                index_x.append(i)
-                label_x.append(l*thread/1000000 )
-            label = list( zip( index_x, label_x ) )
-            ticks = [ label[::100], label ]
-            self.axis_x.setTicks(ticks)
-
-            osc_list = [(self.watched_list.item(r,7),self.watched_list.item(r,8)) \
-                        for r in range(self.watched_list.rowCount()) \
-                            if self.watched_list.item(r,0).checkState()]
-
-            for i,key in enumerate(self.data):
-                axis = pyqtgraph.AxisItem('right')
-                axis.tickFont = QFont("Helvetica",pointSize = 13,weight = 1,
-                                            italic = False)
-                       
-                view = pyqtgraph.ViewBox()
-                self.plots[0].layout.addItem(axis,2, i+3)
-                self.plots[0].scene().addItem(view)
-                axis.linkToView(view)
-                
-                if osc_list[i][0] and osc_list[i][1]:
-                    min = float(osc_list[i][0].text())
-                    max = float(osc_list[i][1].text())
-                    view.setRange(yRange=(min,max),padding=0)
-                                
-                view.setXLink(self.plots[0])
-                self.plots.append(view)
-                axis.setLabel(key,**{'color': color[i], 'font-size': '16pt'})
-                pen = pyqtgraph.mkPen(QColor(color[i]), width=2, 
-                                        style=lineStyle[i])
-                curve = pyqtgraph.PlotCurveItem(self.data[key][1], pen=pen)
-                view.addItem(curve)        
+        self.info_label.setText("S:{} T:{:.2f}ms".format(samples/len(watchedlist),   
+                                                        (thread/1000000)*self.div_edit.value() ) )                  
+        index_x = self.data[ watchedlist[0] ][0]
+        label_x = index_x*thread/1000000
+        label = list( zip( index_x.tolist(), label_x.tolist() ) )
+        ticks = [ label[::100], label ]
+        self.axis_x.setTicks(ticks)
+
+    def ensure_plot(self,names):
+        #Axes, views and curves are kept while the channels stay the same
+        if names != self.plot_names:
+            self.clear_plot()
+            self.build_plot(names)
+            self.plot_names = names
+
+    def build_plot(self,names):
+        #One axis, view and curve per channel
+        color =  ['blue', 'green', 'red', 'orange', 'violet', 'brown',
+                    'gray', 'white']
+        lineStyle = [Qt.SolidLine,Qt.DashLine,Qt.DotLine,Qt.DashDotLine,
+                    Qt.DashDotDotLine,Qt.SolidLine,Qt.SolidLine]
+
+        osc_list = [(self.watched_list.item(r,7),self.watched_list.item(r,8)) \
+                    for r in range(self.watched_list.rowCount()) \
+                        if self.watched_list.item(r,0).checkState()]
+
+        for i,key in enumerate(names):
+            axis = pyqtgraph.AxisItem('right')
+            axis.tickFont = QFont("Helvetica",pointSize = 13,weight = 1,
+                                        italic = False)
+                   
+            view = pyqtgraph.ViewBox()
+            self.plots[0].layout.addItem(axis,2, i+3)
+            self.plots[0].scene().addItem(view)
+            axis.linkToView(view)
+            
+            if osc_list[i][0] and osc_list[i][1]:
+                min = float(osc_list[i][0].text())
+                max = float(osc_list[i][1].text())
+                view.setRange(yRange=(min,max),padding=0)
+                            
+            view.setXLink(self.plots[0])
+            self.plots.append(view)
+            axis.setLabel(key,**{'color': color[i], 'font-size': '16pt'})
+            pen = pyqtgraph.mkPen(QColor(color[i]), width=2, 
+                                    style=lineStyle[i])
+            curve = pyqtgraph.PlotCurveItem(pen=pen)
+            view.addItem(curve)        
+            self.curves.append(curve)
+            
+            trigger = self.trig_combo.currentIndex()
+            if trigger >= 0 and trigger == i:
+                self.plots[i+1].addItem(self.hLine)
+                self.plots[i+1].addItem(self.tLine)
                 
-                trigger = self.trig_combo.currentIndex()
-                if trigger >= 0 and trigger == i:
-                    self.plots[i+1].addItem(self.hLine)
-                    self.plots[i+1].addItem(self.tLine)
-                    
-            self.updateViews()
+        self.updateViews()
 
     def updateViews(self):
         for plot in self.plots[1:]:
@@ -846,6 +1094,8 @@ class HalPinWidget(QWidget):
             plot.linkedViewChanged(self.plots[0].vb, plot.XAxis)   
             
     def clear_plot(self):
+        self.stop_roll()
+
         #Clear plot
         for i,p in enumerate(self.plots[1:]):
             item = self.plots[0].layout.itemAt(2, i+3)
@@ -854,6 +1104,8 @@ class HalPinWidget(QWidget):
             self.plots[0].scene().removeItem(p)
         
         self.plots = [self.plots[0]]
+        self.curves = []
+        self.plot_names = []
 
         #Clear data
         self.data = {}
@@ -875,9 +1127,10 @@ class HalPinWidget(QWidget):
         self.trig_combo.clear()
         model = self.trig_combo.model()
         
+        requests = []
         for i,key in enumerate(watchlist):
             #Set (Channel, NChannel*10+ChannelType, Pin offset)
-            osc.send_packet(self.control,osc.OSC_CHANNEL,i*10+int(key[3]),int(key[0],16))
+            requests.append((osc.OSC_CHANNEL,i*10+int(key[3]),int(key[0],16)))
             item = QStandardItem(key[2])
             item.setData(int(key[3]), role=Qt.UserRole + 1)
             item.setData(int(key[0],16), role=Qt.UserRole + 2)
@@ -886,9 +1139,10 @@ class HalPinWidget(QWidget):
         self.trig_combo.setCurrentIndex(-1)
         
         #Clear data old data
-        osc.send_packet(self.control,osc.OSC_CHANNEL,(i+1)*10,0)
+        requests.append((osc.OSC_CHANNEL,(i+1)*10,0))
+        self.scope.send(requests)
            
-        self.plot_update_data()
+        self.clear_plot()
 
     def on_update_clicked(self):
         self.load_data()
@@ -939,20 +1193,37 @@ class HalPinWidget(QWidget):
 
     def update_watched_list(self):
         if not self.watched_list.visibleRegion().isEmpty():
+            rows = []
+            objects = []
             for r in range(self.watched_list.rowCount()):
                 addr = self.watched_list.item(r,4)
                 pdir = self.watched_list.item(r,5)
                 htype = self.watched_list.item(r,6)
                 if addr and pdir and htype:
-                    data = osc.send_packet(self.control,osc.OSC_STATE,int(htype.text()),
-                                            int(addr.text(),16))
-                    if data:
-                        data = data[:-1].replace(' ','')
-                        value = self.watched_list.item(r,3)
-                        if value:
-                            value.setText(data)
-                        else:
-                            self.watched_list.setItem(r,3,QTableWidgetItem(data))
+                    rows.append(r)
+                    objects.append((int(htype.text()),int(addr.text(),16)))
+
+            #A slow component gets one request at a time
+            if not objects or self.states_pending:
+                return
+
+            #All values in one request
+            requests = osc.states_requests(objects)
+            self.states_pending = True
+            self.scope.send(requests,
+                partial(self.watched_states,rows,requests),raw=True)
+
+    def watched_states(self,rows,requests,answers):
+        self.states_pending = False
+        states = osc.decode_states(requests,answers)
+        for r, (stype, value) in zip(rows, states):
+            data = osc.get_state_text(stype, value)
+            if data and r < self.watched_list.rowCount():
+                item = self.watched_list.item(r,3)
+                if item:
+                    item.setText(data)
+                else:
+                    self.watched_list.setItem(r,3,QTableWidgetItem(data))
 
     def on_tree_doubleclick(self,item,column,row=0):
         if item.text(1):
@@ -977,6 +1248,7 @@ class HalPinWidget(QWidget):
             self.watched_list.setItem(row,6,QTableWidgetItem(hal_type))
 
     def load_data(self):
+        self.stop_roll()
         self.tree.clear()
         
         try:
@@ -1004,6 +1276,7 @@ class HalPinWidget(QWidget):
                     ] for s in data_param])
 
             data = list(data_pin) + list(data_param)
+            self.scope.control = self.control
         except Exception as e:
             printInfo(_("Failed to get hal pin list: {}",e))
             return
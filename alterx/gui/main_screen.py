@@ -428,13 +428,12 @@ class AxisWidget(QGroupBox):
         h1.addWidget(self.drolabel)
         self.setLayout(h1)
         
-        UPDATER.signal(INFO.axes_list, lambda axis: self.update_position(axis))
+        for signal in (INFO.axes_list, "g5x_offset", "g92_offset", "tool_offset",
+                        "diameter_multiplier", "update_feed_labels"):
+            UPDATER.signal(signal, self.refresh, coalesce=True)
         UPDATER.signal("task_mode", self.task_mode_handler)
-        UPDATER.signal("diameter_multiplier", self.diameter_mode)
-        UPDATER.signal("update_feed_labels", 
-            lambda stat: self.update_position(getattr(STAT,INFO.axes_list)))
 
-    def diameter_mode(self, data):
+    def refresh(self, data=None):
         self.update_position(getattr(STAT,INFO.axes_list))
 
     def update_position(self, stat):
@@ -172,7 +172,7 @@ class MainWindow(QWidget):
                 else:
                     self.mainLayout.leftLayout.addWidget(sidebutton)
                     
-        UPDATER.start(INFO.display_cycle_time)
+        UPDATER.start()
         
         open_file = INI.find("DISPLAY", "OPEN_FILE")
         if open_file:
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - persistent gcode preview cache
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['PREVIEW_CACHE']
+
+from alterx.common.locale import _
+from alterx.common.compat import *
+from alterx.common import *
+from alterx.core.linuxcnc import *
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import zlib
+
+CACHE_VERSION = 4
+
+
+class preview_cache(object):
+    """Parsed previews stored on disk.
+
+    Entries are keyed by the gcode file content and everything else that
+    changes the interpreter output: parameter file, startup code, units,
+    tool table and any viewer specific settings. Every entry is a zlib
+    compressed pickle, the oldest used entries are removed when the
+    directory grows over max_size bytes.
+
+    The key is computed by the preview worker process, new entries are
+    written with store() from a thread, so neither the hash of the
+    program nor the serialization of the preview runs on the GUI thread.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def enabled(self):
+        return bool(self.directory) and self.max_size > 0
+
+    def file_digest(self, filename, digest):
+        if filename and os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        digest.update(b'\0')
+
+    def key(self, filename, parameter_file, initcode, units, tool_table, *extra):
+        digest = hashlib.sha1()
+        self.file_digest(filename, digest)
+        self.file_digest(parameter_file, digest)
+        context = repr((CACHE_VERSION, initcode, units,
+                        [tuple(t) for t in (tool_table or ())], extra))
+        digest.update(context.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.preview')
+
+    def get(self, key):
+        if not self.enabled():
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+            # mark as recently used
+            os.utime(path, None)
+            return data
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            printError(_("Preview cache, failed to read {}: {}", path, e))
+            self.remove(path)
+            return None
+
+    def store(self, key, data):
+        if not self.enabled() or key is None:
+            return
+        # not a daemon, the entry is completed before the exit
+        threading.Thread(target=self.put, args=(key, data)).start()
+
+    def put(self, key, data):
+        if not self.enabled():
+            return
+        temp = None
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            blob = zlib.compress(pickle.dumps(data, 2), 1)
+            # write to a temp file first, so a crash never leaves a broken entry
+            fd, temp = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.rename(temp, self.path(key))
+            temp = None
+            self.evict()
+        except Exception as e:
+            printError(_("Preview cache, failed to store entry: {}", e))
+            if temp is not None:
+                self.remove(temp)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.preview'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.preview'):
+                    self.remove(os.path.join(self.directory, name))
+
+
+PREVIEW_CACHE = preview_cache(INFO.preview_cache_dir, INFO.preview_cache_size)
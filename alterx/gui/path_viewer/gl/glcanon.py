@@ -18,14 +18,19 @@
 from __future__ import division, absolute_import, print_function, unicode_literals
 
 from . import interpret
+from . import glvbo
 
 #from OpenGL.GL import *
 #from OpenGL.GLU import *
 from minigl import *
+from alterx.common.locale import _
+from alterx.common import printError
 from alterx.core.linuxcnc import LINUXCNC as linuxcnc
 
 
 import math
+import itertools
+import operator
 import glnav
 import hershey
 import linuxcnc
@@ -103,6 +108,13 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         # dwell list - [line number, color, pos x, pos y, pos z, plane]
         self.dwells = []
         self.dwells_append = self.dwells.append
+        # program order of the lists - [list name, first index, tool, stop]
+        # stop is set when the run follows a dwell or a tool change
+        self.runs = []
+        self.run_list = None
+        self.tool_number = 0
+        # dwell times - [line number, seconds, tool]
+        self.dwell_times = []
         self.choice = None
         self.feedrate = 1
         self.lo = (0,) * 9
@@ -142,6 +154,10 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         self.notify = 0
         self.notify_message = ""
         self.highlight_line = None
+        self._line_index = None
+        self._line_index_size = None
+        self._extents = None
+        self._extents_size = None
 
     def comment(self, arg):
         if arg.startswith("AXIS,"):
@@ -210,8 +226,24 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         return linuxcnc.draw_dwells(self.geometry, dwells, alpha, for_selection, self.is_lathe())
 
     def calc_extents(self):
-        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = gcode.calc_extents(
-            self.arcfeed, self.feed, self.traverse)
+        """Extents of the program.
+
+        Like the line index, the extents of the segments appended since
+        the last call are merged into the previous ones, so the partial
+        draws of a loading program don't scan it again every time.
+        """
+        lists = (self.arcfeed, self.feed, self.traverse)
+        size = tuple(len(l) for l in lists)
+        if self._extents_size != size:
+            old = self.appended_since(self._extents_size, size)
+            extents = gcode.calc_extents(
+                *[l[start:] for l, start in zip(lists, old)])
+            if any(old):
+                extents = [tuple(map(f, e, n)) for f, e, n in
+                    zip((min, max, min, max), self._extents, extents)]
+            self._extents = extents
+            self._extents_size = size
+        self.min_extents, self.max_extents, self.min_extents_notool, self.max_extents_notool = self._extents
         if self.is_foam:
             min_z = min(self.foam_z, self.foam_w)
             max_z = max(self.foam_z, self.foam_w)
@@ -243,12 +275,20 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
 
     def change_tool(self, arg):
         self.first_move = True
+        self.run_list = None
+
+    def start_run(self, name):
+        self.runs.append((name, len(getattr(self, name)), self.tool_number,
+                          self.run_list is None))
+        self.run_list = name
 
     def straight_traverse(self, x, y, z, a, b, c, u, v, w):
         if self.suppress > 0:
             return
         l = self.rotate_and_translate(x, y, z, a, b, c, u, v, w)
         if not self.first_move:
+            if self.run_list != 'traverse':
+                self.start_run('traverse')
             self.traverse_append(
                 (self.lineno, self.lo, l, [self.xo, self.yo, self.zo]))
         self.lo = l
@@ -260,6 +300,8 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         l = self.rotate_and_translate(x, y, z, 0, 0, 0, 0, 0, 0)[:3]
         l += [self.lo[3], self.lo[4], self.lo[5],
               self.lo[6], self.lo[7], self.lo[8]]
+        if self.run_list != 'feed':
+            self.start_run('feed')
         self.feed_append((self.lineno, self.lo, l, self.feedrate, [
                          self.xo, self.yo, self.zo]))
 #        self.dwells_append((self.lineno, self.colors['dwell'], x + self.offset_x, y + self.offset_y, z + self.offset_z, 0))
@@ -283,6 +325,8 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         feedrate = self.feedrate
         to = [self.xo, self.yo, self.zo]
         append = self.arcfeed_append
+        if self.run_list != 'arcfeed':
+            self.start_run('arcfeed')
         for l in segs:
             append((lineno, lo, l, feedrate, to))
             lo = l
@@ -293,6 +337,8 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
             return
         self.first_move = False
         l = self.rotate_and_translate(x, y, z, a, b, c, u, v, w)
+        if self.run_list != 'feed':
+            self.start_run('feed')
         self.feed_append((self.lineno, self.lo, l, self.feedrate, [
                          self.xo, self.yo, self.zo]))
         self.lo = l
@@ -309,45 +355,95 @@ class GLCanon(interpret.Translated, interpret.ArcsToSegmentsMixin):
         if self.suppress > 0:
             return
         self.dwell_time += arg
+        self.dwell_times.append((self.lineno, arg, self.tool_number))
+        self.run_list = None
         color = self.colors['dwell']
         self.dwells_append(
             (self.lineno, color, self.lo[0], self.lo[1], self.lo[2], int(self.state.plane/10-17)))
 
+    def get_preview_state(self):
+        return dict(traverse=self.traverse, feed=self.feed,
+                    arcfeed=self.arcfeed, dwells=self.dwells,
+                    dwell_time=self.dwell_time,
+                    runs=self.runs, dwell_times=self.dwell_times,
+                    tool_number=self.tool_number,
+                    foam_z=self.foam_z, foam_w=self.foam_w)
+
+    def set_preview_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.traverse_append = self.traverse.append
+        self.feed_append = self.feed.append
+        self.arcfeed_append = self.arcfeed.append
+        self.dwells_append = self.dwells.append
+        self.run_list = None
+        self._line_index_size = None
+        self._extents_size = None
+
+    def line_index(self):
+        """Map line numbers to the segment ranges of each path list.
+
+        The path lists are in program order, so every gcode line is one
+        (or a few) consecutive runs. Only the segments appended since the
+        last call are indexed, so the index follows a loading program.
+        """
+        lists = (self.traverse, self.arcfeed, self.feed, self.dwells)
+        size = tuple(len(l) for l in lists)
+        if self._line_index_size != size:
+            old = self.appended_since(self._line_index_size, size)
+            if not any(old):
+                self._line_index = tuple({} for l in lists)
+            for l, index, start in zip(lists, self._line_index, old):
+                self.index_lines(l, index, start)
+            self._line_index_size = size
+        return self._line_index
+
+    def appended_since(self, old, size):
+        # Start of the new segments of each list, all zero when the lists
+        # were replaced
+        if old is None or any(n < o for n, o in zip(size, old)):
+            return (0,) * len(size)
+        return old
+
+    def index_lines(self, lines, index, start=0):
+        pos = start
+        for lineno, group in itertools.groupby(lines[start:], operator.itemgetter(0)):
+            count = sum(1 for line in group)
+            ranges = index.setdefault(lineno, [])
+            if ranges and ranges[-1][1] == pos:
+                ranges[-1] = (ranges[-1][0], pos + count)
+            else:
+                ranges.append((pos, pos + count))
+            pos += count
+
+    def line_segments(self, lines, index, lineno):
+        for start, end in index.get(lineno, ()):
+            for line in lines[start:end]:
+                yield line
+
     def highlight(self, lineno, geometry):
+        traverse, arcfeed, feed, dwells = self.line_index()
         glLineWidth(3)
         c = self.colors['selected']
         glColor3f(*c)
         glBegin(GL_LINES)
         coords = []
-        for line in self.traverse:
-            if line[0] != lineno:
-                continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.arcfeed:
-            if line[0] != lineno:
-                continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
-        for line in self.feed:
-            if line[0] != lineno:
-                continue
-            linuxcnc.line9(geometry, line[1], line[2])
-            coords.append(line[1][:3])
-            coords.append(line[2][:3])
+        for lines, index in ((self.traverse, traverse),
+                             (self.arcfeed, arcfeed),
+                             (self.feed, feed)):
+            for line in self.line_segments(lines, index, lineno):
+                linuxcnc.line9(geometry, line[1], line[2])
+                coords.append(line[1][:3])
+                coords.append(line[2][:3])
         glEnd()
-        for line in self.dwells:
-            if line[0] != lineno:
-                continue
+        for line in self.line_segments(self.dwells, dwells, lineno):
             self.draw_dwells([(line[0], c) + line[2:]], 2, 0)
             coords.append(line[2:5])
         glLineWidth(1)
         if coords:
-            x = reduce(lambda x, y: x+y, [c[0] for c in coords]) / len(coords)
-            y = reduce(lambda x, y: x+y, [c[1] for c in coords]) / len(coords)
-            z = reduce(lambda x, y: x+y, [c[2] for c in coords]) / len(coords)
+            x = sum(c[0] for c in coords) / len(coords)
+            y = sum(c[1] for c in coords) / len(coords)
+            z = sum(c[2] for c in coords) / len(coords)
         else:
             x = (self.min_extents[0] + self.max_extents[0])/2
             y = (self.min_extents[1] + self.max_extents[1])/2
@@ -461,6 +557,8 @@ class GlCanonDraw:
         self.lp = lp
         self.canon = g
         self._dlists = {}
+        self._program_buffer = None
+        self._program_partial = False
         self.select_buffer_size = 100
         self.cached_tool = -1
         self.initialised = 0
@@ -537,6 +635,14 @@ class GlCanonDraw:
     def select(self, x, y):
         if self.canon is None:
             return
+
+        program = self.program_buffer()
+        if program is not None:
+            vport = glGetIntegerv(GL_VIEWPORT)
+            self.set_highlight_line(program.pick(x, vport[3]-y, 5,
+                                                 self.get_show_rapids()))
+            return
+
         pmatrix = glGetDoublev(GL_PROJECTION_MATRIX)
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
@@ -591,6 +697,7 @@ class GlCanonDraw:
     def __del__(self):
         for base, count in self._dlists.values():
             glDeleteLists(base, count)
+        self.stale_program_buffer()
 
     def update_highlight_variable(self, line):
         self.highlight_line = line
@@ -1181,10 +1288,22 @@ class GlCanonDraw:
                 glEnable(GL_BLEND)
                 glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-            if self.get_show_rapids():
-                glCallList(self.dlist('program_rapids',
-                                      gen=self.make_main_list))
-            glCallList(self.dlist('program_norapids', gen=self.make_main_list))
+            program = self.program_buffer()
+            if program is not None:
+                program.select_level(self.pixel_size())
+                if self.get_show_rapids():
+                    glEnable(GL_LINE_STIPPLE)
+                    program.draw('traverse')
+                    glDisable(GL_LINE_STIPPLE)
+                program.draw('feed')
+                program.draw('arcfeed')
+                glCallList(self.dlist('program_dwells',
+                                      gen=self.make_dwell_list))
+            else:
+                if self.get_show_rapids():
+                    glCallList(self.dlist('program_rapids',
+                                          gen=self.make_main_list))
+                glCallList(self.dlist('program_norapids', gen=self.make_main_list))
             glCallList(self.dlist('highlight'))
 
             if self.get_program_alpha():
@@ -1941,6 +2060,42 @@ class GlCanonDraw:
             self.canon.draw(1, True)
         glEndList()
 
+    def program_buffer(self):
+        # VBOs for plain XYZ geometry, display lists otherwise
+        if self._program_buffer is None:
+            self._program_buffer = False
+            if (glvbo.VBO_GOOD and self.canon and not self.is_foam()
+                    and glvbo.plain_geometry(self.get_geometry())):
+                try:
+                    self._program_buffer = glvbo.ProgramBuffer(self.canon,
+                        self.colors, self._program_partial, self._redraw)
+                except Exception as e:
+                    printError(_("Can't create program VBO, using display lists: {}", e))
+                    glvbo.VBO_GOOD = False
+        return self._program_buffer or None
+
+    def pixel_size(self):
+        # size of one pixel at the view center, in internal units
+        w = self.winfo_width() or 1
+        h = self.winfo_height() or 1
+        if self.perspective:
+            return 2 * self.distance * math.tan(math.radians(self.fovy / 2)) / h
+        return 2 * (abs(self.distance or 1)) ** .55555 / w
+
+    def stale_program_buffer(self):
+        if self._program_buffer:
+            self._program_buffer.delete()
+        self._program_buffer = None
+
+    def make_dwell_list(self, n):
+        glNewList(n, GL_COMPILE)
+        if self.canon:
+            glLineWidth(2)
+            self.canon.draw_dwells(self.canon.dwells,
+                                   self.colors.get('dwell_alpha', 1/3.), 0)
+            glLineWidth(1)
+        glEndList()
+
     def make_main_list(self, unused=None):
         program = self.dlist('program_norapids')
         rapids = self.dlist('program_rapids')
@@ -1959,15 +2114,34 @@ class GlCanonDraw:
         result, seq = gcode.parse(f, canon, *args)
 
         if result <= gcode.MIN_ERROR:
-            self.canon.progress.nextphase(1)
-            canon.calc_extents()
-            self.stale_dlist('program_rapids')
-            self.stale_dlist('program_norapids')
-            self.stale_dlist('select_rapids')
-            self.stale_dlist('select_norapids')
+            self.preview_loaded(canon)
 
         return result, seq
 
+    def preview_loaded(self, canon):
+        self.canon.progress.nextphase(1)
+        canon.calc_extents()
+        canon.line_index()
+        self._program_partial = False
+        self.stale_program()
+
+    def preview_partial(self, canon):
+        # show the part of the program parsed so far
+        if not (canon.traverse or canon.feed or canon.arcfeed):
+            return False
+        canon.calc_extents()
+        self._program_partial = True
+        self.stale_program()
+        return True
+
+    def stale_program(self):
+        self.stale_dlist('program_rapids')
+        self.stale_dlist('program_norapids')
+        self.stale_dlist('program_dwells')
+        self.stale_program_buffer()
+        self.stale_dlist('select_rapids')
+        self.stale_dlist('select_norapids')
+
     def from_internal_units(self, pos, unit=None):
         if unit is None:
             unit = self.stat.linear_units
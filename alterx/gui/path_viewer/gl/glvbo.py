@@ -0,0 +1,242 @@
+#    This is a component of AlterX
+#    Program geometry in OpenGL vertex buffer objects
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import itertools
+
+try:
+    import numpy
+    from OpenGL import GL
+    from .. import lod
+    VBO_GOOD = True
+except ImportError:
+    VBO_GOOD = False
+
+# Program lists in the order they are stored in the buffers, with the
+# color used for them. Same order as GLCanon.draw uses for selection.
+PROGRAM_LISTS = (
+    ('traverse', 'traverse'),
+    ('feed', 'straight_feed'),
+    ('arcfeed', 'arc_feed'),
+)
+
+
+def plain_geometry(geometry):
+    # only a permutation of XYZ maps the positions straight to vertices.
+    # linuxcnc.draw_lines drops the missing axes of a subset (XZ lathe),
+    # rotary and negated axes are left to it as well
+    return sorted(geometry) == list("XYZ")
+
+
+def segment_points(lines):
+    count = len(lines)
+    points = numpy.empty((count, 2, 3), dtype=numpy.float32)
+    if count:
+        points[:, 0] = numpy.fromiter(itertools.chain.from_iterable(
+            l[1][:3] for l in lines), numpy.float32, count * 3).reshape(-1, 3)
+        points[:, 1] = numpy.fromiter(itertools.chain.from_iterable(
+            l[2][:3] for l in lines), numpy.float32, count * 3).reshape(-1, 3)
+    return points.reshape(-1, 3)
+
+
+class ProgramBuffer(object):
+    """Program segments uploaded once to the GPU.
+
+    Vertices and per vertex colors of traverse, feed and arcfeed are
+    packed in two float32 buffers, every list is drawn as a range with
+    glDrawArrays, so toggling rapids or alpha mode never walks the path
+    lists again. Big programs also get simplified levels of detail,
+    built by a lod.LevelBuilder thread and stored in their own buffers
+    when they are ready, select_level picks the ranges to draw. Until
+    then, and for a partial buffer made while the program is still
+    loaded, the full resolution program is drawn.
+    """
+    def __init__(self, canon, colors, partial=False, updated=None):
+        names = [name for name, color in PROGRAM_LISTS]
+        points = numpy.concatenate([segment_points(getattr(canon, name))
+                                    for name in names]).reshape(-1, 2, 3)
+        types = numpy.concatenate([
+            numpy.full(len(getattr(canon, name)), i, dtype=numpy.uint8)
+            for i, name in enumerate(names)])
+        # line number of every segment, for picking
+        self.line_numbers = numpy.fromiter(itertools.chain.from_iterable(
+            (l[0] for l in getattr(canon, name)) for name in names),
+            numpy.int32, len(types))
+        self.palette = numpy.array([
+            tuple(colors[color]) + (colors.get(color + '_alpha', 1/3.),)
+            for name, color in PROGRAM_LISTS], dtype=numpy.float32)
+
+        # levels of detail, [(tolerance, {name: (first, count)}, buffers), ...]
+        self.levels = []
+        self.buffers = []
+        self.store([(0.0, points, types, self.line_numbers)])
+        self.level = self.levels[0]
+        self.count = 2 * len(types)
+        self.pick_buffer = None
+
+        # called when the levels of detail are ready to be drawn
+        self.updated = updated
+        self.pending = None
+        self.builder = None
+        if not partial and len(types) >= lod.LOD_MIN_SEGMENTS:
+            self.builder = lod.LevelBuilder(points, types, self.line_numbers)
+            self.builder.built.connect(self.levels_built)
+            self.builder.start()
+
+    def store(self, levels):
+        # the given levels share one pair of buffers
+        names = [name for name, color in PROGRAM_LISTS]
+        vertices = []
+        vertex_colors = []
+        stored = []
+        first = 0
+        for tolerance, p, t, l in levels:
+            # keep every list contiguous in the buffer
+            order = numpy.argsort(t, kind='mergesort')
+            p = p[order]
+            t = t[order]
+            ranges = {}
+            for i, name in enumerate(names):
+                count = 2 * int(numpy.count_nonzero(t == i))
+                ranges[name] = first, count
+                first += count
+            vertices.append(p.reshape(-1, 3))
+            vertex_colors.append(self.palette[numpy.repeat(t, 2)])
+            stored.append((tolerance, ranges))
+
+        buffers = GL.glGenBuffers(2)
+        self.upload(buffers[0], numpy.concatenate(vertices))
+        self.upload(buffers[1], numpy.concatenate(vertex_colors))
+        self.buffers.append(buffers)
+        self.levels.extend((tolerance, ranges, buffers)
+                           for tolerance, ranges in stored)
+
+    def levels_built(self, levels):
+        # GUI thread, outside of the GL context: the levels are uploaded
+        # by the next select_level
+        if self.builder is None:
+            return
+        self.builder = None
+        self.pending = levels
+        if self.updated is not None:
+            self.updated()
+
+    def select_level(self, pixel_size):
+        if self.pending:
+            self.store(self.pending)
+            self.pending = None
+        self.level = self.levels[lod.select_level(
+            [level[0] for level in self.levels], pixel_size)]
+
+    def upload(self, buffer, data):
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes,
+                        numpy.ascontiguousarray(data), GL.GL_STATIC_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def draw(self, name, pick=False):
+        # picking always uses the full resolution program
+        tolerance, ranges, buffers = self.levels[0] if pick else self.level
+        first, count = ranges[name]
+        if not count:
+            return
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffers[0])
+        GL.glVertexPointer(3, GL.GL_FLOAT, 0, None)
+        if pick:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.pick_colors())
+            GL.glColorPointer(4, GL.GL_UNSIGNED_BYTE, 0, None)
+        else:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffers[1])
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, None)
+        GL.glDrawArrays(GL.GL_LINES, first, count)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+    def pick_colors(self):
+        # segment index + 1 encoded in RGB, 0 is the background
+        if self.pick_buffer is None:
+            ids = numpy.repeat(numpy.arange(1, self.count // 2 + 1,
+                                            dtype=numpy.uint32), 2)
+            rgba = numpy.empty((len(ids), 4), dtype=numpy.uint8)
+            rgba[:, 0] = ids & 0xff
+            rgba[:, 1] = (ids >> 8) & 0xff
+            rgba[:, 2] = (ids >> 16) & 0xff
+            rgba[:, 3] = 0xff
+            self.pick_buffer = GL.glGenBuffers(1)
+            self.upload(self.pick_buffer, rgba)
+        return self.pick_buffer
+
+    def pick(self, x, y, size, rapids=True):
+        """Return the line number of the segment drawn nearest to x, y.
+
+        The segments are drawn into the back buffer with their index as
+        color and a size x size pixel window around the point is read
+        back, no GL_SELECT pass is needed.
+        """
+        GL.glPushAttrib(GL.GL_ENABLE_BIT | GL.GL_COLOR_BUFFER_BIT |
+                        GL.GL_DEPTH_BUFFER_BIT | GL.GL_LINE_BIT)
+        try:
+            for cap in (GL.GL_LIGHTING, GL.GL_BLEND, GL.GL_DITHER,
+                        GL.GL_LINE_SMOOTH, GL.GL_LINE_STIPPLE,
+                        GL.GL_MULTISAMPLE, GL.GL_TEXTURE_2D):
+                GL.glDisable(cap)
+            GL.glEnable(GL.GL_DEPTH_TEST)
+            GL.glLineWidth(1)
+            GL.glClearColor(0, 0, 0, 0)
+            GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+
+            if rapids:
+                self.draw('traverse', True)
+            self.draw('feed', True)
+            self.draw('arcfeed', True)
+
+            half = size // 2
+            GL.glReadBuffer(GL.GL_BACK)
+            GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+            data = GL.glReadPixels(x - half, y - half, size, size,
+                                   GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+        finally:
+            GL.glPopAttrib()
+
+        pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(size, size, 4)
+        ids = (pixels[..., 0].astype(numpy.int64) |
+               pixels[..., 1].astype(numpy.int64) << 8 |
+               pixels[..., 2].astype(numpy.int64) << 16)
+        hit = numpy.nonzero(ids)
+        if not len(hit[0]):
+            return None
+
+        # the hit nearest to the center of the window wins
+        distance = (hit[0] - half) ** 2 + (hit[1] - half) ** 2
+        nearest = numpy.argmin(distance)
+        return int(self.line_numbers[ids[hit[0][nearest], hit[1][nearest]] - 1])
+
+    def delete(self):
+        if self.builder is not None:
+            self.builder.cancel()
+            self.builder = None
+        self.pending = None
+        for buffers in self.buffers:
+            GL.glDeleteBuffers(2, buffers)
+        self.buffers = []
+        if self.pick_buffer is not None:
+            GL.glDeleteBuffers(1, [self.pick_buffer])
+            self.pick_buffer = None
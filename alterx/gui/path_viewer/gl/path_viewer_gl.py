@@ -32,6 +32,9 @@ from alterx.core.linuxcnc import *
 from . import glnav 
 from . import interpret
 from . import glcanon
+from ..preview import Progress, DummyProgress, PreviewLoader, count_lines
+from ..cache import PREVIEW_CACHE
+from .. import runtime
 
 from functools import partial
 
@@ -80,7 +83,11 @@ class PathViewer(QWidget):
         UPDATER.add("display_dimensions")
         self.glWidget = GCodeGraphics()
         
+        UPDATER.add("display_preview_cancel")
+        UPDATER.add("gcode_properties")
+
         UPDATER.signal('file', self.glWidget.load_program)
+        UPDATER.signal("display_preview_cancel", lambda s: self.glWidget.cancel_load())
         UPDATER.signal('file_reload', lambda s: self.glWidget.reloadfile(None))
 
         UPDATER.signal("display_clear", lambda s: self.glWidget.set_view_signal("clear"))
@@ -106,11 +113,6 @@ class PathViewer(QWidget):
 #################
 
 
-class DummyProgress:
-    def nextphase(self, unused): pass
-    def progress(self): pass
-
-
 class StatCanon(glcanon.GLCanon, interpret.StatMixin):
     def __init__(self, colors, geometry, lathe_view_option, 
                     stat, random, text, linecount, progress, arcdivision):
@@ -128,6 +130,7 @@ class StatCanon(glcanon.GLCanon, interpret.StatMixin):
     def change_tool(self, pocket):
         glcanon.GLCanon.change_tool(self,pocket)
         interpret.StatMixin.change_tool(self,pocket)
+        self.tool_number = self.tools[0][0]
 
     # not sure if this is used - copied from AXIS code
     def do_cancel(self, event):
@@ -147,40 +150,6 @@ class StatCanon(glcanon.GLCanon, interpret.StatMixin):
             self.notify = 0
 
 
-class Progress:
-    def __init__(self, phases, total):
-        self.num_phases = phases
-        self.phase = 0
-        self.total = total or 1
-        self.lastcount = 0
-        self.text = None
-
-    def update(self, count, force=0):
-        if force or count - self.lastcount > 400:
-            fraction = (self.phase + count * 1. / self.total) / self.num_phases
-            self.lastcount = count
-            self.emit_percent(int(fraction *100))
-
-    # this is class patched
-    def emit_percent(self, percent):
-        pass
-
-    def nextphase(self, total):
-        self.phase += 1
-        self.total = total or 1
-        self.lastcount = -100
-        self.update(0, True)
-
-    def done(self):
-        self.emit_percent(-1)
-
-    # not sure if this is used - copied from AXIS code
-    def set_text(self, text):
-        if self.text is None:
-            self.text = ".info.progress"
-        else:
-            printInfo(_("GL Info progress: {}", text))
-
 class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
     percentLoaded = pyqtSignal(int)
     xRotationChanged = pyqtSignal(int)
@@ -215,13 +184,15 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
 
         # set defaults
         self.current_view = 'p'
-        self.fingerprint = ()
+        self.dirty = True
+        self.live_plot_points = 0
         self.select_primed = None
         self.lat = 0
         self.minlat = -90
         self.maxlat = 90
 
         self._current_file = None
+        self.loader = None
         self.highlight_line = None
         self.program_alpha = False
         self.use_joints_mode = False
@@ -265,6 +236,14 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
         self.yRot = 0
         self.zRot = 0
   
+        # redraw only when something we draw has changed
+        for name in ("actual_position", "joint_actual_position", "homed",
+                     "g5x_offset", "g92_offset", "limit", "tool_in_spindle",
+                     "motion_mode", "current_vel"):
+            UPDATER.signal(name, self.invalidate)
+        # soft limits
+        UPDATER.signal("axis", self.invalidate, UPDATER.RATE_SLOW)
+
         # add a 100ms timer to poll linuxcnc stats
         self.timer = QTimer()
         self.timer.timeout.connect(self.poll)
@@ -273,19 +252,20 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
         self.Green = QColor.fromCmykF(0.40, 0.0, 1.0, 0.0)
         self.inhibit_selection = True
 
+    def invalidate(self, value=None):
+        self.dirty = True
+
     def poll(self):
         if self.visibleRegion().isEmpty():
             return
 
-        s = self.stat
-
-        fingerprint = (self.logger.npts, self.soft_limits(),
-            s.actual_position, s.joint_actual_position,
-            s.homed, s.g5x_offset, s.g92_offset, s.limit, s.tool_in_spindle,
-            s.motion_mode, s.current_vel)
+        # the live plot is filled by the logger thread, not by UPDATER
+        if self.logger.npts != self.live_plot_points:
+            self.live_plot_points = self.logger.npts
+            self.dirty = True
 
-        if fingerprint != self.fingerprint:
-            self.fingerprint = fingerprint
+        if self.dirty:
+            self.dirty = False
             self.update()
         return True
 
@@ -302,31 +282,21 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
         elif not filename and not s.file:
             return
 
+        self.cancel_load()
 
-        lines = open(filename).readlines()
-        progress = Progress(2, len(lines))
+        # the line count comes from the preview worker
+        progress = Progress(2, None)
         progress.emit_percent = self.emit_percent
-
-        code = []
-        i = 0
-        for i, l in enumerate(lines):
-            l = l.expandtabs().replace("\r", "")
-            code.extend(["%6d: " % (i+1), "lineno", l, ""])
-            if i % 1000 == 0:
-                del code[:]
-                progress.update(i)
-        if code:
-            pass
-        progress.nextphase(len(lines))
-
+        progress.nextphase(None)
 
         td = tempfile.mkdtemp()
         self._current_file = filename
+        canon = None
         try:
             random = int(self.inifile.find("EMCIO", "RANDOM_TOOLCHANGER") or 0)
             arcdivision = int(self.inifile.find("DISPLAY", "ARCDIVISION") or 64)
             text = ''
-            canon = StatCanon(self.colors, self.get_geometry(),self.lathe_option, s, text, random, i, progress, arcdivision)
+            canon = StatCanon(self.colors, self.get_geometry(),self.lathe_option, s, text, random, None, progress, arcdivision)
             parameter = self.inifile.find("RS274NGC", "PARAMETER_FILE")
             temp_parameter = os.path.join(td, os.path.basename(parameter or "linuxcnc.var"))
             if parameter:
@@ -334,10 +304,47 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
             canon.parameter_file = temp_parameter
             unitcode = "G%d" % (20 + (s.linear_units == 1))
             initcode = self.inifile.find("RS274NGC", "RS274NGC_STARTUP_CODE") or ""
-            result, seq = self.load_preview(filename, canon, unitcode, initcode)
-            if result > GCODE.MIN_ERROR:
-                self.report_gcode_error(result, seq, filename)
-            self.calculate_gcode_properties(canon)
+
+            self.set_canon(canon)
+
+            cache = None
+            if PREVIEW_CACHE.enabled():
+                cache = (filename, parameter, initcode, unitcode,
+                    s.tool_table, random, arcdivision, filename,
+                    self.get_geometry(), self.lathe_option, self.metric_units)
+
+            # the interpreter runs in a worker process, the canon calls are
+            # replayed on our canon as they arrive
+            self.loader = PreviewLoader(canon, progress,
+                partial(self.load_finished, filename, canon, progress, td),
+                partial=self.load_partial,
+                restored=partial(self.load_restored, filename, canon, progress, td))
+            self.loader.start(filename, unitcode, initcode, temp_parameter,
+                              random, cache)
+        except Exception as e:
+            printError(_("PathViewer load error: {}",e))
+            self.gcode_properties = None
+            self.load_finished(filename, canon, progress, td, None, None)
+
+    def load_restored(self, filename, canon, progress, td, state):
+        printDebug(_("PathViewer preview loaded from cache: {}", filename))
+        canon.set_preview_state(state['canon'])
+        self.preview_loaded(canon)
+        self.gcode_properties = state['properties']
+        self.load_finished(filename, canon, progress, td, None, None)
+
+    def load_finished(self, filename, canon, progress, td, result, seq):
+        loader, self.loader = self.loader, None
+        try:
+            if result is not None:
+                if result > GCODE.MIN_ERROR:
+                    self.report_gcode_error(result, seq, filename)
+                else:
+                    self.preview_loaded(canon)
+                self.calculate_gcode_properties(canon)
+                if loader is not None and result <= GCODE.MIN_ERROR:
+                    PREVIEW_CACHE.store(loader.key, dict(canon=canon.get_preview_state(),
+                                                         properties=self.gcode_properties))
         except Exception as e:
             printError(_("PathViewer load error: {}",e))
             self.gcode_properties = None
@@ -345,95 +352,38 @@ class GraphPlot(QGLWidget,  glcanon.GlCanonDraw, glnav.GlNavBase):
             shutil.rmtree(td)
             if canon:
                 canon.progress = DummyProgress()
-            try:
-                progress.done()
-            except UnboundLocalError:
-                pass
+            progress.done()
         self._redraw()
 
+    def load_partial(self):
+        if self.canon and self.preview_partial(self.canon):
+            self.update()
+
+    def cancel_load(self):
+        loader, self.loader = self.loader, None
+        if loader is not None:
+            printDebug(_("PathViewer load canceled: {}", self._current_file))
+            loader.canon.do_cancel(None)
+            loader.cancel()
+            loader.finished(None, None)
+
     def emit_percent(self, percent):
         self.percentLoaded.emit(percent)
 
     def calculate_gcode_properties(self, canon):
-        def dist(xxx_todo_changeme, xxx_todo_changeme1):
-            (x,y,z) = xxx_todo_changeme
-            (p,q,r) = xxx_todo_changeme1
-            return ((x-p)**2 + (y-q)**2 + (z-r)**2) ** .5
-        def from_internal_units(pos, unit=None):
-            if unit is None:
-                unit = self.stat.linear_units
-            lu = (unit or 1) * 25.4
-
-            lus = [lu, lu, lu, 1, 1, 1, lu, lu, lu]
-            return [a*b for a, b in zip(pos, lus)]
-        def from_internal_linear_unit(v, unit=None):
-            if unit is None:
-                unit = self.stat.linear_units
-            lu = (unit or 1) * 25.4
-            return v*lu
-
-        props = {}
         loaded_file = self._current_file
-        max_speed = float(
-            self.inifile.find("DISPLAY","MAX_LINEAR_VELOCITY")
-            or self.inifile.find("TRAJ","MAX_LINEAR_VELOCITY")
-            or self.inifile.find("AXIS_X","MAX_VELOCITY")
-            or 1)
-
         if not loaded_file:
-            props['name'] = _("No file loaded")
-        else:
-            ext = os.path.splitext(loaded_file)[1]
-            program_filter = None
-            if ext:
-                program_filter = self.inifile.find("FILTER", ext[1:])
-            name = os.path.basename(loaded_file)
-            if program_filter:
-                props['name'] = _("generated from %s") % name
-            else:
-                props['name'] = name
-
-            size = os.stat(loaded_file).st_size
-            lines = sum(1 for line in open(loaded_file))
-            props['size'] = _("%(size)s bytes\n%(lines)s gcode lines") % {'size': size, 'lines': lines}
+            self.gcode_properties = dict(name=_("No file loaded"))
+            return
 
-            if self.metric_units:
-                conv = 1
-                units = "mm"
-                fmt = "%.3f"
-            else:
-                conv = 1/25.4
-                units = "in"
-                fmt = "%.4f"
-
-            mf = max_speed
-            #print(canon.traverse[0])
-
-            g0 = sum(dist(l[1][:3], l[2][:3]) for l in canon.traverse)
-            g1 = (sum(dist(l[1][:3], l[2][:3]) for l in canon.feed) +
-                sum(dist(l[1][:3], l[2][:3]) for l in canon.arcfeed))
-            gt = (sum(dist(l[1][:3], l[2][:3])/min(mf, l[3]) for l in canon.feed) +
-                sum(dist(l[1][:3], l[2][:3])/min(mf, l[3])  for l in canon.arcfeed) +
-                sum(dist(l[1][:3], l[2][:3])/mf  for l in canon.traverse) +
-                canon.dwell_time
-                )
- 
-            props['G0'] = "%f %s".replace("%f", fmt) % (from_internal_linear_unit(g0, conv), units)
-            props['gG1'] = "%f %s".replace("%f", fmt) % (from_internal_linear_unit(g1, conv), units)
-            if gt > 120:
-                props['Run'] = _("%.1f Minutes") % (gt/60)
-            else:
-                props['Run'] = _("%d Ceconds") % (int(gt))
-
-            min_extents = from_internal_units(canon.min_extents, conv)
-            max_extents = from_internal_units(canon.max_extents, conv)
-            for (i, c) in enumerate("XYZ"):
-                a = min_extents[i]
-                b = max_extents[i]
-                if a != b:
-                    props[c] = _("%(a)f to %(b)f = %(diff)f %(units)s").replace("%f", fmt) % {'a': a, 'b': b, 'diff': b-a, 'units': units}
-            props['Units'] = units
-        self.gcode_properties = props
+        lines = getattr(canon, 'linecount', None)
+        if lines is None:
+            lines = count_lines(loaded_file)
+        # the segment lists are packed once for all the estimates
+        self.gcode_properties = runtime.gcode_properties(
+            runtime.pack_program(canon), loaded_file, lines, self.inifile,
+            INFO.coordinates, self.stat.linear_units, self.metric_units,
+            INFO.max_feed_override, (canon.min_extents, canon.max_extents))
 
     # setup details when window shows
     def realize(self):
@@ -993,6 +943,7 @@ class  GCodeGraphics(GraphPlot):
 
         self.show_overlay = False  # no DRO or DRO overlay
         self._reload_filename = None
+        self._reset_view = False
 
         self._view_incr = 20
         self.inhibit_selection = False
@@ -1070,10 +1021,22 @@ class  GCodeGraphics(GraphPlot):
     def load_program(self, fname):
         printDebug(_("PathViewer load: {}", fname))
         self._reload_filename = fname
+        self._reset_view = True
         self.load(fname)
-        #STATUS.emit('graphics-gcode-properties',self.gcode_properties)
+
+    def load_partial(self):
+        super( GCodeGraphics, self).load_partial()
+        # zoom to the program parsed so far, the final view is set when done
+        if self._reset_view:
+            self.set_current_view()
+
+    def load_finished(self, *args):
+        super( GCodeGraphics, self).load_finished(*args)
+        UPDATER.emit("gcode_properties", self.gcode_properties)
         # reset the current view to standard calculated zoom and position
-        self.set_current_view()
+        if self._reset_view:
+            self._reset_view = False
+            self.set_current_view()
 
     def set_metric_units(self, state):
         self.metric_units = state
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - toolpath level of detail
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['simplify', 'build_levels', 'select_level', 'LevelBuilder',
+           'LOD_MIN_SEGMENTS']
+
+from alterx.common.locale import _
+from alterx.common import *
+from alterx.gui.util import *
+
+import numpy
+
+# Programs with less segments are always drawn at full resolution
+LOD_MIN_SEGMENTS = 50000
+# Tolerance of the first level is the extents diagonal / LOD_DIVISION,
+# every next level is LOD_STEP times coarser
+LOD_DIVISION = 4000.0
+LOD_STEP = 4.0
+LOD_MAX_LEVELS = 5
+# Part of the tolerance spent on the grid pre-decimation, the rest is
+# left to Douglas-Peucker
+LOD_GRID = 0.25
+# Polylines are split every LOD_CHUNK vertices and Douglas-Peucker stops
+# after LOD_ROUNDS splits, the vertices of an unfinished range are kept.
+# This bounds the cost to LOD_ROUNDS passes over the vertices
+LOD_CHUNK = 1024
+LOD_ROUNDS = 32
+
+
+def grid_decimate(vertices, fixed, cell):
+    """Drop the vertices in the grid cell of the vertex before them.
+
+    Every dropped vertex is in the cell of the last vertex kept before
+    it, so the error is below the cell diagonal.
+    """
+    cells = numpy.floor(vertices / cell).astype(numpy.int64)
+    keep = fixed.copy()
+    keep[1:] |= numpy.any(cells[1:] != cells[:-1], axis=1)
+    return keep
+
+
+def douglas_peucker(vertices, fixed, tolerance):
+    """Return the mask of the vertices kept by Douglas-Peucker.
+
+    The ranges between fixed vertices are simplified all at once, each
+    pass splits every range still above the tolerance at its farthest
+    vertex, so the loop runs once per recursion depth and not once per
+    kept vertex.
+    """
+    keep = fixed.copy()
+    ends = numpy.flatnonzero(fixed)
+    first, last = ends[:-1], ends[1:]
+    tolerance2 = tolerance * tolerance
+
+    for i in range(LOD_ROUNDS):
+        active = last - first > 1
+        first, last = first[active], last[active]
+        if not len(first):
+            return keep
+
+        # interior vertices of all the ranges, with their range number
+        sizes = last - first - 1
+        rng = numpy.repeat(numpy.arange(len(first)), sizes)
+        offsets = numpy.cumsum(sizes) - sizes
+        index = numpy.arange(len(rng)) - offsets[rng] + first[rng] + 1
+
+        a = vertices[first][rng]
+        ab = vertices[last][rng] - a
+        ap = vertices[index] - a
+        length = numpy.einsum('ij,ij->i', ab, ab)
+        t = numpy.einsum('ij,ij->i', ap, ab) / numpy.where(length > 0, length, 1)
+        d = ap - numpy.clip(t, 0.0, 1.0)[:, None] * ab
+        distance = numpy.einsum('ij,ij->i', d, d)
+
+        # farthest vertex of every range, the first one on ties
+        farthest = numpy.maximum.reduceat(distance, offsets)
+        hits = numpy.flatnonzero(distance == farthest[rng])
+        hits = hits[numpy.r_[True, rng[hits][1:] != rng[hits][:-1]]]
+
+        split = farthest > tolerance2
+        at = index[hits][split]
+        keep[at] = True
+        first = numpy.concatenate((first[split], at))
+        last = numpy.concatenate((at, last[split]))
+
+    # ranges still above the tolerance after the last pass keep all
+    # their vertices
+    cover = numpy.zeros(len(keep) + 1, dtype=numpy.int64)
+    cover[first] += 1
+    cover[last] -= 1
+    keep |= numpy.cumsum(cover[:-1]) > 0
+    return keep
+
+
+def simplify(points, types, lines, tolerance):
+    """Simplify segments with Douglas-Peucker.
+
+    points is a (N, 2, 3) array of segment start and end points, types and
+    lines are per segment. Connected runs of segments with the same type
+    are treated as polylines, every kept segment gets the type and line
+    number of the first segment it replaces. The polylines are first
+    decimated on a grid, the total error stays below the tolerance.
+    """
+    count = len(types)
+    if count < 3:
+        return points, types, lines
+
+    breaks = numpy.ones(count, dtype=bool)
+    breaks[1:] = ((types[1:] != types[:-1]) |
+                  numpy.any(points[1:, 0] != points[:-1, 1], axis=1))
+    run = numpy.cumsum(breaks) - 1
+    runs = run[-1] + 1
+
+    # vertices of the polylines: the start of every segment and the end
+    # of the last segment of every run
+    starts = numpy.arange(count) + run
+    ends = numpy.append(numpy.flatnonzero(breaks)[1:], count) + numpy.arange(runs)
+    vertices = numpy.empty((count + runs, 3), dtype=points.dtype)
+    vertices[starts] = points[:, 0]
+    vertices[ends] = points[ends - numpy.arange(runs) - 1, 1]
+    segment = numpy.full(count + runs, -1, dtype=numpy.int64)
+    segment[starts] = numpy.arange(count)
+
+    fixed = numpy.zeros(count + runs, dtype=bool)
+    fixed[ends] = True
+    fixed[starts[breaks]] = True
+    fixed[::LOD_CHUNK] = True
+
+    grid = grid_decimate(vertices, fixed, LOD_GRID * tolerance / numpy.sqrt(3))
+    kept = numpy.flatnonzero(grid)
+    kept = kept[douglas_peucker(vertices[kept], fixed[kept],
+                                (1 - LOD_GRID) * tolerance)]
+
+    # every kept vertex but the run ends starts a segment, the run end is
+    # always kept so the next kept vertex is in the same run
+    first = segment[kept[:-1]] >= 0
+    start, end = kept[:-1][first], kept[1:][first]
+    out_points = numpy.stack((vertices[start], vertices[end]), axis=1)
+    return out_points, types[segment[start]], lines[segment[start]]
+
+
+def build_levels(points, types, lines, canceled=None):
+    """Return [(tolerance, points, types, lines), ...], finest first.
+
+    Level 0 is the program itself, the coarser levels are only built for
+    big programs and as long as they really reduce the segment count.
+    The canceled callback is checked before every level.
+    """
+    levels = [(0.0, points, types, lines)]
+    if len(types) < LOD_MIN_SEGMENTS:
+        return levels
+
+    flat = points.reshape(-1, 3)
+    diagonal = numpy.linalg.norm(flat.max(axis=0) - flat.min(axis=0))
+    if diagonal == 0:
+        return levels
+
+    tolerance = float(diagonal) / LOD_DIVISION
+    for i in range(LOD_MAX_LEVELS):
+        if canceled is not None and canceled():
+            break
+        previous = levels[-1]
+        level = simplify(previous[1], previous[2], previous[3], tolerance)
+        if len(level[1]) > 0.8 * len(previous[2]):
+            break
+        levels.append((tolerance,) + level)
+        tolerance *= LOD_STEP
+    return levels
+
+
+def select_level(tolerances, pixel_size):
+    """Index of the coarsest level with an error below one pixel."""
+    index = 0
+    for i, tolerance in enumerate(tolerances):
+        if tolerance <= pixel_size:
+            index = i
+    return index
+
+
+class LevelBuilder(QThread):
+    """Build the levels of detail of a program off the GUI thread.
+
+    The built signal hands the coarser levels, [(tolerance, points,
+    types, lines), ...], to the GUI thread, the viewer draws the full
+    resolution program until then. After cancel() the levels are never
+    emitted.
+    """
+    built = pyqtSignal(object)
+
+    # A running QThread must not be deleted, the builders are kept here
+    # until they finish
+    running = set()
+
+    def __init__(self, points, types, lines):
+        QThread.__init__(self)
+        self.program = points, types, lines
+        self.canceled = False
+        self.finished.connect(self.done)
+
+    def start(self):
+        LevelBuilder.running.add(self)
+        QThread.start(self, QThread.LowPriority)
+
+    def cancel(self):
+        self.canceled = True
+
+    def done(self):
+        LevelBuilder.running.discard(self)
+
+    def run(self):
+        program, self.program = self.program, None
+        try:
+            levels = build_levels(*program, canceled=lambda: self.canceled)
+        except Exception as e:
+            printError(_("Failed to build the toolpath levels of detail: {}", e))
+            return
+        if len(levels) > 1 and not self.canceled:
+            self.built.emit(levels[1:])
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - background gcode preview loader
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['Progress', 'DummyProgress', 'PreviewLoader', 'count_lines']
+
+from alterx.common.locale import _
+from alterx.common.compat import *
+from alterx.common import *
+from alterx.gui.util import *
+from alterx.core.linuxcnc import *
+from .cache import PREVIEW_CACHE
+
+import multiprocessing
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Canon callbacks that are recorded in the worker and replayed on the
+# canon of the viewer. Queries (get_tool, get_axis_mask...) are answered
+# by the worker itself from a copy of the status.
+CANON_CALLS = (
+    'next_line', 'comment', 'message',
+    'set_g5x_offset', 'set_g92_offset', 'set_xy_rotation',
+    'set_plane', 'select_plane', 'set_feed_rate', 'set_spindle_rate',
+    'tool_offset', 'change_tool',
+    'straight_traverse', 'straight_feed', 'straight_probe', 'rigid_tap',
+    'arc_feed', 'dwell', 'user_defined_function',
+)
+
+# Interpreter state attributes passed to next_line
+STATE_FIELDS = (
+    'block', 'cutter_side', 'distance_mode', 'feed_mode', 'feed_rate',
+    'flood', 'gcodes', 'mcodes', 'mist', 'motion_mode', 'origin', 'units',
+    'overrides', 'path_mode', 'plane', 'retract_mode', 'sequence_number',
+    'speed', 'spindle', 'stopping', 'tool_length_offset', 'toolchange',
+)
+
+CHUNK_SIZE = 5000
+
+# Partial drawing of the toolpath while loading: first after
+# PARTIAL_FIRST seconds, then every time with a twice longer interval
+# (up to PARTIAL_MAX), so the redraws never dominate the load time.
+PARTIAL_FIRST = 0.2
+PARTIAL_MAX = 3.0
+
+# The finished worker is joined from a timer every REAP_INTERVAL ms and
+# terminated when it is still alive after REAP_TIMEOUT seconds
+REAP_INTERVAL = 50
+REAP_TIMEOUT = 0.5
+
+
+class DummyProgress:
+    def nextphase(self, unused): pass
+    def progress(self): pass
+    def update(self, count, force=0): pass
+
+
+class Progress:
+    def __init__(self, phases, total):
+        self.num_phases = phases
+        self.phase = 0
+        self.total = total or 1
+        self.lastcount = 0
+        self.text = None
+
+    def update(self, count, force=0):
+        if force or count - self.lastcount > 400:
+            fraction = (self.phase + count * 1. / self.total) / self.num_phases
+            self.lastcount = count
+            self.emit_percent(int(fraction *100))
+
+    # this is class patched
+    def emit_percent(self, percent):
+        pass
+
+    def nextphase(self, total):
+        self.phase += 1
+        self.total = total or 1
+        self.lastcount = -100
+        self.update(0, True)
+
+    def set_total(self, total):
+        self.total = total or 1
+
+    def done(self):
+        self.emit_percent(-1)
+
+    # not sure if this is used - copied from AXIS code
+    def set_text(self, text):
+        if self.text is None:
+            self.text = ".info.progress"
+        else:
+            printInfo(_("GL Info progress: {}", text))
+
+
+def count_lines(filename):
+    """Number of lines in a file, the last one may have no newline"""
+    count = 0
+    last = b'\n'
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            count += data.count(b'\n')
+            last = data[-1:]
+    return count + (last != b'\n')
+
+
+class preview_state(object):
+    """Picklable copy of the interpreter state given to next_line"""
+    def __init__(self, st):
+        for name in STATE_FIELDS:
+            setattr(self, name, getattr(st, name, None))
+
+
+class preview_stat(object):
+    """Status fields the interpreter asks the canon about"""
+    def __init__(self, stat):
+        self.tool_table = [tuple(t) for t in (stat.tool_table or ())]
+        self.angular_units = stat.angular_units
+        self.linear_units = stat.linear_units
+        self.axis_mask = stat.axis_mask
+        self.block_delete = stat.block_delete
+
+
+class preview_canon(object):
+    """Canon used in the worker process.
+
+    It answers the interpreter queries and records every motion callback
+    into chunks that are sent back to the GUI process.
+    """
+    def __init__(self, stat, random, parameter_file, output, abort):
+        self.s = stat
+        self.tools = list(stat.tool_table)
+        self.random = random
+        self.parameter_file = parameter_file
+        self.output = output
+        self.abort = abort
+        self.chunk = []
+        self.lineno = 0
+
+    def record(self, name, args):
+        self.chunk.append((name, args))
+        if len(self.chunk) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.put(('calls', self.chunk, self.lineno))
+            self.chunk = []
+
+    def put(self, message):
+        # the queue is bounded, so a slow GUI throttles the worker
+        while True:
+            self.check_abort()
+            try:
+                self.output.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def check_abort(self):
+        if self.abort.is_set():
+            raise KeyboardInterrupt
+
+    def next_line(self, st):
+        self.lineno = st.sequence_number
+        self.record('next_line', (preview_state(st),))
+
+    def change_tool(self, pocket):
+        if self.random:
+            self.tools[0], self.tools[pocket] = self.tools[pocket], self.tools[0]
+        elif pocket == 0:
+            self.tools[0] = (-1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                             0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+        else:
+            self.tools[0] = self.tools[pocket]
+        self.record('change_tool', (pocket,))
+
+    def get_tool(self, pocket):
+        if pocket >= 0 and pocket < len(self.tools):
+            return tuple(self.tools[pocket])
+        return -1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0
+
+    def get_external_angular_units(self):
+        return self.s.angular_units or 1.0
+
+    def get_external_length_units(self):
+        return self.s.linear_units or 1.0
+
+    def get_axis_mask(self):
+        return self.s.axis_mask
+
+    def get_block_delete(self):
+        return self.s.block_delete
+
+
+def _recorder(name):
+    def call(self, *args):
+        self.record(name, args)
+    call.__name__ = str(name)
+    return call
+
+for _name in CANON_CALLS:
+    if not hasattr(preview_canon, _name):
+        setattr(preview_canon, _name, _recorder(_name))
+
+
+def preview_worker(output, abort, filename, unitcode, initcode,
+                   parameter_file, stat, random, cache):
+    canon = preview_canon(stat, random, parameter_file, output, abort)
+    try:
+        # the key hashes the whole program, it is computed here and not
+        # on the GUI thread
+        if cache is not None:
+            key = PREVIEW_CACHE.key(*cache)
+            state = PREVIEW_CACHE.get(key)
+            if state is not None:
+                canon.put(('cached', state))
+                return
+            canon.put(('key', key))
+        canon.put(('lines', count_lines(filename)))
+        result, seq = GCODE.parse(filename, canon, unitcode, initcode)
+        canon.flush()
+        canon.put(('done', result, seq))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        output.put(('error', str(e)))
+
+
+class PreviewLoader(QObject):
+    """Parse a gcode file in a worker process and replay the canon calls.
+
+    The interpreter runs in a child process, the recorded callbacks come
+    back in chunks and are replayed on the viewer canon from a timer,
+    at most 'budget' seconds per tick, so the GUI keeps running while a
+    big program is loaded. Cancel the load with cancel(), the worker is
+    terminated and reaped from a timer, so cancel() never blocks.
+
+    The worker counts the lines of the file first, the count sets the
+    progress total and the linecount of the canon when it has one.
+
+    When start() is given the preview cache key arguments, the worker
+    looks the program up in PREVIEW_CACHE. A cached state is passed to
+    the restored callback instead of parsing the file, otherwise the
+    key of the new entry is kept in the key attribute.
+
+    If a partial callback is given, it is called between chunks while the
+    load goes on, so the viewer can draw the part of the program parsed
+    so far.
+    """
+    def __init__(self, canon, progress, finished, budget=0.02, partial=None,
+                 restored=None):
+        super(PreviewLoader, self).__init__()
+        self.canon = canon
+        self.progress = progress
+        self.finished = finished
+        self.partial = partial
+        self.restored = restored
+        self.budget = budget
+        self.process = None
+        self.pending = None
+        self.result = None
+        self.lines = None
+        self.key = None
+        self.partial_time = 0
+        self.partial_interval = PARTIAL_FIRST
+
+        self.queue = multiprocessing.Queue(32)
+        self.abort = multiprocessing.Event()
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.replay)
+
+    def start(self, filename, unitcode, initcode, parameter_file, random=0,
+              cache=None):
+        self.process = multiprocessing.Process(target=preview_worker,
+            args=(self.queue, self.abort, filename, unitcode, initcode,
+                  parameter_file, preview_stat(STAT), random, cache))
+        self.process.daemon = True
+        self.process.start()
+        self.partial_time = time.time()
+        self.partial_interval = PARTIAL_FIRST
+        self.timer.start(10)
+
+    def running(self):
+        return self.timer.isActive()
+
+    def cancel(self):
+        if not self.running():
+            return
+        self.abort.set()
+        self.stop(terminate=True)
+
+    def stop(self, terminate=False):
+        self.timer.stop()
+        process, self.process = self.process, None
+        if process is not None:
+            if terminate:
+                process.terminate()
+            self.reap(process, time.time() + REAP_TIMEOUT)
+
+    # Wait for the worker from a timer, the GUI thread never blocks on it.
+    # A worker still running after the timeout is terminated
+    def reap(self, process, deadline):
+        if process.is_alive():
+            if time.time() > deadline:
+                process.terminate()
+            QTimer.singleShot(REAP_INTERVAL,
+                lambda: self.reap(process, deadline))
+            return
+        process.join()
+
+    def replay(self):
+        start = time.time()
+        while time.time() - start < self.budget:
+            if self.pending is None:
+                try:
+                    message = self.queue.get_nowait()
+                except queue.Empty:
+                    if self.process is None or self.process.is_alive():
+                        return
+                    # the worker may have put its last message just before
+                    # it exited, read the queue once more before giving up
+                    try:
+                        message = self.queue.get(timeout=0.1)
+                    except queue.Empty:
+                        printError(_("Preview worker exited unexpectedly"))
+                        self.complete(GCODE.MIN_ERROR + 1, 0)
+                        return
+
+                if message[0] == 'key':
+                    self.key = message[1]
+                    continue
+                elif message[0] == 'cached':
+                    self.stop()
+                    self.restored(message[1])
+                    return
+                elif message[0] == 'lines':
+                    self.lines = message[1]
+                    self.progress.set_total(self.lines)
+                    if hasattr(self.canon, 'linecount'):
+                        self.canon.linecount = self.lines
+                    continue
+                elif message[0] == 'calls':
+                    self.pending = iter(message[1])
+                    self.progress.update(message[2])
+                elif message[0] == 'done':
+                    self.complete(message[1], message[2])
+                    return
+                else:
+                    printError(_("Preview worker error: {}", message[1]))
+                    self.complete(GCODE.MIN_ERROR + 1, 0)
+                    return
+
+            canon = self.canon
+            for count, (name, args) in enumerate(self.pending):
+                method = getattr(canon, name, None)
+                if method is not None:
+                    method(*args)
+                if count % 256 == 255 and time.time() - start > self.budget:
+                    return
+            self.pending = None
+            self.draw_partial()
+
+    def draw_partial(self):
+        if self.partial is None:
+            return
+        now = time.time()
+        if now - self.partial_time < self.partial_interval:
+            return
+        self.partial()
+        # measure from the end of the draw, a slow draw delays the next one
+        self.partial_time = time.time()
+        self.partial_interval = min(self.partial_interval * 2, PARTIAL_MAX)
+
+    def complete(self, result, seq):
+        self.stop()
+        self.result = (result, seq)
+        self.finished(result, seq)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - program distance and run time estimate
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['segment_arrays', 'program_arrays', 'pack_program', 'pack_segments',
+           'machine_limits', 'program_stats', 'simulate', 'format_run_time',
+           'gcode_properties']
+
+from alterx.common.locale import _
+
+import itertools
+import os
+
+import numpy
+
+# Path deviation allowed at a corner, in canon units (inch). Sets the
+# corner speed of the junction model, like the blend tolerance of the
+# trajectory planner.
+JUNCTION_DEVIATION = 0.0005
+# Stand in for a missing acceleration limit, keeps the sums finite
+MAX_ACCEL = 1e9
+# Distance under which the end and the next start are the same point
+CONTINUITY = 1e-9
+
+PROGRAM_LISTS = ('traverse', 'feed', 'arcfeed')
+
+
+def segment_arrays(segments, feed=True):
+    """Pack canon segments into arrays.
+
+    Returns line numbers, (N, 3) start and end points and the feed rates,
+    traverse segments have no feed rate and get None.
+    """
+    count = len(segments)
+    lines = numpy.fromiter((s[0] for s in segments), numpy.int32, count)
+    starts = numpy.fromiter(itertools.chain.from_iterable(
+        s[1][:3] for s in segments), numpy.float64, count * 3).reshape(-1, 3)
+    ends = numpy.fromiter(itertools.chain.from_iterable(
+        s[2][:3] for s in segments), numpy.float64, count * 3).reshape(-1, 3)
+    feeds = None
+    if feed:
+        feeds = numpy.fromiter((s[3] for s in segments), numpy.float64, count)
+    return lines, starts, ends, feeds
+
+
+class program_arrays(object):
+    """Segments of a loaded program packed for the estimates.
+
+    'lists' maps every name of PROGRAM_LISTS to the segment_arrays of
+    the list. 'order' puts the concatenated lists in program order,
+    'tools' and 'stops' are the tool of every segment and the flag of
+    the segments that start after a dwell or a tool change, both in
+    program order. 'dwells' are (line, seconds, tool) tuples.
+    """
+    def __init__(self, lists, order, tools, stops, dwell_time, dwells):
+        self.lists = lists
+        self.sizes = [len(lists[name][0]) for name in PROGRAM_LISTS]
+        self.order = order
+        self.tools = tools
+        self.stops = stops
+        self.dwell_time = dwell_time
+        self.dwells = dwells
+
+
+def pack_program(canon):
+    """Pack the segment lists of a canon once for all the estimates."""
+    lists = dict((name, segment_arrays(getattr(canon, name), name != 'traverse'))
+                 for name in PROGRAM_LISTS)
+    sizes = [len(lists[name][0]) for name in PROGRAM_LISTS]
+    order, tools, stops = program_order(getattr(canon, 'runs', None),
+        [lists[name][0] for name in PROGRAM_LISTS], sizes)
+    return program_arrays(lists, order, tools, stops, canon.dwell_time,
+                          getattr(canon, 'dwell_times', None) or [])
+
+
+def pack_segments(points, types, lines, feeds, tools, sequence, codes,
+                  dwell_time=0.0, dwells=()):
+    """Pack segment arrays for the estimates.
+
+    'points' are the (N, 2, 3) start and end points, 'types' the segment
+    type codes and 'sequence' the execution order of the segments, which
+    is not the line order with loops and subroutines. 'codes' has the
+    code of every name of PROGRAM_LISTS and of 'dwell', other types are
+    skipped. The path stops at tool changes and at dwell segments,
+    'dwells' are the (line, seconds, tool) tuples of the dwells.
+    """
+    order = numpy.argsort(sequence, kind='mergesort')
+    points, types, lines = points[order], types[order], lines[order]
+    feeds, tools = feeds[order], tools[order]
+    # number of dwells before every segment
+    dwelled = numpy.cumsum(types == codes['dwell'])
+
+    lists = {}
+    positions = []
+    for name in PROGRAM_LISTS:
+        index = numpy.nonzero(types == codes[name])[0]
+        lists[name] = (lines[index], points[index, 0], points[index, 1],
+                       feeds[index] if name != 'traverse' else None)
+        positions.append(index)
+    order = numpy.argsort(numpy.concatenate(positions), kind='mergesort')
+
+    tools = numpy.concatenate([tools[i] for i in positions])[order]
+    dwelled = numpy.concatenate([dwelled[i] for i in positions])[order]
+    stops = numpy.zeros(len(order), dtype=bool)
+    if len(order):
+        stops[0] = True
+        stops[1:] = (tools[1:] != tools[:-1]) | (dwelled[1:] != dwelled[:-1])
+    return program_arrays(lists, order, tools, stops, dwell_time, list(dwells))
+
+
+def machine_limits(inifile, coordinates="XYZ"):
+    """Velocity and acceleration limits of X, Y and Z from the ini file.
+
+    Returns two arrays of three values, an axis without a limit gets inf.
+    [AXIS_n] values are used if set, otherwise the slowest of the joints
+    of the axis in coordinates. A [TRAJ] MAX_LINEAR_ACCELERATION caps
+    every axis.
+    """
+    def limit(axis, name):
+        value = inifile.find("AXIS_" + axis, name)
+        if value:
+            return float(value)
+        joints = [float(inifile.find("JOINT_%d" % j, name) or numpy.inf)
+                  for j, c in enumerate(letters) if c == axis]
+        return min(joints or [numpy.inf])
+
+    # COORDINATES may be 'XYZ' or 'X Y Z', one letter per joint
+    letters = "".join(coordinates).replace(" ", "").upper()
+    velocity = numpy.full(3, numpy.inf)
+    accel = numpy.full(3, numpy.inf)
+    for i, axis in enumerate("XYZ"):
+        velocity[i] = limit(axis, "MAX_VELOCITY")
+        accel[i] = limit(axis, "MAX_ACCELERATION")
+    linear = inifile.find("TRAJ", "MAX_LINEAR_ACCELERATION")
+    if linear:
+        accel = numpy.minimum(accel, float(linear))
+    return velocity, accel
+
+
+def direction_limit(directions, limits):
+    # the largest rate along every unit direction with no axis over its limit
+    with numpy.errstate(divide='ignore'):
+        ratio = limits / numpy.abs(directions)
+    return ratio.min(axis=1)
+
+
+def move_time(length, velocity, accel):
+    """Time of moves from rest to rest with a trapezoidal velocity profile."""
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        velocity = numpy.minimum(velocity, numpy.sqrt(length * accel))
+        time = length / velocity + velocity / accel
+    return numpy.where(length > 0, time, 0.0)
+
+
+def moves(lines, starts, ends):
+    # first segment of every move, a move is a connected run of segments
+    # of one gcode line, e.g. an arc split into segments
+    count = len(lines)
+    breaks = numpy.ones(count, dtype=bool)
+    breaks[1:] = ((lines[1:] != lines[:-1]) |
+                  numpy.any(starts[1:] != ends[:-1], axis=1))
+    return numpy.nonzero(breaks)[0]
+
+
+def list_stats(arrays, max_speed, max_velocity, max_accel):
+    # distance, feed limited time and acceleration aware time of one list
+    lines, starts, ends, feeds = arrays
+    if not len(lines):
+        return 0.0, 0.0, 0.0
+    delta = ends - starts
+    length = numpy.sqrt(numpy.einsum('ij,ij->i', delta, delta))
+
+    velocity = numpy.full(len(length), max_speed)
+    if feeds is not None:
+        velocity = numpy.minimum(velocity, feeds)
+    time = numpy.sum(length / velocity)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        directions = numpy.where(length[:, None] > 0,
+                                 delta / length[:, None], 0.0)
+    velocity = numpy.minimum(velocity, direction_limit(directions, max_velocity))
+    accel = direction_limit(directions, max_accel)
+
+    first = moves(lines, starts, ends)
+    accel_time = numpy.sum(move_time(
+        numpy.add.reduceat(length, first),
+        numpy.minimum.reduceat(velocity, first),
+        numpy.minimum.reduceat(accel, first)))
+    return float(numpy.sum(length)), float(time), float(accel_time)
+
+
+def program_stats(program, max_speed, max_velocity, max_accel):
+    """Distances and run time estimates of a packed program.
+
+    Returns a dict with the traverse and feed distances, the run time with
+    every segment at its feed rate (time) and an estimate where every move
+    accelerates from rest and stops at its end (accel_time). Arcs count as
+    one move. Distances are in canon units, the rates must use the same.
+    """
+    traverse, feed, arcfeed = [
+        list_stats(program.lists[name], max_speed, max_velocity, max_accel)
+        for name in PROGRAM_LISTS]
+
+    dwell = program.dwell_time
+    return dict(
+        traverse=traverse[0],
+        feed=feed[0] + arcfeed[0],
+        time=traverse[1] + feed[1] + arcfeed[1] + dwell,
+        accel_time=traverse[2] + feed[2] + arcfeed[2] + dwell,
+    )
+
+
+def program_order(runs, lines, sizes):
+    """Indices of the segments of all lists in program order.
+
+    The segments are indexed as if traverse, feed and arcfeed were
+    concatenated, 'runs' are the runs recorded by the canon and 'lines'
+    the line numbers of every list. Returns the order, the tool of every
+    segment and a flag for every segment that starts after a dwell or a
+    tool change.
+    """
+    total = sum(sizes)
+    if not runs:
+        # no recorded order, sort by line number
+        lines = numpy.concatenate(lines)
+        return (numpy.argsort(lines, kind='mergesort'),
+                numpy.zeros(total, numpy.int32), numpy.zeros(total, bool))
+
+    kinds = numpy.array([PROGRAM_LISTS.index(r[0]) for r in runs])
+    firsts = numpy.array([r[1] for r in runs], dtype=numpy.int64)
+    tools = numpy.array([r[2] for r in runs], dtype=numpy.int32)
+    stops = numpy.array([r[3] for r in runs], dtype=bool)
+
+    # a run ends where the next run of the same list starts
+    counts = numpy.empty(len(runs), dtype=numpy.int64)
+    bases = numpy.cumsum((0,) + tuple(sizes[:-1]))
+    for kind, size in enumerate(sizes):
+        mask = kinds == kind
+        first = firsts[mask]
+        counts[mask] = numpy.append(first[1:], size) - first
+    starts = bases[kinds] + firsts
+
+    offsets = numpy.cumsum(counts) - counts
+    order = numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())
+    run_start = numpy.zeros(len(order), dtype=bool)
+    run_start[offsets[counts > 0]] = stops[counts > 0]
+    return order, numpy.repeat(tools, counts), run_start
+
+
+def segment_time(length, v0, v1, vmax, accel):
+    # accelerate from v0, cruise at the reachable peak, decelerate to v1
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        peak = numpy.minimum(vmax, numpy.sqrt(
+            accel * length + (v0 * v0 + v1 * v1) / 2))
+        accel_dist = (2 * peak * peak - v0 * v0 - v1 * v1) / (2 * accel)
+        cruise = numpy.maximum(length - accel_dist, 0) / peak
+        time = (2 * peak - v0 - v1) / accel + cruise
+    return numpy.where(length > 0, time, 0.0)
+
+
+def simulate(program, max_speed, max_velocity, max_accel, override=1.0,
+             deviation=JUNCTION_DEVIATION):
+    """Cycle time of a packed program with a lookahead junction model.
+
+    The segments of the canon lists are put in program order, every
+    segment gets its velocity limit (feed rate times override, max_speed
+    and the axis limits along its direction) and acceleration limit.
+    Corners limit the speed by the junction deviation, the path stops
+    at gaps, dwells and tool changes. The lookahead over the whole
+    program is done with cumulative minimums: v^2/2 at a junction can
+    not exceed v^2/2 at any later (earlier) junction plus the
+    acceleration times the distance between them.
+
+    Returns a dict with the total time, and the time per line and per
+    tool as (numbers, seconds) arrays. Units as in program_stats.
+    """
+    arrays = [program.lists[name] for name in PROGRAM_LISTS]
+    sizes = program.sizes
+    order, tools, stops = program.order, program.tools, program.stops
+
+    lines = numpy.concatenate([a[0] for a in arrays])[order]
+    starts = numpy.concatenate([a[1] for a in arrays])[order]
+    ends = numpy.concatenate([a[2] for a in arrays])[order]
+    feeds = numpy.concatenate([numpy.full(sizes[0], numpy.inf)] +
+                              [a[3] * override for a in arrays[1:]])[order]
+
+    delta = ends - starts
+    length = numpy.sqrt(numpy.einsum('ij,ij->i', delta, delta))
+    # zero length moves take no time, a stop before one is kept
+    keep = numpy.nonzero(length > 0)[0]
+    # a stop on a skipped move moves to the next kept one
+    stop_at = numpy.cumsum(stops)
+    stopped = stop_at[keep] > numpy.concatenate(([0], stop_at[keep[:-1]]))
+    lines, tools, delta, length = lines[keep], tools[keep], delta[keep], length[keep]
+    starts, ends, feeds = starts[keep], ends[keep], feeds[keep]
+
+    direction = delta / length[:, None]
+    vmax = numpy.minimum(numpy.minimum(feeds, max_speed),
+                         direction_limit(direction, max_velocity))
+    accel = numpy.minimum(direction_limit(direction, max_accel), MAX_ACCEL)
+
+    # junction speed limits, v^2/2, at the start of every segment and the end
+    count = len(length)
+    cap = numpy.zeros(count + 1)
+    if count > 1:
+        cos = numpy.einsum('ij,ij->i', direction[:-1], direction[1:])
+        sin_half = numpy.sqrt(numpy.clip(0.5 * (1 + cos), 0, 1))
+        with numpy.errstate(divide='ignore'):
+            corner = (numpy.minimum(accel[:-1], accel[1:]) * deviation *
+                      sin_half / (1 - sin_half))
+        corner = numpy.minimum(corner, numpy.minimum(vmax[:-1], vmax[1:]) ** 2)
+        gap = numpy.any(numpy.abs(starts[1:] - ends[:-1]) > CONTINUITY, axis=1)
+        cap[1:-1] = numpy.where(gap | stopped[1:], 0, corner / 2)
+
+    # lookahead, backward then forward
+    reach = numpy.concatenate(([0], numpy.cumsum(accel * length)))
+    energy = numpy.minimum(cap, numpy.minimum.accumulate(
+        (cap + reach)[::-1])[::-1] - reach)
+    energy = numpy.minimum(energy, numpy.minimum.accumulate(energy - reach) + reach)
+    speed = numpy.sqrt(2 * numpy.maximum(energy, 0))
+    time = segment_time(length, speed[:-1], speed[1:], vmax, accel)
+
+    dwells = program.dwells
+    if dwells:
+        lines = numpy.append(lines, [d[0] for d in dwells])
+        tools = numpy.append(tools, [d[2] for d in dwells])
+        time = numpy.append(time, [d[1] for d in dwells])
+    total = float(time.sum())
+    if not dwells:
+        total += program.dwell_time
+
+    return dict(time=total, lines=breakdown(lines, time),
+                tools=breakdown(tools, time))
+
+
+def breakdown(keys, time):
+    # total time of every key, as sorted (keys, seconds) arrays
+    if not len(keys):
+        return numpy.zeros(0, numpy.int32), numpy.zeros(0)
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    return unique, numpy.bincount(inverse, weights=time)
+
+
+def format_run_time(seconds):
+    if seconds > 120:
+        return _("%.1f Minutes") % (seconds/60)
+    return _("%d Ceconds") % (int(seconds))
+
+
+def gcode_properties(program, filename, lines, inifile, coordinates,
+                     linear_units, metric, max_override=1.0, extents=None):
+    """Program info of a loaded program, shared by the path viewers.
+
+    Returns the gcode properties dict: name, size, traverse and feed
+    distances, the run time estimates (Run*) with the per tool and the
+    slowest lines breakdown, run_time with the plain numbers and the
+    X, Y and Z 'extents', (min, max) in canon units, if given.
+    'linear_units' are the machine units per mm of the status, the ini
+    limits are converted with it to canon units (inch). 'metric' selects
+    the units of the distances.
+    """
+    props = {}
+    ext = os.path.splitext(filename)[1]
+    program_filter = None
+    if ext:
+        program_filter = inifile.find("FILTER", ext[1:])
+    name = os.path.basename(filename)
+    if program_filter:
+        props['name'] = _("generated from %s") % name
+    else:
+        props['name'] = name
+
+    size = os.stat(filename).st_size
+    props['size'] = _("%(size)s bytes\n%(lines)s gcode lines") % {'size': size, 'lines': lines}
+
+    if metric:
+        conv = 25.4
+        units = "mm"
+        fmt = "%.3f"
+    else:
+        conv = 1
+        units = "in"
+        fmt = "%.4f"
+
+    max_speed = float(
+        inifile.find("DISPLAY","MAX_LINEAR_VELOCITY")
+        or inifile.find("TRAJ","MAX_LINEAR_VELOCITY")
+        or inifile.find("AXIS_X","MAX_VELOCITY")
+        or 1)
+    max_velocity, max_accel = machine_limits(inifile, coordinates)
+    # ini limits are in machine units, the canon in internal units
+    scale = (linear_units or 1) * 25.4
+    max_speed, max_velocity, max_accel = (
+        max_speed / scale, max_velocity / scale, max_accel / scale)
+
+    stats = program_stats(program, max_speed, max_velocity, max_accel)
+    simulation = simulate(program, max_speed, max_velocity, max_accel)
+
+    props['G0'] = "%f %s".replace("%f", fmt) % (stats['traverse'] * conv, units)
+    props['gG1'] = "%f %s".replace("%f", fmt) % (stats['feed'] * conv, units)
+    props['Run'] = format_run_time(stats['time'])
+    props['Run_exact_stop'] = format_run_time(stats['accel_time'])
+    props['Run_accel'] = format_run_time(simulation['time'])
+
+    tools, seconds = simulation['tools']
+    props['Run_tools'] = "\n".join(_("T%(tool)d: %(time)s") % {
+        'tool': tool, 'time': format_run_time(t)}
+        for tool, t in zip(tools, seconds))
+    # the slowest lines first
+    line_numbers, seconds = simulation['lines']
+    slowest = seconds.argsort()[::-1][:10]
+    props['Run_lines'] = "\n".join(_("Line %(line)d: %(time)s") % {
+        'line': line_numbers[i], 'time': format_run_time(seconds[i])}
+        for i in slowest)
+    # plain lists, the properties are compared and pickled
+    props['run_time'] = dict(time=simulation['time'],
+        tools=list(zip(tools.tolist(), simulation['tools'][1].tolist())),
+        lines=list(zip(line_numbers.tolist(), seconds.tolist())))
+
+    # best case, feed override at its maximum
+    if max_override > 1:
+        props['Run_max_override'] = format_run_time(simulate(
+            program, max_speed, max_velocity, max_accel, max_override)['time'])
+
+    if extents is not None:
+        for (i, c) in enumerate("XYZ"):
+            a = extents[0][i] * conv
+            b = extents[1][i] * conv
+            if a != b:
+                props[c] = _("%(a)f to %(b)f = %(diff)f %(units)s").replace("%f", fmt) % {'a': a, 'b': b, 'diff': b-a, 'units': units}
+    props['Units'] = units
+    return props
@@ -31,7 +31,11 @@ from alterx.core.linuxcnc import *
 import shutil
 import os
 
+from functools import partial
+
 from . import base_canon
+from ..preview import Progress, PreviewLoader
+from ..cache import PREVIEW_CACHE
 
 class BaseBackPlot(object):
     def __init__(self, canon=base_canon.BaseCanon):
@@ -44,10 +48,13 @@ class BaseBackPlot(object):
         self.parameter_file = INFO.parameter_file
         self.temp_parameter_file = os.path.join(self.parameter_file + '.bak')
         self.last_filename = None
+        self.loader = None
 
     def load(self, filename=None, *args, **kwargs):
         # args and kwargs are passed to the canon init method
 
+        self.cancel_load()
+
         filename = filename or self.last_filename
         if filename is None:
             filename = STAT.file
@@ -57,6 +64,8 @@ class BaseBackPlot(object):
             printDebug(_("3D plot, Can't load backplot, invalid file: {}",filename))
             # raise ValueError("Can't load backplot, invalid file: {}".format(filename))
             Notify.Error(_("3D plot, Can't load backplot, invalid file: {}",filename))
+            self.load_finished()
+            return
         self.last_filename = filename
 
         # create the object which handles the canonical motion callbacks
@@ -72,13 +81,39 @@ class BaseBackPlot(object):
         unitcode = "G%d" % (20 + (STAT.linear_units == 1))
         initcode = INI.find("RS274NGC", "RS274NGC_STARTUP_CODE") or ""
 
-        # THIS IS WHERE IT ALL HAPPENS: load_preview will execute the code,
-        # call back to the canon with motion commands, and record a history
-        # of all the movements.
+        # THIS IS WHERE IT ALL HAPPENS: the interpreter runs in a worker
+        # process, the canon motion callbacks are replayed on self.canon as
+        # they arrive and load_finished is called at the end.
+
+        # the line count comes from the preview worker
+        progress = Progress(1, None)
+        progress.emit_percent = self.emit_percent
+
+        cache = None
+        if PREVIEW_CACHE.enabled():
+            cache = (filename, self.parameter_file, initcode,
+                     unitcode, STAT.tool_table, self.random)
+
+        self.loader = PreviewLoader(self.canon, progress,
+            partial(self.preview_finished, filename, progress),
+            partial=self.load_partial,
+            restored=partial(self.preview_restored, filename, progress))
+        self.loader.start(filename, unitcode, initcode,
+                          self.temp_parameter_file, self.random, cache)
 
-        result, seq = GCODE.parse(filename, self.canon, unitcode, initcode)
+    def preview_restored(self, filename, progress, state):
+        printDebug(_("3D plot, preview loaded from cache: {}", filename))
+        self.canon.set_preview_state(state)
+        self.preview_finished(filename, progress, 0, 0)
 
-        if result > GCODE.MIN_ERROR:
+    def preview_finished(self, filename, progress, result, seq):
+        loader, self.loader = self.loader, None
+        progress.done()
+
+        if loader is not None and result is not None and result <= GCODE.MIN_ERROR:
+            PREVIEW_CACHE.store(loader.key, self.canon.get_preview_state())
+
+        if result is not None and result > GCODE.MIN_ERROR:
             msg = GCODE.strerror(result)
             fname = os.path.basename(filename)
             printDebug(_("3D plot, Error in {} line {}\n{}",fname, seq - 1, msg))
@@ -86,5 +121,29 @@ class BaseBackPlot(object):
             # raise SyntaxError("Error in %s line %i: %s" % (fname, seq - 1, msg))
 
         # clean up temp var file and the backup
-        os.unlink(self.temp_parameter_file)
-        os.unlink(self.temp_parameter_file + '.bak')
+        for name in (self.temp_parameter_file, self.temp_parameter_file + '.bak'):
+            if os.path.exists(name):
+                os.unlink(name)
+
+        if result is None:
+            self.canon = None
+        self.load_finished()
+
+    def cancel_load(self):
+        loader, self.loader = self.loader, None
+        if loader is not None:
+            printDebug(_("3D plot, load canceled: {}", self.last_filename))
+            loader.cancel()
+            loader.finished(None, None)
+
+    # called between chunks while the preview is loaded
+    def load_partial(self):
+        pass
+
+    # called when the preview is loaded or canceled
+    def load_finished(self):
+        pass
+
+    # this is class patched
+    def emit_percent(self, percent):
+        pass
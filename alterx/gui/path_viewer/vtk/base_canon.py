@@ -18,13 +18,92 @@
 from __future__ import division, absolute_import, print_function, unicode_literals
 
 import math
+import numpy
+
 from alterx.core.linuxcnc import GCODE 
 
+LINE_TYPES = ('traverse', 'arcfeed', 'feed', 'dwell', 'user')
+LINE_CODES = dict((name, code) for code, name in enumerate(LINE_TYPES))
+
+
+class PathBuffer(object):
+    """Growable numpy storage of path segments.
+
+    Every segment is kept as its start and end point (xyz only), the
+    line type code from LINE_CODES, the gcode line number, the feed rate,
+    the tool number and the sequence number of the segment in the whole
+    program, for the run time estimate. The arrays
+    grow by doubling, so appending is amortized O(1) and no per segment
+    python objects are kept alive.
+    """
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.points = numpy.empty((capacity, 2, 3), dtype=numpy.float64)
+        self.types = numpy.empty(capacity, dtype=numpy.uint8)
+        self.lines = numpy.empty(capacity, dtype=numpy.int32)
+        self.feeds = numpy.empty(capacity, dtype=numpy.float64)
+        self.tools = numpy.empty(capacity, dtype=numpy.int32)
+        self.sequence = numpy.empty(capacity, dtype=numpy.int64)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, capacity):
+        self.points = numpy.resize(self.points, (capacity, 2, 3))
+        self.types = numpy.resize(self.types, capacity)
+        self.lines = numpy.resize(self.lines, capacity)
+        self.feeds = numpy.resize(self.feeds, capacity)
+        self.tools = numpy.resize(self.tools, capacity)
+        self.sequence = numpy.resize(self.sequence, capacity)
+
+    def append(self, line_type, start, end, line, feed=0.0, tool=0,
+               sequence=0):
+        if self.count == len(self.types):
+            self.grow(max(1024, self.count * 2))
+        i = self.count
+        self.points[i, 0] = start[:3]
+        self.points[i, 1] = end[:3]
+        self.types[i] = LINE_CODES[line_type]
+        self.lines[i] = line
+        self.feeds[i] = feed
+        self.tools[i] = tool
+        self.sequence[i] = sequence
+        self.count = i + 1
+
+    def extend(self, points, types, lines, feeds=0.0, tools=0, sequence=0):
+        n = len(types)
+        if self.count + n > len(self.types):
+            self.grow(max(1024, (self.count + n) * 2))
+        self.points[self.count:self.count + n] = points
+        self.types[self.count:self.count + n] = types
+        self.lines[self.count:self.count + n] = lines
+        self.feeds[self.count:self.count + n] = feeds
+        self.tools[self.count:self.count + n] = tools
+        self.sequence[self.count:self.count + n] = sequence
+        self.count += n
+
+    def arrays(self):
+        """Return views of the used part of the buffers."""
+        n = self.count
+        return self.points[:n], self.types[:n], self.lines[:n]
+
+    def rates(self):
+        """Return views of the used part of the feed, tool and sequence
+        buffers."""
+        n = self.count
+        return self.feeds[:n], self.tools[:n], self.sequence[:n]
+
+    def clear(self):
+        self.__init__()
+
+
 class BaseCanon(object):
     def __init__(self):
 
         self.feedrate = 1
         self.dwell_time = 0
+        self.dwell_times = []
+        self.tool_number = 0
 
         self.seq_num = -1
         self.last_pos = (0,) * 9
@@ -271,6 +350,7 @@ class BaseCanon(object):
             return
 
         self.dwell_time += arg
+        self.dwell_times.append((self.seq_num, arg, self.tool_number))
         self.add_path_point('dwell', self.last_pos, self.last_pos)
 
     def get_external_angular_units(self):
@@ -308,6 +388,7 @@ class StatCanon(BaseCanon):
                              0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
         else:
             self.tools[0] = self.tools[pocket]
+        self.tool_number = self.tools[0][0]
 
     def get_tool(self, pocket):
         if pocket >= 0 and pocket < len(self.tools):
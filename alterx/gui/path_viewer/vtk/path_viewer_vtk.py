@@ -31,6 +31,7 @@ from alterx.core.linuxcnc import *
 
 from operator import add
 from collections import OrderedDict
+import math
 
 # Fix GLSL 1.50 is not supported bug
 os.putenv('MESA_GL_VERSION_OVERRIDE','3.3')
@@ -38,6 +39,7 @@ os.environ['MESA_GL_VERSION_OVERRIDE'] = '3.3'
 # Fix end
 
 import vtk
+import numpy
 
 # Fix poligons not drawing correctly on some GPU
 # https://stackoverflow.com/questions/51357630/vtk-rendering-not-working-as-expected-inside-pyqt?rq=1
@@ -46,10 +48,14 @@ vtk.qt.QVTKRWIBase = "QGLWidget"
 # Fix end
 
 from vtk.util.colors import tomato, yellow, mint
+from vtk.util import numpy_support
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
 from . import base_canon
 from . import base_backplot
+from .. import lod
+from .. import runtime
+from ..preview import count_lines
 
 COLOR_MAP = {
     'traverse': (188, 252, 201, 75),
@@ -85,6 +91,10 @@ class PathActor(vtk.vtkActor):
         self.poly_data = vtk.vtkPolyData()
         self.data_mapper = vtk.vtkPolyDataMapper()
 
+        self.levels = list()
+        self.level = None
+        self.builder = None
+
     def set_origin_index(self, index):
         self.origin_index = index
 
@@ -100,6 +110,46 @@ class PathActor(vtk.vtkActor):
     def get_axes(self):
         return self.axes_actor
 
+    def set_levels(self, levels):
+        self.cancel_levels()
+        self.levels = levels
+        self.level = None
+        self.set_level(0)
+
+    def build_levels(self, points, types, lines, make_poly_data, updated=None):
+        # the levels set so far are drawn until the coarser ones are built
+        builder = lod.LevelBuilder(points, types, lines)
+        builder.built.connect(lambda levels: self.levels_built(
+            builder, levels, make_poly_data, updated))
+        self.builder = builder
+        builder.start()
+
+    def levels_built(self, builder, levels, make_poly_data, updated):
+        if builder is not self.builder:
+            return
+        self.builder = None
+        self.levels = self.levels[:1] + [(tolerance, make_poly_data(p, t, l))
+                                         for tolerance, p, t, l in levels]
+        if updated is not None:
+            updated()
+
+    def cancel_levels(self):
+        if self.builder is not None:
+            self.builder.cancel()
+            self.builder = None
+
+    def set_level(self, index):
+        if index == self.level or index >= len(self.levels):
+            return
+        self.level = index
+        self.poly_data = self.levels[index][1]
+        self.data_mapper.SetInputData(self.poly_data)
+        self.data_mapper.Update()
+        self.SetMapper(self.data_mapper)
+
+    def select_level(self, pixel_size):
+        self.set_level(lod.select_level([l[0] for l in self.levels], pixel_size))
+
 
 class VTKCanon(base_canon.StatCanon):
     def __init__(self, colors=COLOR_MAP, *args, **kwargs):
@@ -120,13 +170,16 @@ class VTKCanon(base_canon.StatCanon):
         self.index_map[9] = 593
 
         self.path_colors = colors
+        self.linecount = None
+        # execution order of the segments of all the origins
+        self.sequence = 0
         self.path_actors = OrderedDict()
         self.path_points = OrderedDict()
 
         origin = 540
 
         self.path_actors[origin] = PathActor()
-        self.path_points[origin] = list()
+        self.path_points[origin] = base_canon.PathBuffer()
 
         self.origin = origin
         self.previous_origin = origin
@@ -141,7 +194,7 @@ class VTKCanon(base_canon.StatCanon):
         origin = self.index_map[index]
         if origin not in self.path_actors.keys():
             self.path_actors[origin] = PathActor()
-            self.path_points[origin] = list()
+            self.path_points[origin] = base_canon.PathBuffer()
 
             self.previous_origin = self.origin
             self.origin = origin
@@ -156,77 +209,125 @@ class VTKCanon(base_canon.StatCanon):
             self.ignore_next = True
             return
 
-        path_points = self.path_points.get(self.origin)
-
-        #gcode module anyway return inch values, convert to mm
-        start_point_list = list()
-        for point in end_point:
-            point *= 25.4
-            start_point_list.append(point)
-
-        end_point_list = list()
-        for point in end_point:
-            point *= 25.4
-            end_point_list.append(point)
-
-        line = list()
-        line.append(start_point_list)
-        line.append(end_point_list)
-
-        path_points.append((line_type, line))
+        # inch to mm conversion is done for the whole array in draw_lines
+        self.path_points[self.origin].append(line_type, start_point,
+            end_point, self.seq_num, self.feedrate, self.tool_number,
+            self.sequence)
+        self.sequence += 1
+
+    def make_poly_data(self, points, types, lines, colors):
+        count = len(types)
+        points = points.reshape(-1, 3)
+
+        # every segment is a separate two point cell
+        offsets = numpy.arange(0, 2 * count + 1, 2, dtype=numpy.int64)
+        connectivity = numpy.arange(2 * count, dtype=numpy.int64)
+
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+
+        vtk_lines = vtk.vtkCellArray()
+        if hasattr(vtk_lines, "SetOffsetsArray"):
+            vtk_lines.SetData(
+                numpy_support.numpy_to_vtk(offsets, deep=True,
+                    array_type=vtk.VTK_ID_TYPE),
+                numpy_support.numpy_to_vtk(connectivity, deep=True,
+                    array_type=vtk.VTK_ID_TYPE))
+        else:
+            # legacy layout: [npts, id0, id1, npts, id0, id1, ...]
+            cells = numpy.empty((count, 3), dtype=numpy.int64)
+            cells[:, 0] = 2
+            cells[:, 1:] = connectivity.reshape(-1, 2)
+            vtk_lines.SetCells(count,
+                numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(),
+                                                      deep=True))
+
+        vtk_colors = numpy_support.numpy_to_vtk(colors[types],
+            deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        vtk_colors.SetName("colors")
+
+        line_numbers = numpy_support.numpy_to_vtk(lines,
+            deep=True, array_type=vtk.VTK_INT)
+        line_numbers.SetName("line")
+
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(vtk_points)
+        poly_data.SetLines(vtk_lines)
+        poly_data.GetCellData().SetScalars(vtk_colors)
+        poly_data.GetCellData().AddArray(line_numbers)
+        return poly_data
+
+    def draw_lines(self, partial=False, updated=None):
+        # a partial draw shows what is parsed so far, the points are kept
+        # and no levels of detail are built. Otherwise they are built off
+        # the GUI thread and updated is called when they are ready
+        colors = numpy.array([self.path_colors[name]
+                              for name in base_canon.LINE_TYPES],
+                             dtype=numpy.uint8)
 
-    def draw_lines(self):
         for origin, data in self.path_points.items():
             path_actor = self.path_actors.get(origin)
             if not path_actor:
                 return
-            index = 0
 
-            end_point = None
-            last_line_type = None
+            points, types, lines = data.arrays()
 
-            for line_type, line_data in data:
-                # printDebug(line_type, end_point)
+            #gcode module anyway return inch values, convert to mm
+            points = points * 25.4
 
-                start_point = line_data[0]
-                end_point = line_data[1]
-                last_line_type = line_type
-
-                path_actor.points.InsertNextPoint(start_point[:3])
-                path_actor.colors.InsertNextTypedTuple(self.path_colors[line_type])
-
-                line = vtk.vtkLine()
-                line.GetPointIds().SetId(0, index)
-                line.GetPointIds().SetId(1, index + 1)
-
-                path_actor.lines.InsertNextCell(line)
-
-                index += 1
-
-            if end_point:
-                path_actor.points.InsertNextPoint(end_point[:3])
-                path_actor.colors.InsertNextTypedTuple(self.path_colors[last_line_type])
-
-                line = vtk.vtkLine()
-                line.GetPointIds().SetId(0, index - 1)
-                line.GetPointIds().SetId(1, index)
+            if partial:
+                path_actor.set_levels([
+                    (0.0, self.make_poly_data(points, types, lines, colors))])
+                continue
 
-                path_actor.lines.InsertNextCell(line)
+            # full resolution first, then the simplified levels of detail
+            path_actor.set_levels([
+                (0.0, self.make_poly_data(points, types, lines, colors))])
+            if len(types) >= lod.LOD_MIN_SEGMENTS:
+                path_actor.build_levels(points, types, lines,
+                    lambda p, t, l: self.make_poly_data(p, t, l, colors),
+                    updated)
 
             # free up memory, lots of it for big files
-
-            self.path_points[self.origin] = list()
-
-            path_actor.poly_data.SetPoints(path_actor.points)
-            path_actor.poly_data.SetLines(path_actor.lines)
-            path_actor.poly_data.GetCellData().SetScalars(path_actor.colors)
-            path_actor.data_mapper.SetInputData(path_actor.poly_data)
-            path_actor.data_mapper.Update()
-            path_actor.SetMapper(path_actor.data_mapper)
+            data.clear()
 
     def get_path_actors(self):
         return self.path_actors
 
+    def get_preview_state(self):
+        return dict(paths=[(origin, data.arrays() + data.rates())
+                           for origin, data in self.path_points.items()],
+                    dwell_time=self.dwell_time, dwell_times=self.dwell_times,
+                    linecount=self.linecount)
+
+    def set_preview_state(self, state):
+        self.path_actors.clear()
+        self.path_points.clear()
+        for origin, arrays in state['paths']:
+            self.path_actors[origin] = PathActor()
+            self.path_points[origin] = base_canon.PathBuffer(len(arrays[1]) or 1)
+            self.path_points[origin].extend(*arrays)
+        self.dwell_time = state['dwell_time']
+        self.dwell_times = state['dwell_times']
+        self.linecount = state['linecount']
+
+    def get_program(self):
+        """Segments of all the origins packed for the run time estimate."""
+        buffers = list(self.path_points.values())
+        points, types, lines, feeds, tools, sequence = [
+            numpy.concatenate(arrays) for arrays in
+            zip(*[data.arrays() + data.rates() for data in buffers])]
+        return runtime.pack_segments(points, types, lines, feeds, tools,
+            sequence, base_canon.LINE_CODES, self.dwell_time, self.dwell_times)
+
+    def get_extents(self):
+        """Min and max xyz of the program in canon units."""
+        points = numpy.concatenate([data.arrays()[0] for data in
+                                    self.path_points.values()]).reshape(-1, 3)
+        if not len(points):
+            return None
+        return points.min(axis=0), points.max(axis=0)
+
 
 class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
     def __init__(self, parent=None):
@@ -345,6 +446,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
 
         self.renderer = vtk.vtkRenderer()
         self.renderer.SetActiveCamera(self.camera)
+        self.renderer.AddObserver("StartEvent", self.update_lod)
 
         self.renderer_window = self.GetRenderWindow()
         self.renderer_window.AddRenderer(self.renderer)
@@ -368,9 +470,22 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         transform.RotateZ(self.rotation_offset)
         self.axes_actor.SetUserTransform(transform)
 
-        self.path_cache = PathCache(self.tooltip_position)
+        self.live_plot_points = int(INI.find("VTK", "LIVE_PLOT_POINTS") or 20000)
+        self.live_plot_tolerance = float(INI.find("VTK", "LIVE_PLOT_TOLERANCE") or
+            (0.01 if INFO.machine_is_metric else 0.0005))
+
+        self.path_cache = PathCache(self.tooltip_position,
+            self.live_plot_points, self.live_plot_tolerance)
         self.path_cache_actor = self.path_cache.get_actor()
 
+        # the scene is rendered on demand: update_render only marks it
+        # dirty, all requests within one interval give a single render
+        self.render_dirty = False
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.timeout.connect(self.render_now)
+        self.render_interval = int(INI.find("VTK", "RENDER_INTERVAL") or 16)
+
         if self.status.tool_table:
             self.tool = Tool(self.status.tool_table[0], self.status.tool_offset)
             self.tool_actor = self.tool.get_actor()
@@ -380,6 +495,8 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
 
         self.offset_axes = OrderedDict()
         self.extents = OrderedDict()
+        # path actors shown while a program is loaded
+        self.partial_actors = []
 
         self.canon = self.canon_class()
         self.path_actors = self.canon.get_path_actors()
@@ -449,6 +566,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
 
         self.line = None
         self._last_filename = str()
+        self.gcode_properties = None
 
         UPDATER.signal("file", self.load_program)
         UPDATER.signal("file_reload", self.reload_program)
@@ -462,9 +580,9 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         UPDATER.signal("tool_offset", self.update_tool)
         UPDATER.signal("tool_table", self.update_tool)
         UPDATER.signal("program_units", self.program_units)
-        UPDATER.signal(INFO.axes_list, lambda axis: self.update_dro(axis))
-        UPDATER.signal("update_feed_labels", 
-            lambda stat: self.update_dro(getattr(STAT,INFO.axes_list)))
+        for signal in (INFO.axes_list, "g5x_offset", "g92_offset", "tool_offset",
+                        "diameter_multiplier", "update_feed_labels"):
+            UPDATER.signal(signal, self.refresh_dro, coalesce=True)
         
         UPDATER.add("display_clear")
         UPDATER.add("display_view")
@@ -473,6 +591,8 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
 
         UPDATER.add("display_path")
         UPDATER.add("display_dimensions")
+        UPDATER.add("gcode_properties")
+        UPDATER.add("display_preview_cancel")
 
         UPDATER.signal("display_clear", lambda s: self.clearLivePlot())
         UPDATER.signal("display_view", lambda s: self.setCurrentView(s))
@@ -480,6 +600,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         UPDATER.signal("display_zoomout", lambda s: self.zoomOut())
         UPDATER.signal("display_path", lambda s: self.toggleLivePlotVisibility())
         UPDATER.signal("display_dimensions", lambda s: self.toggleProgramDimensions())
+        UPDATER.signal("display_preview_cancel", lambda s: self.cancel_load())
 
         # Add the observers to watch for particular events. These invoke
         # Python functions.
@@ -488,10 +609,9 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         self.zooming = 0
 
         self.pan_mode = False
-        
-        timer_viewer = QTimer(self)
-        timer_viewer.timeout.connect(self.update_render)
-        timer_viewer.start(float(INI.find("DISPLAY", "PATH_CYCLE_TIME") or '1.0')*1000)
+
+    def refresh_dro(self, data=None):
+        self.update_dro(getattr(STAT,INFO.axes_list))
 
     def update_dro(self, stat):
         if self.visibleRegion().isEmpty():
@@ -635,7 +755,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         camera.Elevation(lastY - y)
         camera.OrthogonalizeViewUp()
         camera.SetClippingRange(self.clipping_range_near, self.clipping_range_far)
-        self.renderer_window.Render()
+        self.update_render()
         # self.renderer.ResetCamera()
         self.interactor.ReInitialize()
 
@@ -679,7 +799,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         camera.SetPosition((FPoint0 - RPoint0) / 1.0 + PPoint0,
                            (FPoint1 - RPoint1) / 1.0 + PPoint1,
                            (FPoint2 - RPoint2) / 1.0 + PPoint2)
-        self.renderer_window.Render()
+        self.update_render()
 
     # Dolly converts y-motion into a camera dolly commands.
     def dolly(self, renderer, camera, x, y, lastX, lastY, centerX, centerY):
@@ -691,7 +811,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             camera.Dolly(dollyFactor)
             renderer.ResetCameraClippingRange()
 
-        self.renderer_window.Render()
+        self.update_render()
 
     # Wireframe sets the representation of all actors to wireframe.
     def wireframe(self):
@@ -702,7 +822,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             actor.GetProperty().SetRepresentationToWireframe()
             actor = actors.GetNextItem()
 
-        self.renderer_window.Render()
+        self.update_render()
 
     # Surface sets the representation of all actors to surface.
     def surface(self):
@@ -712,7 +832,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         while actor:
             actor.GetProperty().SetRepresentationToSurface()
             actor = actors.GetNextItem()
-        self.renderer_window.Render()
+        self.update_render()
 
     def tlo(self, tlo):
         printDebug(tlo)
@@ -730,32 +850,70 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             self.renderer.RemoveActor(axes)
             self.renderer.RemoveActor(actor)
             self.renderer.RemoveActor(extents)
+            actor.cancel_levels()
 
         self.path_actors.clear()
         self.offset_axes.clear()
         self.extents.clear()
+        self.remove_partial_actors()
 
         if fname:
             self.load(fname)
+        else:
+            self.load_finished()
+
+    def path_transform(self, origin):
+        index = self.origin_map[origin]
+        path_position = self.path_position_table[index - 1]
+
+        path_transform = vtk.vtkTransform()
+        path_transform.Translate(*path_position[:3])
+        path_transform.RotateWXYZ(*path_position[5:9])
+        return path_transform
+
+    def load_partial(self):
+        if self.canon is None:
+            return
+
+        self.canon.draw_lines(partial=True)
+
+        for origin, actor in self.canon.get_path_actors().items():
+            if actor not in self.partial_actors:
+                actor.SetUserTransform(self.path_transform(origin))
+                self.renderer.AddActor(actor)
+                self.partial_actors.append(actor)
+
+        # follow the program while it grows
+        self.renderer.ResetCamera()
+        self.update_render()
+
+    def remove_partial_actors(self):
+        for actor in self.partial_actors:
+            self.renderer.RemoveActor(actor)
+        del self.partial_actors[:]
+
+    def load_finished(self):
+        partial = bool(self.partial_actors)
+        self.remove_partial_actors()
 
         if self.canon is None:
+            self.gcode_properties = None
+            UPDATER.emit("gcode_properties", self.gcode_properties)
+            self.update_render()
             return
 
+        # before draw_lines, it frees the path points
+        self.calculate_gcode_properties()
+
         self.axes_actor = self.axes.get_actor()
         self.path_actors = self.canon.get_path_actors()
 
         self.renderer.AddActor(self.axes_actor)
-        self.canon.draw_lines()
+        self.canon.draw_lines(updated=self.update_render)
         
         for origin, actor in self.path_actors.items():
             axes = actor.get_axes()
-
-            index = self.origin_map[origin]
-            path_position = self.path_position_table[index - 1]
-
-            path_transform = vtk.vtkTransform()
-            path_transform.Translate(*path_position[:3])
-            path_transform.RotateWXYZ(*path_position[5:9])
+            path_transform = self.path_transform(origin)
 
             axes.SetUserTransform(path_transform)
             actor.SetUserTransform(path_transform)
@@ -770,8 +928,25 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             self.offset_axes[origin] = axes
             self.extents[origin] = extents_actor
 
+        if partial:
+            # the camera followed the partial program, fit the whole one
+            self.renderer.ResetCamera()
         self.update_render()
 
+    def calculate_gcode_properties(self):
+        try:
+            lines = self.canon.linecount
+            if lines is None:
+                lines = count_lines(self.last_filename)
+            self.gcode_properties = runtime.gcode_properties(
+                self.canon.get_program(), self.last_filename, lines, INI,
+                INFO.coordinates, STAT.linear_units, INFO.machine_is_metric,
+                INFO.max_feed_override, self.canon.get_extents())
+        except Exception as e:
+            printError(_("3D plot, failed to calculate program properties: {}", e))
+            self.gcode_properties = None
+        UPDATER.emit("gcode_properties", self.gcode_properties)
+
     def update_position(self, position):
         self.spindle_position = position[:3]
         self.spindle_rotation = position[3:6]
@@ -792,7 +967,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         # self.tool_actor.SetPosition(self.spindle_position)
         self.path_cache.add_line_point(self.tooltip_position)
 
-        #self.update_render()
+        self.update_render()
 
     def on_offset_table_changed(self, table):
         self.path_position_table = table
@@ -936,11 +1111,34 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
         self.renderer.AddActor(self.tool_actor)
         self.update_render()
 
+    # Pick the path level of detail from the world size of one pixel
+    def update_lod(self, obj=None, event=None):
+        height = self.renderer.GetSize()[1] or 1
+        if self.camera.GetParallelProjection():
+            view_height = 2.0 * self.camera.GetParallelScale()
+        else:
+            view_height = 2.0 * self.camera.GetDistance() * math.tan(
+                math.radians(self.camera.GetViewAngle() / 2.0))
+        pixel_size = view_height / height
+        for actor in self.path_actors.values():
+            actor.select_level(pixel_size)
+
     def update_render(self):
-        if self.visibleRegion().isEmpty():
+        self.render_dirty = True
+        if not self.render_timer.isActive():
+            self.render_timer.start(self.render_interval)
+
+    def render_now(self):
+        # a hidden viewer stays dirty, it is painted when shown again
+        if not self.render_dirty or self.visibleRegion().isEmpty():
             return
+        self.render_dirty = False
         self.GetRenderWindow().Render()
 
+    def paintEvent(self, event):
+        self.render_dirty = False
+        super(PathViewer, self).paintEvent(event)
+
     def setViewOrtho(self):
         self.camera.ParallelProjectionOn()
         # self.renderer.ResetCamera()
@@ -1039,14 +1237,15 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
 
     def clearLivePlot(self):
         self.renderer.RemoveActor(self.path_cache_actor)
-        self.path_cache = PathCache(self.tooltip_position)
+        self.path_cache = PathCache(self.tooltip_position,
+            self.live_plot_points, self.live_plot_tolerance)
         self.path_cache_actor = self.path_cache.get_actor()
         self.renderer.AddActor(self.path_cache_actor)
         self.update_render()
 
     def toggleLivePlotVisibility(self):
         self.path_cache_actor.SetVisibility(not self.path_cache_actor.GetVisibility())
-	self.update_render()
+        self.update_render()
 
     def enable_panning(self, enabled):
         self.pan_mode = enabled
@@ -1060,7 +1259,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             self.renderer.ResetCameraClippingRange()
             camera.Zoom(0.9)
 
-        self.renderer_window.Render()
+        self.update_render()
 
     def zoomOut(self):
         camera = self.camera
@@ -1071,7 +1270,7 @@ class PathViewer(QVTKRenderWindowInteractor,base_backplot.BaseBackPlot):
             self.renderer.ResetCameraClippingRange()
             camera.Zoom(1.1)
 
-        self.renderer_window.Render()
+        self.update_render()
 
     def alphaBlend(self, alpha):
         printDebug('TODO:alpha blend')
@@ -1286,17 +1485,38 @@ class PathBoundaries:
 
 
 class PathCache:
-    def __init__(self, current_position):
-        self.current_position = current_position
-        self.index = 0
-        self.num_points = 2
+    """Live plot of the tool tip trail.
+
+    The trail is a ring of 'capacity' points, when it is full the oldest
+    point is dropped. Every point is stored twice, at i and i + capacity,
+    so the trail is always one contiguous slice of the buffer and VTK
+    uses it without a copy.
+
+    Points closer than 'tolerance' to the last one are skipped. The last
+    point of the trail is moved to the new one as long as every point it
+    replaced since the previous kept point (the anchor) stays within
+    'tolerance' of the anchor-new point segment, so the error of the
+    simplified trail is bounded along curves too. At most 'run' points
+    are checked, a longer run is closed by keeping its last point.
+    """
+    def __init__(self, current_position, capacity=20000, tolerance=0.01,
+                 run=1024):
+        self.capacity = max(capacity, 4)
+        self.tolerance = tolerance
+        self.start = 0
+        self.count = 0
+        self.shown = -1
+
+        self.buffer = numpy.zeros((2 * self.capacity, 3), dtype=numpy.float64)
+        self.cells = numpy.arange(-1, self.capacity, dtype=numpy.int64)
+        self.offsets = numpy.zeros(2, dtype=numpy.int64)
+
+        # points replaced since the anchor
+        self.run = numpy.zeros((max(run, 1), 3), dtype=numpy.float64)
+        self.run_count = 0
 
         self.points = vtk.vtkPoints()
-        self.points.InsertNextPoint(current_position)
-
         self.lines = vtk.vtkCellArray()
-        self.lines.InsertNextCell(1)  # number of points
-        self.lines.InsertCellPoint(0)
 
         self.lines_poligon_data = vtk.vtkPolyData()
         self.polygon_mapper = vtk.vtkPolyDataMapper()
@@ -1306,22 +1526,81 @@ class PathCache:
         self.actor.GetProperty().SetOpacity(0.5)
         self.actor.SetMapper(self.polygon_mapper)
 
-        self.lines_poligon_data.SetPoints(self.points)
-        self.lines_poligon_data.SetLines(self.lines)
+        self.add_line_point(current_position)
 
         self.polygon_mapper.SetInputData(self.lines_poligon_data)
         self.polygon_mapper.Update()
 
+    @property
+    def trail(self):
+        return self.buffer[self.start:self.start + self.count]
+
     def add_line_point(self, point):
-        self.index += 1
+        point = numpy.asarray(point[:3], dtype=numpy.float64)
+        n = self.count
+        tip = self.start + n - 1
 
-        self.points.InsertNextPoint(point)
-        self.points.Modified()
+        if n:
+            d = point - self.buffer[tip]
+            if numpy.dot(d, d) < self.tolerance ** 2:
+                return
 
-        self.lines.InsertNextCell(self.num_points)
-        self.lines.InsertCellPoint(self.index - 1)
-        self.lines.InsertCellPoint(self.index)
-        self.lines.Modified()
+        if (n >= 2 and self.run_count < len(self.run)
+                and self.within(self.buffer[tip - 1], point, tip)):
+            self.run[self.run_count] = self.buffer[tip]
+            self.run_count += 1
+            self.store(tip, point)
+        else:
+            if n == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+                n -= 1
+            self.store(self.start + n, point)
+            self.count = n + 1
+            self.run_count = 0
+
+        self.update()
+
+    def within(self, anchor, point, tip):
+        # the tip and every point it replaced against the anchor-point segment
+        checked = numpy.vstack((self.run[:self.run_count], self.buffer[tip]))
+        ap = point - anchor
+        length = numpy.dot(ap, ap)
+        if length == 0:
+            return False
+        t = numpy.clip(numpy.dot(checked - anchor, ap) / length, 0, 1)
+        d = checked - (anchor + t[:, None] * ap)
+        return numpy.einsum('ij,ij->i', d, d).max() < self.tolerance ** 2
+
+    def store(self, index, point):
+        index %= self.capacity
+        self.buffer[index] = point
+        self.buffer[index + self.capacity] = point
+
+    def update(self):
+        n = self.count
+
+        # the points are a view of the ring, VTK reads the buffer in place
+        self.points.SetData(numpy_support.numpy_to_vtk(self.trail, deep=False))
+
+        # single polyline cell of n points, rebuilt only when n changes
+        if n != self.shown:
+            self.shown = n
+            if hasattr(self.lines, "SetOffsetsArray"):
+                self.offsets[1] = n
+                self.lines.SetData(
+                    numpy_support.numpy_to_vtk(self.offsets, deep=False,
+                        array_type=vtk.VTK_ID_TYPE),
+                    numpy_support.numpy_to_vtk(self.cells[1:n + 1], deep=False,
+                        array_type=vtk.VTK_ID_TYPE))
+            else:
+                # legacy layout: [n, 0, 1, ... n-1]
+                self.cells[0] = n
+                self.lines.SetCells(1, numpy_support.numpy_to_vtkIdTypeArray(
+                    self.cells[:n + 1], deep=False))
+
+        self.lines_poligon_data.SetPoints(self.points)
+        self.lines_poligon_data.SetLines(self.lines)
+        self.lines_poligon_data.Modified()
 
     def get_actor(self):
         return self.actor
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - profiler widget
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+__all__ = ['ProfilerWidget']
+
+from alterx.common.locale import _
+from alterx.common.compat import *
+from alterx.common import *
+
+from alterx.gui.util import *
+from alterx.core.profiler import PROFILER
+
+class ProfilerWidget(QWidget):
+    def __init__(self, parent=None):
+        QWidget.__init__(self, parent)
+
+        layout = QVBoxLayout()
+
+        label = QLabel(_("Profiler"))
+        label.setObjectName("lbl_settings_profiler")
+        layout.addWidget(label)
+
+        self.ticks = QLabel()
+        self.ticks.setObjectName("lbl_settings_profiler_ticks")
+        layout.addWidget(self.ticks)
+
+        self.tree = QTreeWidget()
+        self.tree.setObjectName("tree_profiler_widget")
+        self.tree.setRootIsDecorated(False)
+        self.tree.setHeaderLabels([_("Signal"),_("Handler"),_("Calls"),
+                                    _("Total, ms"),_("Max, ms")])
+
+        header = self.tree.header()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(1,QHeaderView.Stretch)
+        layout.addWidget(self.tree)
+
+        self.resetButton = QPushButton()
+        self.resetButton.setText(_("Reset"))
+        self.resetButton.clicked.connect(self.on_resetButton_clicked)
+        layout.addWidget(self.resetButton)
+
+        self.setLayout(layout)
+
+        timer = QTimer(self)
+        timer.timeout.connect(self.update_tree)
+        timer.start(1000)
+
+    def on_resetButton_clicked(self):
+        PROFILER.reset()
+        self.tree.clear()
+        self.update_tree()
+
+    def update_tree(self):
+        if self.tree.visibleRegion().isEmpty():
+            return
+
+        calls, total, maximum = PROFILER.ticks
+        self.ticks.setText(_("Ticks: {} Mean: {:.3f} ms Max: {:.3f} ms Overruns: {}",
+            calls, total/calls*1000 if calls else 0.0, maximum*1000, PROFILER.overruns))
+
+        rows = PROFILER.stats()
+        parent = self.tree.invisibleRootItem()
+        for i in reversed(range(len(rows), parent.childCount())):
+            parent.removeChild(parent.child(i))
+
+        for i, (name, handler, calls, total, maximum) in enumerate(rows):
+            child = parent.child(i)
+            if not child:
+                child = QTreeWidgetItem(parent)
+            for column, text in enumerate((name, handler, "{}".format(calls), 
+                    "{:.3f}".format(total*1000), "{:.3f}".format(maximum*1000))):
+                if child.text(column) != text:
+                    child.setText(column, text)
@@ -35,6 +35,7 @@ from alterx.gui.hal_editor import *
 from alterx.gui.halpin_viewer import *
 from alterx.gui.style_editor import *
 from alterx.gui.status_viewer import *
+from alterx.gui.profiler_viewer import *
 from alterx.gui.awlsim_widget import *
 from alterx.gui.unlock_widget import *
 
@@ -45,6 +46,7 @@ class SettingsWidget(QStackedWidget):
         
         self.addWidget(UnlockWidget(self))
         self.addWidget(StatusWidget())
+        self.addWidget(ProfilerWidget())
         self.addWidget(HalPinWidget())
         self.addWidget(ConfigEditor())
         self.addWidget(HalEditor())
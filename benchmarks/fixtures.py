@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - benchmark fixtures
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import math
+import os
+
+
+# Minimal INI for the benchmark session, read through alterx Config
+INI_TEXT = """[EMC]
+MACHINE = benchmark
+
+[DISPLAY]
+CYCLE_TIME = 0.1
+FAST_CYCLE_TIME = 0.04
+SLOW_CYCLE_TIME = 1.0
+POSITION_FEEDBACK = ACTUAL
+PATH_VIEWER = VTK
+
+[RS274NGC]
+PARAMETER_FILE = {dir}/bench.var
+
+[TRAJ]
+COORDINATES = X Y Z
+AXES = 3
+LINEAR_UNITS = mm
+ANGULAR_UNITS = degree
+MAX_FEED_OVERRIDE = 1.2
+
+[EMCIO]
+TOOL_TABLE = {dir}/tool.tbl
+"""
+
+
+# Synthetic machine status: a 3 axis machine running a circular program
+class synthetic_stat():
+    def __init__(self, joints=3, tools=50):
+        self.n = 0
+        self.joints = joints
+        self.tool_table = tuple((i, 0.0, 0.0, 3.0 + i * 0.5, 0.0, 0.0, 0)
+                                    for i in range(tools))
+        self.g5x_offset = (10.0, 20.0, -5.0) + (0.0,)*6
+        self.g92_offset = (0.0,)*9
+        self.tool_offset = (0.0, 0.0, 25.0) + (0.0,)*6
+        self.task_state = 4
+        self.task_mode = 2
+        self.interp_state = 2
+        self.program_units = 2
+        self.file = "/tmp/benchmark.ngc"
+        self.gcodes = (0, 800, 0, 170, 400, 210, 900, 940, 540, 490, 990, 640, -1, 80, 970, 911, 80)
+        self.mcodes = (0, -1, 5, -1, 9, -1, 48, -1, 53, -1)
+        self.homed = (1,)*joints + (0,)*(9 - joints)
+        self.feedrate = 1.0
+        self.rapidrate = 1.0
+        self.poll()
+
+    def poll(self):
+        self.n += 1
+        a = self.n * 0.01
+        position = (50.0 * math.cos(a), 50.0 * math.sin(a), -1.0) + (0.0,)*6
+        self.position = position
+        self.actual_position = position
+        self.joint_position = position
+        self.joint_actual_position = position
+        self.motion_line = self.n // 10
+        self.current_vel = 25.0
+        self.joint = tuple({'input': position[i], 'output': position[i] + 0.001,
+                            'homed': 1, 'ferror_current': 0.001, 'velocity': 25.0}
+                            for i in range(self.joints))
+        self.axis = self.joint
+
+    def fields(self):
+        return dict((k, v) for k, v in vars(self).items() 
+                        if k not in ('n', 'joints'))
+
+
+def write_fixture(path, frames=1000):
+    from alterx.core.recorder import StatRecorder
+
+    recorder = StatRecorder(os.path.join(path, "bench.axs"))
+    stat = synthetic_stat()
+    for i in range(frames):
+        stat.poll()
+        recorder.write(stat.fields(), i * 0.04)
+    recorder.close()
+
+    with open(os.path.join(path, "bench.ini"), "w") as f:
+        f.write(INI_TEXT.format(dir=path))
+
+    with open(os.path.join(path, "bench.var"), "w") as f:
+        for i in range(5161, 5400):
+            f.write("{}\t{:.6f}\n".format(i, 0.0))
+
+    return os.path.join(path, "bench.axs"), os.path.join(path, "bench.ini")
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#
+# AlterX GUI - headless benchmarks
+#
+# Copyright 2020-2020 uncle-yura uncle-yura@tuta.io
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+# Usage:
+#   python benchmarks/run.py [-o results.json] [-c baseline.json]
+#
+# Runs the GUI update pipeline under QT_QPA_PLATFORM=offscreen against
+# a synthetic recorded status stream, no LinuxCNC is required.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fixtures import write_fixture
+
+WORK_DIR = tempfile.mkdtemp(prefix="alterx-bench-")
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["ALTERX_STAT_REPLAY"] = os.path.join(WORK_DIR, "bench.axs")
+os.environ["ALTERX_STAT_REPLAY_SPEED"] = "0"
+os.environ["INI_FILE_NAME"] = os.path.join(WORK_DIR, "bench.ini")
+os.chdir(WORK_DIR)
+
+write_fixture(WORK_DIR)
+
+from alterx.gui.util import *
+
+QAPP = QApplication(sys.argv)
+
+from alterx.common import *
+from alterx.core.linuxcnc import *
+from alterx.core import linuxcnc
+
+
+def measure(func, iterations, repeat=3):
+    best = min(timeit.repeat(func, number=iterations, repeat=repeat))
+    return {
+        "iterations": iterations,
+        "total_s": best,
+        "per_op_us": best / iterations * 1e6,
+        "ops_per_s": iterations / best if best else 0.0,
+    }
+
+
+def tick():
+    linuxcnc.ACQUIRE.acquire()
+    UPDATER.run()
+
+
+def bench_updater(subscribers):
+    fields = ["joint", "position", "g5x_offset", "tool_offset",
+              "current_vel", "motion_line", "task_mode", "gcodes"]
+    # Fresh registry for every subscriber count
+    UPDATER.reset()
+    for i in range(subscribers):
+        UPDATER.signal(fields[i % len(fields)], lambda value: None)
+    return measure(tick, 200)
+
+
+def bench_dro():
+    from alterx.gui.dro_viewer import DROWidget
+
+    widget = DROWidget()
+    widget.resize(800, 600)
+    widget.show()
+    QAPP.processEvents()
+
+    layouts = [widget.layout().itemAt(i).layout() 
+                for i in range(widget.layout().count())]
+    layouts = [l for l in layouts if hasattr(l, "refresh")]
+
+    def run():
+        linuxcnc.ACQUIRE.acquire()
+        STAT.poll()
+        for l in layouts:
+            l.refresh()
+
+    result = measure(run, 500)
+    widget.close()
+    return result
+
+
+def bench_status_tree():
+    from alterx.gui.status_viewer import StatusWidget
+
+    widget = StatusWidget()
+    widget.resize(800, 600)
+    widget.show()
+    QAPP.processEvents()
+
+    def run():
+        linuxcnc.ACQUIRE.acquire()
+        STAT.poll()
+        widget.update_tree()
+
+    result = measure(run, 50)
+    widget.close()
+    return result
+
+
+def bench_notify():
+    def run():
+        Notify.Info("Benchmark message")
+        Notify.closeAll()
+        QAPP.processEvents()
+
+    return measure(run, 20)
+
+
+BENCHMARKS = [
+    ("updater.run.subscribers_10", lambda: bench_updater(10)),
+    ("updater.run.subscribers_100", lambda: bench_updater(100)),
+    ("updater.run.subscribers_1000", lambda: bench_updater(1000)),
+    ("dro.refresh", bench_dro),
+    ("status.update_tree", bench_status_tree),
+    ("notify.create", bench_notify),
+]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], 
+            cwd=ROOT).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(baseline, results):
+    print("{:<32} {:>14} {:>14} {:>9}".format(
+        "benchmark", "baseline us", "current us", "change"))
+    for name, value in sorted(results.items()):
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            print("{:<32} {:>14} {:>14.2f} {:>9}".format(
+                name, "-", value["per_op_us"], "new"))
+            continue
+        change = (value["per_op_us"] / old["per_op_us"] - 1.0) * 100
+        print("{:<32} {:>14.2f} {:>14.2f} {:>+8.1f}%".format(
+            name, old["per_op_us"], value["per_op_us"], change))
+
+
+def main():
+    (opts, args) = getopt.getopt(sys.argv[1:], "o:c:", ["output=", "compare="])
+    output = None
+    baseline = None
+    for (o, v) in opts:
+        if o in ("-o", "--output"):
+            output = v
+        if o in ("-c", "--compare"):
+            with open(v) as f:
+                baseline = json.load(f)
+
+    results = {}
+    for name, bench in BENCHMARKS:
+        try:
+            results[name] = bench()
+        except Exception as e:
+            printError("Benchmark {} failed: {}".format(name, e))
+            continue
+        print("{:<32} {:>12.2f} us/op".format(name, results[name]["per_op_us"]),
+            file=sys.stderr)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline:
+        compare(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,7 @@ MODULE_AUTHOR("uncle-yura (uncle-yura@tuta.io)");
 MODULE_DESCRIPTION("Oscilloscope for Alterx GUI");
 MODULE_LICENSE("GPL");
 
-static int port=27267,channels=4,samples=-1;
+static int port=27267,channels=4,samples=-1,roll=2;
 static long int thread=1000000;
 static int comp_id, shm_id;
 
@@ -44,6 +44,7 @@ RTAPI_MP_INT(port, "socket port");
 RTAPI_MP_INT(channels, "number of channels");
 RTAPI_MP_INT(samples, "number of samples");
 RTAPI_MP_INT(thread, "sample thread");
+RTAPI_MP_INT(roll, "roll ring length, seconds");
 
 int rtapi_app_main(void) 
 {
@@ -97,13 +98,21 @@ int rtapi_app_main(void)
 
     void *rptr;
 
+    //Roll ring size is a power of two, so head can wrap around freely.
+    //It has its own buffer after the capture samples
+    uint32_t values = (uint32_t)roll * (1000000000/thread) * channels;
+    uint32_t ring = 1;
+    while( (ring < values || ring < (uint32_t)channels) && ring < (1u << 24) )
+        ring *= 2;
+
     thread_arg_size_t size;
     size.channels = channels;
     size.samples = samples;
+    size.roll = ring;
 
     int struct_size = sizeof(thread_arg_t) + 
                         sizeof(channels_t)*size.channels + 
-                        sizeof(data_t)*size.samples;
+                        sizeof(data_t)*(size.samples + size.roll);
                                         
     shm_id = rtapi_shmem_new(SHMEM_KEY,comp_id,struct_size);
         
@@ -116,8 +125,10 @@ int rtapi_app_main(void)
 
     memset(args, 0, struct_size );
 
+    args->roll_mask = ring - 1;
+
     channel = rptr + sizeof(thread_arg_t);
-    data = channel + sizeof(channels_t) * size.channels;
+    data = (data_t *)(channel + size.channels);
 
     pthread_mutex_init(&args->mutex, NULL);
     pthread_mutex_lock(&args->mutex);
@@ -145,16 +156,13 @@ void connection_handler(void *args)
     
     size.channels = sp->channels;
     size.samples = sp->samples;
+    size.roll = sp->roll;
     
-    char sendBuff[128];
-    memset(sendBuff, 0, sizeof(sendBuff));
-
-    socket_req_t *arg;
     void *rptr;
     
     int shm_id = rtapi_shmem_new(SHMEM_KEY,0,sizeof(thread_arg_t) + 
                                             sizeof(channels_t) * size.channels + 
-                                            sizeof(data_t) * size.samples);
+                                            sizeof(data_t) * (size.samples + size.roll));
     if (shm_id < 0) return shm_id;
     
     int retval = rtapi_shmem_getptr(shm_id,&rptr);
@@ -162,252 +170,304 @@ void connection_handler(void *args)
     
     ta = rptr;
     ch = rptr + sizeof(thread_arg_t);
-    array = ch + sizeof(channels_t) * size.channels;
+    array = (data_t *)(ch + size.channels);
         
+    //Every client keeps its connection open and sends any number of
+    //requests, they are answered in order
+    int clients[MAX_CLIENTS];
+    for(int i=0; i<MAX_CLIENTS; i++)
+        clients[i] = -1;
+
+    reply_t reply;
+    memset(&reply, 0, sizeof(reply));
+
     struct timeval tv;
     fd_set readfds;
-    fd_set fds;
-    FD_ZERO(&fds);
-    FD_SET(listenfd, &fds);
     
     while( !need_quit(&ta->mutex))
     {
         tv.tv_sec = 1;
         tv.tv_usec = 0;
-        readfds = fds;
-        retval=select(listenfd+1,&readfds, NULL, NULL,&tv);
+        FD_ZERO(&readfds);
+        FD_SET(listenfd, &readfds);
+        int maxfd = listenfd;
+        for(int i=0; i<MAX_CLIENTS; i++)
+        {
+            if( clients[i] < 0 )
+                continue;
+            FD_SET(clients[i], &readfds);
+            if( clients[i] > maxfd )
+                maxfd = clients[i];
+        }
+
+        retval=select(maxfd+1,&readfds, NULL, NULL,&tv);
         if(retval == -1) 
         {
+            if( errno == EINTR )
+                continue;
             //Socket error
        	    rtapi_print_msg(RTAPI_MSG_ERR,"ASCOPE: ERROR: socket select error\n");
             break;
         } 
-        else if(retval) 
+        else if(retval == 0)
+            continue;
+
+        if( FD_ISSET(listenfd, &readfds) )
         {
-            //Data avaliable
+            //New client
             int connfd = accept(listenfd, (struct sockaddr*)NULL, NULL);
-            setsockopt(connfd,SOL_SOCKET,SO_RCVTIMEO,&tv,sizeof(tv));
-            //Read data
-            int read_size=recv(connfd,&(ta->request),sizeof(socket_req_t),NULL);
-            if( read_size != sizeof(socket_req_t))
+            int i;
+            for(i=0; i<MAX_CLIENTS && connfd >= 0; i++)
             {
-                rtapi_print_msg(RTAPI_MSG_ERR,
-                    "ASCOPE: ERROR: wrong packet size %d\n",
-                    read_size,sizeof(socket_req_t));
-                continue;
-            }
-            /*
-            rtapi_print_msg(RTAPI_MSG_ERR,"ASCOPE: DEBUG packet %X %X %X %X\n",
-                ta->request.control,
-                ta->request.cmd,
-                ta->request.type,
-                ta->request.value);
-            */
-                
-            if( ta->request.cmd != OSC_LIST && 
-                (int)ta->request.control.u != (int)hal_data)
-            {
-                rtapi_print_msg(RTAPI_MSG_ERR,
-                    "ASCOPE: ERROR: wrong control word %X!=%X\n",
-                    (int)ta->request.control.u, (int)hal_data);
-                continue;
-            }
-        
-            if( ta->request.cmd == OSC_STOP )
-            {
-                ta->trigger.cmd = SAMPLE_IDLE;
-                ta->pointer = 0;
-            }
-            else if( ta->request.cmd == OSC_LIST )
-            {
-                snprintf(sendBuff, sizeof(sendBuff), "CONTROL %X\n", hal_data);
-                write(connfd, sendBuff, strlen(sendBuff));
-                
-                if( ta->request.type == HAL_PIN )
-                {
-                    int next = hal_data->pin_list_ptr;  
-                    hal_pin_t *source;
-                    while(next != 0) 
-                    {
-                        source = SHMPTR(next);
-                        snprintf(sendBuff, sizeof(sendBuff), "%X %d %d %s\n",\
-                            next,source->type,source->dir,source->name);
-                        write(connfd, sendBuff, strlen(sendBuff));
-                        next = source->next_ptr; 
-                    }
-                }
-                else if( ta->request.type == HAL_SIG )
-                {
-                    int next = hal_data->sig_list_ptr; 
-                    hal_sig_t *source;
-                    while(next != 0) 
-                    {
-                        source = SHMPTR(next);
-                        snprintf(sendBuff, sizeof(sendBuff), "%X %d %s\n",\
-                            next,source->type,source->name);
-                        write(connfd, sendBuff, strlen(sendBuff));
-                        next = source->next_ptr; 
-                    }
-                }
-                else if( ta->request.type == HAL_PARAMETER )
-                {
-                    int next = hal_data->param_list_ptr; 
-                    hal_param_t *source;
-                    while(next != 0) 
-                    {
-                        source = SHMPTR(next);
-                        snprintf(sendBuff, sizeof(sendBuff), "%X %d %d %s\n",\
-                            next,source->type,source->dir,source->name);
-                        write(connfd, sendBuff, strlen(sendBuff));
-                        next = source->next_ptr; 
-                    }
-                }
-                else
+                if( clients[i] < 0 )
                 {
-                    rtapi_print_msg(RTAPI_MSG_ERR,
-                        "ASCOPE: ERROR: wrong packet type\n");
-                    continue;
-                }   
-            }
-            else if( ta->request.cmd == OSC_STATE )
-            {
-                char *value_str;
-                if( ta->request.type == HAL_PIN )
-                {
-                    hal_pin_t *source=SHMPTR(ta->request.value.u);
-                    if (source->signal == 0) 
-                        value_str = get_data_value(source->type, &(source->dummysig));
-                    else 
-                    {
-                        hal_sig_t *sig;
-                        sig = SHMPTR(source->signal);
-                        value_str = get_data_value(source->type, SHMPTR(sig->data_ptr));
-                    }
-                    snprintf(sendBuff, sizeof(sendBuff), "%s\n",value_str);
-                }
-                else if( ta->request.type == HAL_SIG )
-                {
-                    hal_sig_t *source=SHMPTR(ta->request.value.u);
-                    value_str = get_data_value(source->type, SHMPTR(source->data_ptr));
-                    snprintf(sendBuff, sizeof(sendBuff), "%s\n",value_str);
-                }
-                else if( ta->request.type == HAL_PARAMETER )
-                {
-                    hal_param_t *source = SHMPTR(ta->request.value.u);
-                    value_str = get_data_value(source->type, SHMPTR(source->data_ptr));
-                    snprintf(sendBuff, sizeof(sendBuff), "%s\n",value_str);
-                }
-                else
-                {
-                    rtapi_print_msg(RTAPI_MSG_ERR,
-                        "ASCOPE: ERROR: wrong packet type\n");
-                    continue;
-                }   
-                write(connfd, sendBuff, strlen(sendBuff));
-            }
-            else if( ta->request.cmd == OSC_CHANNEL )
-            {
-                if( ta->request.type/10 < size.channels )
-                {
-                    ch[ta->request.type/10].offset = ta->request.value.u;
-                    ch[ta->request.type/10].type = ta->request.type%10;
+                    tv.tv_sec = 1;
+                    tv.tv_usec = 0;
+                    setsockopt(connfd,SOL_SOCKET,SO_RCVTIMEO,&tv,sizeof(tv));
+                    clients[i] = connfd;
+                    break;
                 }
             }
-            else if( ta->request.cmd == OSC_TRIG )
+            if( connfd >= 0 && i == MAX_CLIENTS )
             {
-                ta->trigger.cmd = SAMPLE_IDLE;
-                ta->trigger.type = ta->request.type;
-                ta->trigger.pin = ta->request.value.u;
+                rtapi_print_msg(RTAPI_MSG_ERR,
+                    "ASCOPE: ERROR: too many clients\n");
+                close(connfd);
             }
-            else if( ta->request.cmd == OSC_DIV )
+        }
+
+        for(int i=0; i<MAX_CLIENTS; i++)
+        {
+            if( clients[i] < 0 || !FD_ISSET(clients[i], &readfds) )
+                continue;
+            if( serve_request(clients[i], ta, ch, array, size, &reply) < 0 )
             {
-                ta->trigger.sample_divider = ta->request.type;
-                ta->trigger.counter_divider = 0;
+                //Client closed the session or broke the protocol
+                close(clients[i]);
+                clients[i] = -1;
             }
-            else if( ta->request.cmd == OSC_RUN )
+        }
+    }
+
+    for(int i=0; i<MAX_CLIENTS; i++)
+    {
+        if( clients[i] >= 0 )
+            close(clients[i]);
+    }
+    free(reply.data);
+}
+
+/* Read one request frame, handle it and send the reply frame with the
+   same id. Returns -1 when the connection has to be closed */
+int serve_request(int connfd, thread_arg_t *ta, channels_t *ch,
+        data_t *array, thread_arg_size_t size, reply_t *reply)
+{
+    frame_header_t header;
+    static char data[sizeof(state_req_t) * MAX_STATES];
+
+    if( read_all(connfd, (char *)&header, sizeof(header)) < 0 )
+        return -1;
+    if( header.length < sizeof(socket_req_t) || 
+        header.length > sizeof(socket_req_t) + sizeof(data) )
+    {
+        rtapi_print_msg(RTAPI_MSG_ERR,
+            "ASCOPE: ERROR: wrong packet size %d\n", header.length);
+        return -1;
+    }
+    if( read_all(connfd, (char *)&(ta->request), sizeof(socket_req_t)) < 0 )
+        return -1;
+    size_t len = header.length - sizeof(socket_req_t);
+    if( read_all(connfd, data, len) < 0 )
+        return -1;
+
+    //The header goes in front of the reply, so it is sent in one write
+    reply->len = 0;
+    if( reply_reserve(reply, sizeof(header)) == NULL )
+        return -1;
+    handle_request(ta, ch, array, size, data, len, reply);
+
+    header.length = reply->len - sizeof(header);
+    memcpy(reply->data, &header, sizeof(header));
+    return write_all(connfd, reply->data, reply->len);
+}
+
+/* Handle ta->request and its len bytes of data, the answer is appended
+   to reply. Rejected requests get an empty reply */
+void handle_request(thread_arg_t *ta, channels_t *ch, data_t *array,
+        thread_arg_size_t size, const char *data, size_t len, reply_t *reply)
+{
+    if( ta->request.cmd != OSC_LIST && 
+        (int)ta->request.control.u != (int)hal_data)
+    {
+        rtapi_print_msg(RTAPI_MSG_ERR,
+            "ASCOPE: ERROR: wrong control word %X!=%X\n",
+            (int)ta->request.control.u, (int)hal_data);
+        return;
+    }
+
+    if( ta->request.cmd == OSC_STOP )
+    {
+        ta->trigger.cmd = SAMPLE_IDLE;
+        ta->pointer = 0;
+    }
+    else if( ta->request.cmd == OSC_LIST )
+    {
+        reply_printf(reply, "CONTROL %X\n", hal_data);
+
+        if( ta->request.type == HAL_PIN )
+        {
+            int next = hal_data->pin_list_ptr;  
+            hal_pin_t *source;
+            while(next != 0) 
             {
-                ta->pointer = 0;
-                
-                ta->trigger.value = ta->request.value.f;
-                
-                data_t l;
-                if( ta->trigger.type == HAL_PIN )
-                {
-                    hal_pin_t *source=SHMPTR( ta->trigger.pin );
-                    if (source->signal == 0) 
-                        set_data_value(source->type, &(source->dummysig),&l);
-                    else 
-                    {
-                        hal_sig_t *sig;
-                        sig = SHMPTR(source->signal);
-                        set_data_value(source->type, SHMPTR(sig->data_ptr),&l);
-                    }
-                }
-                else if( ta->trigger.type == HAL_SIG )
-                {
-                    hal_sig_t *source=SHMPTR( ta->trigger.pin );
-                    set_data_value(source->type, SHMPTR(source->data_ptr),&l);
-                }
-                else if( ta->trigger.type == HAL_PARAMETER )
-                {
-                    hal_param_t *source = SHMPTR( ta->trigger.pin );
-                    set_data_value(source->type, SHMPTR(source->data_ptr),&l);
-                }
-                
-                ta->trigger.last.value.u = l.value.u;
-                ta->trigger.cmd = ta->request.type;
+                source = SHMPTR(next);
+                reply_printf(reply, "%X %d %d %s\n",\
+                    next,source->type,source->dir,source->name);
+                next = source->next_ptr; 
             }
-            else if( ta->request.cmd == OSC_CHECK )
+        }
+        else if( ta->request.type == HAL_SIG )
+        {
+            int next = hal_data->sig_list_ptr; 
+            hal_sig_t *source;
+            while(next != 0) 
             {
-                snprintf(sendBuff, sizeof(sendBuff), "%d\n", ta->trigger.cmd);
-                write(connfd, sendBuff, strlen(sendBuff));
+                source = SHMPTR(next);
+                reply_printf(reply, "%X %d %s\n",\
+                    next,source->type,source->name);
+                next = source->next_ptr; 
             }
-            else if( ta->request.cmd == OSC_GET )
+        }
+        else if( ta->request.type == HAL_PARAMETER )
+        {
+            int next = hal_data->param_list_ptr; 
+            hal_param_t *source;
+            while(next != 0) 
             {
-            	snprintf(sendBuff, sizeof(sendBuff), "Samples %d thread %d\n",
-                	    ta->pointer, thread);
-                write(connfd, sendBuff, strlen(sendBuff));
-                
-                for(int i=0; i<ta->pointer;i++)
-                {
-                    switch (array[i].type) 
-                    {
-                        case HAL_BIT:
-                        	snprintf(sendBuff, sizeof(sendBuff), "%d %d\n",
-                        	    array[i].channel, array[i].value.b);
-	                    break;
-
-                        case HAL_FLOAT:
-                        	snprintf(sendBuff, sizeof(sendBuff), "%d %f\n",
-                        	    array[i].channel, array[i].value.f);
-                        break;
-                        
-                        case HAL_S32:
-                        	snprintf(sendBuff, sizeof(sendBuff), "%d %d\n",
-                        	    array[i].channel, array[i].value.s);
-                        break;
-                        
-                        case HAL_U32:
-                        	snprintf(sendBuff, sizeof(sendBuff), "%d %d\n",
-                        	    array[i].channel, array[i].value.u);
-                        break;
-                        
-                        default:
-                            /* Shouldn't get here, but just in case... */
-                        break;
-                    }
-                    write(connfd, sendBuff, strlen(sendBuff));
-                }
-                ta->pointer = 0;
+                source = SHMPTR(next);
+                reply_printf(reply, "%X %d %d %s\n",\
+                    next,source->type,source->dir,source->name);
+                next = source->next_ptr; 
             }
-            else
+        }
+        else
+        {
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: wrong packet type\n");
+            return;
+        }   
+    }
+    else if( ta->request.cmd == OSC_STATE )
+    {
+        int type;
+        void *valptr = get_object_ptr(ta->request.type, ta->request.value.u, &type);
+        if( valptr == NULL )
+        {
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: wrong packet type\n");
+            return;
+        }   
+        reply_printf(reply, "%s\n", get_data_value(type, valptr));
+    }
+    else if( ta->request.cmd == OSC_STATES )
+    {
+        if( ta->request.value.u > MAX_STATES ||
+            len != ta->request.value.u * sizeof(state_req_t) )
+        {
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: wrong states count %d\n", ta->request.value.u);
+            return;
+        }
+        if( pack_states(reply, (const state_req_t *)data, ta->request.value.u) < 0 )
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: states pack failed\n");
+    }
+    else if( ta->request.cmd == OSC_ROLL )
+    {
+        if( pack_roll(reply, ta, array + size.samples, ta->request.value.u, size.channels,
+                ta->trigger.sample_divider + 1) < 0 )
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: roll pack failed\n");
+    }
+    else if( ta->request.cmd == OSC_CHANNEL )
+    {
+        if( ta->request.type/10 < size.channels )
+        {
+            ch[ta->request.type/10].offset = ta->request.value.u;
+            ch[ta->request.type/10].type = ta->request.type%10;
+        }
+    }
+    else if( ta->request.cmd == OSC_TRIG )
+    {
+        ta->trigger.cmd = SAMPLE_IDLE;
+        ta->trigger.type = ta->request.type;
+        ta->trigger.pin = ta->request.value.u;
+    }
+    else if( ta->request.cmd == OSC_DIV )
+    {
+        ta->trigger.sample_divider = ta->request.type;
+        ta->trigger.counter_divider = 0;
+    }
+    else if( ta->request.cmd == OSC_RUN )
+    {
+        ta->pointer = 0;
+
+        if( ta->request.type == SAMPLE_ROLL )
+        {
+            //The new run starts at the head sample() has when it sees
+            //the reset, readers skip the values before it
+            ta->roll_reset++;
+            __sync_synchronize();
+            ta->trigger.cmd = SAMPLE_ROLL;
+            return;
+        }
+
+        ta->trigger.value = ta->request.value.f;
+
+        data_t l;
+        if( ta->trigger.type == HAL_PIN )
+        {
+            hal_pin_t *source=SHMPTR( ta->trigger.pin );
+            if (source->signal == 0) 
+                set_data_value(source->type, &(source->dummysig),&l);
+            else 
             {
-                //Wrong command
-                rtapi_print_msg(RTAPI_MSG_ERR,"ASCOPE: ERROR: socket wrong command\n");
-                continue;
+                hal_sig_t *sig;
+                sig = SHMPTR(source->signal);
+                set_data_value(source->type, SHMPTR(sig->data_ptr),&l);
             }
-            close(connfd);
         }
+        else if( ta->trigger.type == HAL_SIG )
+        {
+            hal_sig_t *source=SHMPTR( ta->trigger.pin );
+            set_data_value(source->type, SHMPTR(source->data_ptr),&l);
+        }
+        else if( ta->trigger.type == HAL_PARAMETER )
+        {
+            hal_param_t *source = SHMPTR( ta->trigger.pin );
+            set_data_value(source->type, SHMPTR(source->data_ptr),&l);
+        }
+
+        ta->trigger.last.value.u = l.value.u;
+        ta->trigger.cmd = ta->request.type;
+    }
+    else if( ta->request.cmd == OSC_CHECK )
+    {
+        reply_printf(reply, "%d\n", ta->trigger.cmd);
+    }
+    else if( ta->request.cmd == OSC_GET )
+    {
+        if( pack_capture(reply, array, ta->pointer, size.channels,
+                ta->trigger.sample_divider + 1) < 0 )
+            rtapi_print_msg(RTAPI_MSG_ERR,
+                "ASCOPE: ERROR: capture pack failed\n");
+        ta->pointer = 0;
+    }
+    else
+    {
+        //Wrong command
+        rtapi_print_msg(RTAPI_MSG_ERR,"ASCOPE: ERROR: socket wrong command\n");
+        return;
     }
 }
 
@@ -430,6 +490,37 @@ static void sample(void *arg, long period)
 		args->trigger.counter_divider = 0;
 	}
 
+    if( args->trigger.cmd == SAMPLE_ROLL )
+    {
+        uint32_t head = args->head;
+        uint32_t reset = args->roll_reset;
+        if( reset != args->roll_done )
+        {
+            args->roll_start = head;
+            __sync_synchronize();
+            args->roll_done = reset;
+        }
+
+        data_t *ring = data + samples;
+        for( int i=0; i < channels; i++ )
+        {
+            int type;
+            if( channel[i].offset == 0 )
+                continue;
+            void *valptr = get_object_ptr(channel[i].type, channel[i].offset, &type);
+            if( valptr == NULL )
+                continue;
+            data_t *d = ring + (head & args->roll_mask);
+            set_data_value(type, valptr, d);
+            d->channel = i;
+            head++;
+        }
+        //Publish the values before the new head
+        __sync_synchronize();
+        args->head = head;
+        return;
+    }
+
     if( args->pointer < samples && args->trigger.cmd == SAMPLE_RUN )
     {
         for( int i=0; i < channels; i++ )
@@ -651,6 +742,326 @@ static char *get_data_value(int type, void *valptr)
     return value_str;
 }
 
+static int value_size(int type)
+{
+    switch (type) 
+    {
+        case HAL_BIT: return sizeof(uint8_t);
+        case HAL_FLOAT: return sizeof(double);
+        case HAL_S32: return sizeof(int32_t);
+        case HAL_U32: return sizeof(uint32_t);
+        default: return 0;
+    }
+}
+
+int write_all(int fd, const char *buf, size_t len)
+{
+    while( len > 0 )
+    {
+        ssize_t n = write(fd, buf, len);
+        if( n < 0 )
+        {
+            if( errno == EINTR )
+                continue;
+            return -1;
+        }
+        buf += n;
+        len -= n;
+    }
+    return 0;
+}
+
+int read_all(int fd, char *buf, size_t len)
+{
+    while( len > 0 )
+    {
+        ssize_t n = recv(fd, buf, len, 0);
+        if( n < 0 && errno == EINTR )
+            continue;
+        if( n <= 0 )
+            return -1;
+        buf += n;
+        len -= n;
+    }
+    return 0;
+}
+
+/* Grow the reply by len bytes, returns a pointer to them */
+char *reply_reserve(reply_t *reply, size_t len)
+{
+    if( reply->len + len > reply->size )
+    {
+        size_t size = reply->size ? reply->size : 4096;
+        while( size < reply->len + len )
+            size *= 2;
+        char *data = realloc(reply->data, size);
+        if( data == NULL )
+            return NULL;
+        reply->data = data;
+        reply->size = size;
+    }
+    char *p = reply->data + reply->len;
+    reply->len += len;
+    return p;
+}
+
+int reply_printf(reply_t *reply, const char *fmt, ...)
+{
+    char buf[128];
+    va_list ap;
+
+    va_start(ap, fmt);
+    int len = vsnprintf(buf, sizeof(buf), fmt, ap);
+    va_end(ap);
+    if( len < 0 )
+        return -1;
+    if( len >= (int)sizeof(buf) )
+        len = sizeof(buf) - 1;
+
+    char *p = reply_reserve(reply, len);
+    if( p == NULL )
+        return -1;
+    memcpy(p, buf, len);
+    return 0;
+}
+
+/* Pointer to the value of a pin, signal or parameter and its type,
+   NULL for an unknown object type */
+void *get_object_ptr(int object, int offset, int *type)
+{
+    if( object == HAL_PIN )
+    {
+        hal_pin_t *source = SHMPTR(offset);
+        *type = source->type;
+        if (source->signal == 0) 
+            return &(source->dummysig);
+        hal_sig_t *sig = SHMPTR(source->signal);
+        return SHMPTR(sig->data_ptr);
+    }
+    else if( object == HAL_SIG )
+    {
+        hal_sig_t *source = SHMPTR(offset);
+        *type = source->type;
+        return SHMPTR(source->data_ptr);
+    }
+    else if( object == HAL_PARAMETER )
+    {
+        hal_param_t *source = SHMPTR(offset);
+        *type = source->type;
+        return SHMPTR(source->data_ptr);
+    }
+    return NULL;
+}
+
+/* One state_t per requested object */
+int pack_states(reply_t *reply, const state_req_t *states, int count)
+{
+    state_t *state = (state_t *)reply_reserve(reply, sizeof(state_t) * count);
+    if( state == NULL )
+        return -1;
+
+    for(int i=0; i<count; i++, state++)
+    {
+        state_t value;
+        int type = 0;
+        void *valptr = NULL;
+
+        memset(&value, 0, sizeof(value));
+        if( states[i].offset != 0 )
+            valptr = get_object_ptr(states[i].object, states[i].offset, &type);
+        if( valptr != NULL )
+        {
+            value.type = type;
+            switch (type) 
+            {
+                case HAL_BIT:
+                    value.value.i = *((hal_bit_t *) valptr) != 0;
+                break;
+                case HAL_FLOAT:
+                    value.value.f = *((hal_float_t *) valptr);
+                break;
+                case HAL_S32:
+                    value.value.i = *((hal_s32_t *) valptr);
+                break;
+                case HAL_U32:
+                    value.value.i = *((hal_u32_t *) valptr);
+                break;
+                default:
+                    value.type = 0;
+                break;
+            }
+        }
+        memcpy(state, &value, sizeof(value));
+    }
+    return 0;
+}
+
+/* Copy the ring from position up to head and pack it. Values the writer
+   may have overwritten while they were copied are dropped as lost. A
+   position of a previous run starts at the first value of the current
+   run, a position ahead of head (after a restart) at head */
+int pack_roll(reply_t *reply, thread_arg_t *ta, data_t *array, uint32_t position,
+        int channels, int divider)
+{
+    static data_t *copy = NULL;
+    uint32_t size = ta->roll_mask + 1;
+    roll_header_t header;
+
+    if( copy == NULL )
+    {
+        copy = malloc(sizeof(data_t) * size);
+        if( copy == NULL )
+            return -1;
+    }
+
+    //roll_done first, roll_start is the one of the last reset if done
+    int pending = ta->roll_done != ta->roll_reset;
+    __sync_synchronize();
+    uint32_t start = ta->roll_start;
+    uint32_t head = ta->head;
+    __sync_synchronize();
+
+    header.position = head;
+    header.lost = 0;
+    if( pending )
+    {
+        //sample() has not started the new run yet, nothing to send,
+        //the next request starts at roll_start
+        position = head;
+    }
+    else if( (int32_t)(head - position) < 0 )
+    {
+        //ahead of the ring, the component was restarted
+        position = head;
+    }
+    else if( (int32_t)(start - position) > 0 )
+    {
+        position = start;
+    }
+
+    if( head - position > size )
+    {
+        header.lost = head - position - size;
+        position = head - size;
+    }
+
+    uint32_t count = head - position;
+    for(uint32_t i=0; i<count; i++)
+        copy[i] = array[(position + i) & ta->roll_mask];
+    __sync_synchronize();
+
+    //The writer may be storing one frame of channels past its head
+    uint32_t safe = ta->head + channels - size;
+    uint32_t first = 0;
+    if( (int32_t)(safe - position) > 0 )
+    {
+        first = safe - position;
+        if( first > count )
+            first = count;
+        header.lost += first;
+    }
+
+    char *p = reply_reserve(reply, sizeof(header));
+    if( p == NULL )
+        return -1;
+    memcpy(p, &header, sizeof(header));
+    return pack_capture(reply, copy + first, count - first, channels, divider);
+}
+
+/* Pack the interleaved samples into one typed array per channel, after
+   the headers */
+int pack_capture(reply_t *reply, data_t *array, int count, int channels, int divider)
+{
+    channel_header_t ch[channels];
+    size_t offset[channels];
+    capture_header_t header;
+    int used = 0;
+
+    memset(ch, 0, sizeof(ch));
+    for(int i=0; i<count; i++)
+    {
+        int c = array[i].channel;
+        if( c >= channels )
+            continue;
+        if( ch[c].count == 0 )
+        {
+            ch[c].channel = c;
+            ch[c].type = array[i].type;
+        }
+        ch[c].count++;
+    }
+
+    size_t len = sizeof(capture_header_t);
+    for(int c=0; c<channels; c++)
+    {
+        if( ch[c].count == 0 )
+            continue;
+        len += sizeof(channel_header_t);
+        used++;
+    }
+    for(int c=0; c<channels; c++)
+    {
+        offset[c] = len;
+        len += (size_t)ch[c].count * value_size(ch[c].type);
+    }
+
+    char *buf = reply_reserve(reply, len);
+    if( buf == NULL )
+        return -1;
+
+    header.magic = CAPTURE_MAGIC;
+    header.samples = count;
+    header.channels = used;
+    header.divider = divider;
+    header.thread = thread;
+    memcpy(buf, &header, sizeof(header));
+
+    char *p = buf + sizeof(header);
+    for(int c=0; c<channels; c++)
+    {
+        if( ch[c].count == 0 )
+            continue;
+        memcpy(p, &ch[c], sizeof(channel_header_t));
+        p += sizeof(channel_header_t);
+    }
+
+    for(int i=0; i<count; i++)
+    {
+        int c = array[i].channel;
+        if( c >= channels || array[i].type != ch[c].type )
+            continue;
+        char *dst = buf + offset[c];
+        uint8_t b;
+        double f;
+        int32_t s;
+        uint32_t u;
+        switch (array[i].type) 
+        {
+            case HAL_BIT:
+                b = array[i].value.b;
+                memcpy(dst, &b, sizeof(b));
+            break;
+            case HAL_FLOAT:
+                f = array[i].value.f;
+                memcpy(dst, &f, sizeof(f));
+            break;
+            case HAL_S32:
+                s = array[i].value.s;
+                memcpy(dst, &s, sizeof(s));
+            break;
+            case HAL_U32:
+                u = array[i].value.u;
+                memcpy(dst, &u, sizeof(u));
+            break;
+            default:
+            break;
+        }
+        offset[c] += value_size(array[i].type);
+    }
+
+    return 0;
+}
+
 int need_quit(pthread_mutex_t *mtx)
 {
     switch(pthread_mutex_trylock(mtx)) 
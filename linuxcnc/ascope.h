@@ -28,6 +28,10 @@
 #include <rtapi_app.h>		/* RTAPI realtime module decls */
 #include <hal.h>		/* HAL public API decls */
 #include <stdio.h>	
+#include <stdlib.h>
+#include <stdarg.h>
+#include <errno.h>
+#include <unistd.h>
 #include <rtapi_string.h>
 #include <rtapi_stdint.h>
 
@@ -146,7 +150,9 @@ enum CMD {
     OSC_RUN,
     OSC_CHECK,
     OSC_GET,
-    OSC_DIV
+    OSC_DIV,
+    OSC_STATES,
+    OSC_ROLL
 };
 
 enum TRIG {
@@ -155,7 +161,8 @@ enum TRIG {
     SAMPLE_COMPLETE,
     SAMPLE_HIGH,
     SAMPLE_LOW,
-    SAMPLE_CHANGE
+    SAMPLE_CHANGE,
+    SAMPLE_ROLL
 };
 
 enum HAL_TYPE {
@@ -195,14 +202,91 @@ typedef struct {
 typedef struct {
     int channels;
     int samples;
+    int roll;			/* values in the roll ring */
 } thread_arg_size_t;
 
+/* OSC_GET reply: capture_header_t, one channel_header_t per channel,
+   then the values of every channel packed with its HAL type size
+   (bit - 1 byte, s32/u32 - 4 bytes, float - 8 bytes), in channel order */
+#define CAPTURE_MAGIC 0x31435341 /* "ASC1" */
+
+typedef struct {
+    uint32_t magic;
+    uint32_t samples;		/* samples of all channels */
+    uint32_t channels;		/* number of channel headers */
+    uint32_t divider;		/* sample divider */
+    int64_t thread;		/* thread period, ns */
+} __attribute__((packed)) capture_header_t;
+
+typedef struct {
+    uint32_t channel;
+    uint32_t type;		/* hal_type_t of the values */
+    uint32_t count;		/* number of values */
+} __attribute__((packed)) channel_header_t;
+
+/* OSC_STATES request: socket_req_t with the number of objects in value,
+   followed by one state_req_t per object. The reply is one state_t per
+   object, in the same order, type is 0 for an unknown object */
+#define MAX_STATES 1024
+
+typedef struct {
+    uint32_t object;		/* HAL_PIN, HAL_SIG or HAL_PARAMETER */
+    uint32_t offset;		/* object offset in HAL shared memory */
+} __attribute__((packed)) state_req_t;
+
+typedef struct {
+    uint32_t type;		/* hal_type_t of the value */
+    union {
+        double f;		/* HAL_FLOAT */
+        int64_t i;		/* HAL_BIT, HAL_S32, HAL_U32 */
+    } value;
+} __attribute__((packed)) state_t;
+
+/* OSC_ROLL request: socket_req_t with the ring position read so far in
+   value. The reply is a roll_header_t with the new position and the
+   number of values overwritten before they were read, followed by a
+   capture of the values written since the requested position. A
+   position from before the last OSC_RUN starts at the first value of
+   the current run, a position ahead of the ring at its head */
+typedef struct {
+    uint32_t position;
+    uint32_t lost;
+} __attribute__((packed)) roll_header_t;
+
+/* Session protocol: a client keeps its connection open and sends request
+   frames, a frame_header_t followed by a socket_req_t and its request
+   data, if any. Every request is answered in order with a frame_header_t
+   carrying the same id, followed by length bytes of reply, which may be
+   empty */
+#define MAX_CLIENTS 8
+
+typedef struct {
+    uint32_t length;		/* payload bytes after the header */
+    uint32_t id;		/* request id, echoed in the reply */
+} __attribute__((packed)) frame_header_t;
+
+typedef struct {
+    char *data;
+    size_t len;
+    size_t size;
+} reply_t;
+
 typedef struct {
     int init;
     pthread_mutex_t mutex;
     socket_req_t request;
     trigger_t trigger;
     int pointer;
+    /* SAMPLE_ROLL ring after the sample array, written by sample() only:
+       values are stored at head & roll_mask, then head is advanced */
+    volatile uint32_t head;
+    uint32_t roll_mask;
+    /* OSC_RUN counts roll_reset up, sample() moves roll_start to its
+       head and sets roll_done to roll_reset. Values before roll_start
+       belong to the previous run */
+    volatile uint32_t roll_reset;
+    volatile uint32_t roll_done;
+    volatile uint32_t roll_start;
 } thread_arg_t;
 
 extern char *hal_shmem_base;
@@ -211,4 +295,17 @@ void connection_handler(void *arg);
 static void sample(void *arg, long period);
 void set_data_value(int type, void *valptr, data_t *structptr);
 static char *get_data_value(int type, void *valptr);
+int serve_request(int connfd, thread_arg_t *ta, channels_t *ch,
+        data_t *array, thread_arg_size_t size, reply_t *reply);
+void handle_request(thread_arg_t *ta, channels_t *ch, data_t *array,
+        thread_arg_size_t size, const char *data, size_t len, reply_t *reply);
+void *get_object_ptr(int object, int offset, int *type);
+int pack_states(reply_t *reply, const state_req_t *states, int count);
+char *reply_reserve(reply_t *reply, size_t len);
+int reply_printf(reply_t *reply, const char *fmt, ...);
+int pack_capture(reply_t *reply, data_t *array, int count, int channels, int divider);
+int pack_roll(reply_t *reply, thread_arg_t *ta, data_t *array, uint32_t position,
+        int channels, int divider);
+int read_all(int fd, char *buf, size_t len);
+int write_all(int fd, const char *buf, size_t len);
 int need_quit(pthread_mutex_t *mtx);
@@ -10,6 +10,7 @@ from . import zoom_in
 from . import zoom_out
 from . import path
 from . import dimensions
+from . import cancel_load
 
 buttons_order = [
     'delete_view',
@@ -21,4 +22,5 @@ buttons_order = [
     'zoom_out',
     'path',
     'dimensions',
+    'cancel_load',
 ]
@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+# -*- coding:UTF-8 -*-
+
+from . import module
\ No newline at end of file